@@ -0,0 +1,188 @@
+"""
+bench_backup.py
+Measures the online backup of the SQLite database (`flask backup-db`, project.db.backup_database): how
+long each step holds the source, how many times concurrent writes restart the copy, and what a writer
+inserting chats meanwhile sees, for several step sizes and both journal modes.
+
+The benchmark:
+    1. Creates the schema with the real models (search index included) and seeds `--rows` chats of
+       about `--answer-chars` characters over `--users` users.
+    2. For every journal mode of `--journals` and every step size of `--pages` (-1 is one step):
+       - backs the database up with nothing else running ("idle");
+       - backs it up while a writer thread inserts a chat every `--write-interval` seconds on its own
+         connection, as a gunicorn worker would ("writer"), and records the latency of its commits.
+
+Reported per journal mode, step size and run (JSON):
+    pages (int): Pages of the database.
+    seconds (float): Duration of the backup.
+    steps (int), step_ms_p50, step_ms_p95, step_ms_max (float): Steps and how long each held the source.
+    restarts (int), single_step (bool): Restarts caused by the writer, and whether the rest was copied
+        in one step after `max_restarts` of them.
+    write_ms_p50, write_ms_p99, write_ms_max (float): Commit latency of the writer during the backup
+        ("writer" runs only).
+
+Usage:
+------
+    python -m benchmarks.bench_backup --rows 200000 --pages 64,256,1024,-1 --journals wal,delete
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from project import create_app
+from project.db import db, backup_database
+
+
+def seed(path, rows, users, answer_chars, rng):
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "RATELIMIT_ENABLED": False})
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+    conn = sqlite3.connect(path)
+    try:
+        start = datetime(2025, 1, 1)
+        conn.executemany("INSERT INTO user (id, username, password) VALUES (?, ?, 'x')",
+                         [(i, f"user{i}") for i in range(1, users + 1)])
+        conn.executemany("INSERT INTO conversations (id, user_id, title, created_at, last_activity, message_count) "
+                         "VALUES (?, ?, 'thread', ?, ?, 0)",
+                         [(i, i, start.isoformat(" "), start.isoformat(" ")) for i in range(1, users + 1)])
+        words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "theta", "kappa", "lambda", "sigma"]
+        statement = ("INSERT INTO chats (user_id, conversation_id, timestamp, prompt, response, raw_response) "
+                     "VALUES (?, ?, ?, ?, ?, ?)")
+        batch = []
+        for i in range(rows):
+            answer = " ".join(rng.choice(words) for _ in range(answer_chars // 6))
+            batch.append((i % users + 1, i % users + 1, (start + timedelta(seconds=i)).isoformat(" "),
+                          f"Prompt {i}?", f"<p>{answer}</p>", answer))
+            if len(batch) == 10_000:
+                conn.executemany(statement, batch)
+                batch.clear()
+        conn.executemany(statement, batch)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def percentile_ms(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(fraction * len(values) + 0.5) - 1))
+    return round(values[index] * 1000, 3)
+
+
+class Writer(threading.Thread):
+    # Inserts a chat every `interval` seconds on its own connection, like a worker of the app
+    def __init__(self, path, interval):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.latencies = []
+        self.stop = threading.Event()
+        self.ready = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA busy_timeout=30000")
+        i = 0
+        self.ready.set()
+        while not self.stop.is_set():
+            start = time.perf_counter()
+            conn.execute("INSERT INTO chats (user_id, conversation_id, timestamp, prompt, response) "
+                         "VALUES (1, 1, datetime('now'), ?, 'answer')", (f"written during the backup {i}",))
+            conn.commit()
+            self.latencies.append(time.perf_counter() - start)
+            i += 1
+            time.sleep(self.interval)
+        conn.close()
+
+
+def backup(path, pages, with_writer, write_interval):
+    fd, target = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    source = sqlite3.connect(path)
+    destination = sqlite3.connect(target)
+    writer = Writer(path, write_interval) if with_writer else None
+    try:
+        if writer:
+            writer.start()
+            writer.ready.wait()
+            time.sleep(0.1)
+        report = backup_database(source, destination, pages=pages, pause=0.005, max_restarts=3)
+    finally:
+        if writer:
+            writer.stop.set()
+            writer.join()
+        source.close()
+        destination.close()
+        os.unlink(target)
+
+    result = {
+        "run": "writer" if with_writer else "idle",
+        "pages": report["pages"],
+        "seconds": round(report["seconds"], 3),
+        "steps": len(report["steps"]),
+        "step_ms_p50": percentile_ms(report["steps"], 0.50),
+        "step_ms_p95": percentile_ms(report["steps"], 0.95),
+        "step_ms_max": percentile_ms(report["steps"], 1.0),
+        "restarts": report["restarts"],
+        "single_step": report["single_step"],
+    }
+    if writer:
+        result.update({
+            "writes": len(writer.latencies),
+            "write_ms_p50": percentile_ms(writer.latencies, 0.50),
+            "write_ms_p99": percentile_ms(writer.latencies, 0.99),
+            "write_ms_max": percentile_ms(writer.latencies, 1.0),
+        })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000, help="Chats in the database.")
+    parser.add_argument("--users", type=int, default=100, help="Users the chats are spread over.")
+    parser.add_argument("--answer-chars", type=int, default=600, help="Approximate length of every answer.")
+    parser.add_argument("--pages", default="64,256,1024,-1", help="Comma-separated pages per step.")
+    parser.add_argument("--journals", default="wal,delete", help="Comma-separated journal modes.")
+    parser.add_argument("--write-interval", type=float, default=0.01, help="Seconds between the writer's inserts.")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        seed(path, args.rows, args.users, args.answer_chars, random.Random(0))
+        seed_seconds = time.perf_counter() - start
+        results = []
+        for journal in args.journals.split(","):
+            conn = sqlite3.connect(path)
+            conn.execute(f"PRAGMA journal_mode={journal}")
+            conn.close()
+            for pages in (int(value) for value in args.pages.split(",")):
+                for with_writer in (False, True):
+                    result = {"journal": journal, "pages_per_step": pages,
+                              **backup(path, pages, with_writer, args.write_interval)}
+                    results.append(result)
+    finally:
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+    print(json.dumps({
+        "rows": args.rows,
+        "database_mb": round(results[0]["pages"] * 4096 / 2 ** 20, 1) if results else None,
+        "seed_seconds": round(seed_seconds, 2),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+bench_chat_index.py
+Seeds a SQLite database with a large `chats` table and checks that the history query of a
+thread is served by the (conversation_id, timestamp) index, and the thread list by the
+(user_id, last_activity) index.
+
+The benchmark:
+    1. Creates the schema with the real models and seeds `--rows` chats spread over `--users` users,
+       one thread per user.
+    2. Asserts, with EXPLAIN QUERY PLAN, that `Chat.history_page` (first page and cursor page),
+       `Conversation.for_user` and `User.find_by_username` search their indexes and never sort in a
+       temp b-tree.
+    3. Times the history page with the index, then again after dropping it.
+
+Usage:
+------
+    python -m benchmarks.bench_chat_index --rows 1000000 --users 1000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text
+
+from project import create_app
+from project.db import db
+from project.models import Chat, Conversation, User
+
+
+def seed(rows, users):
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO user (id, username, password) VALUES (?, ?, 'x')",
+                           [(i, f"user{i}") for i in range(1, users + 1)])
+        start = datetime(2025, 1, 1)
+        # Thread i belongs to user i, counters are filled in once the chats are in
+        cursor.executemany("INSERT INTO conversations (id, user_id, title, created_at, last_activity, message_count) "
+                           "VALUES (?, ?, 'thread', ?, ?, 0)",
+                           [(i, i, start.isoformat(" "), start.isoformat(" ")) for i in range(1, users + 1)])
+        statement = "INSERT INTO chats (user_id, conversation_id, timestamp, prompt, response) VALUES (?, ?, ?, ?, ?)"
+        batch = []
+        for i in range(rows):
+            batch.append((i % users + 1, i % users + 1, (start + timedelta(seconds=i)).isoformat(" "), f"prompt {i}",
+                          "<p>answer</p>"))
+            if len(batch) == 50_000:
+                cursor.executemany(statement, batch)
+                batch.clear()
+        cursor.executemany(statement, batch)
+        cursor.execute("UPDATE conversations SET "
+                       "message_count = (SELECT count(*) FROM chats WHERE conversation_id = conversations.id), "
+                       "last_activity = (SELECT max(timestamp) FROM chats WHERE conversation_id = conversations.id)")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def explain(fn):
+    plans = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        plans.append(" ".join(row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)))
+
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+    return plans[0]
+
+
+def time_history(conversation_id, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        db.session.expunge_all()
+        Chat.history_page(conversation_id, 20)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history index benchmark.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(db_fd)
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}"})
+    try:
+        with app.app_context():
+            db.create_all()
+            start = time.perf_counter()
+            seed(args.rows, args.users)
+            seed_seconds = time.perf_counter() - start
+            db.session.execute(text("ANALYZE"))
+
+            user_id = conversation_id = args.users // 2
+            first_page = Chat.history_page(conversation_id, 20)[0]
+            plans = {
+                "history_page": explain(lambda: Chat.history_page(conversation_id, 20)),
+                "history_cursor_page": explain(lambda: Chat.history_page(conversation_id, 20, before=(first_page[0].timestamp, first_page[0].id))),
+                "conversation_list": explain(lambda: Conversation.for_user(user_id, 50)),
+                "find_by_username": explain(lambda: User.find_by_username(f"user{user_id}")),
+            }
+            assert "USING INDEX ix_chats_conversation_id_timestamp" in plans["history_page"], plans
+            assert "USING INDEX ix_chats_conversation_id_timestamp" in plans["history_cursor_page"], plans
+            assert "USING INDEX ix_conversations_user_id_last_activity" in plans["conversation_list"], plans
+            assert "USING INDEX sqlite_autoindex_user_1" in plans["find_by_username"], plans
+            assert not any("TEMP B-TREE" in plan for plan in plans.values()), plans
+
+            indexed_ms = time_history(conversation_id)
+            db.session.execute(text("DROP INDEX ix_chats_conversation_id_timestamp"))
+            db.session.commit()
+            unindexed_ms = time_history(conversation_id, repeat=5)
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        os.unlink(db_path)
+
+    print(json.dumps({
+        "rows": args.rows,
+        "users": args.users,
+        "seed_seconds": round(seed_seconds, 2),
+        "query_plans": plans,
+        "history_page_ms_with_index": round(indexed_ms, 3),
+        "history_page_ms_without_index": round(unindexed_ms, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+bench_concurrency.py
+Measures how many slow chat completions a single gunicorn worker process can keep in
+flight, comparing the former `sync` worker class with the `gthread` worker configured in
+gunicorn.conf.py.
+
+For every worker class the benchmark:
+    1. Starts a fake LLM answering after `--latency` seconds.
+    2. Runs the real app under gunicorn with ONE worker process.
+    3. Fires `--concurrency` simultaneous POST /chat requests and, while they are in flight,
+       times a GET /login to show whether unrelated pages are stalled.
+
+Reported per worker class (JSON):
+    completed (int): /chat requests answered successfully.
+    wall_seconds (float): Time to answer all of them.
+    completions_per_second (float): completed / wall_seconds.
+    login_page_seconds (float): Latency of GET /login during the burst.
+
+Usage:
+------
+    python -m benchmarks.bench_concurrency --latency 1 --concurrency 200 --threads 200
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.harness import gunicorn_app, logged_in_session
+
+
+def run(worker_class, threads, concurrency, llm_url):
+    with gunicorn_app(llm_url, worker_class=worker_class, threads=threads) as base_url:
+        cookies = logged_in_session(base_url).cookies
+
+        def post_chat(i):
+            response = requests.post(f"{base_url}/chat", data={"prompt": f"prompt {i}"},
+                                     cookies=cookies, allow_redirects=False, timeout=600)
+            return response.status_code == 302
+
+        login_latency = {}
+
+        def probe_login():
+            time.sleep(0.2)  # Let the burst occupy the worker first
+            start = time.perf_counter()
+            requests.get(f"{base_url}/login", timeout=600)
+            login_latency["seconds"] = time.perf_counter() - start
+
+        probe = threading.Thread(target=probe_login)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            probe.start()
+            completed = sum(pool.map(post_chat, range(concurrency)))
+        wall = time.perf_counter() - start
+        probe.join()
+
+    return {
+        "worker_class": worker_class,
+        "threads": threads,
+        "concurrency": concurrency,
+        "completed": completed,
+        "wall_seconds": round(wall, 3),
+        "completions_per_second": round(completed / wall, 2),
+        "login_page_seconds": round(login_latency["seconds"], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake LLM latency in seconds.")
+    parser.add_argument("--concurrency", type=int, default=50, help="Simultaneous /chat requests.")
+    parser.add_argument("--threads", type=int, default=100, help="gthread threads for the 'after' run.")
+    args = parser.parse_args()
+
+    llm = FakeLLMServer(latency=args.latency).start()
+    try:
+        results = [
+            run("sync", 1, args.concurrency, llm.url),
+            run("gthread", args.threads, args.concurrency, llm.url),
+        ]
+    finally:
+        llm.stop()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+bench_export.py
+Measures the throughput and the memory of the chat history export and import (project.export) for
+growing tables, to check that memory stays flat whatever the number of rows.
+
+The benchmark, for every size of `--rows`:
+    1. Seeds a database with that many chats over `--users` users (one thread each), answers of
+       about `--answer-chars` characters.
+    2. Exports every user to a gzip NDJSON file (`flask export-chats`), then imports the file into
+       an empty database (`flask import-chats`), timing both.
+    3. Runs both again under tracemalloc and records the peak of the Python allocations.
+
+Reported per size (JSON):
+    rows (int): Chats exported and imported.
+    file_mb (float): Size of the export file.
+    export_rows_per_s, import_rows_per_s (float): Chats per second.
+    export_peak_mb, import_peak_mb (float): Peak of the Python allocations during the run.
+
+Usage:
+------
+    python -m benchmarks.bench_export --rows 100000,400000 --users 100
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from project import create_app
+from project.db import db
+from project.export import export_chunks, import_chats
+from project.models import User
+
+
+def seed(rows, users, answer_chars, rng):
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        start = datetime(2025, 1, 1)
+        cursor.executemany("INSERT INTO user (id, username, password) VALUES (?, ?, 'x')",
+                           [(i, f"user{i}") for i in range(1, users + 1)])
+        cursor.executemany("INSERT INTO conversations (id, user_id, title, created_at, last_activity, message_count) "
+                           "VALUES (?, ?, 'thread', ?, ?, 0)",
+                           [(i, i, start.isoformat(" "), start.isoformat(" ")) for i in range(1, users + 1)])
+        words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "theta", "kappa"]
+        statement = ("INSERT INTO chats (user_id, conversation_id, timestamp, prompt, response, raw_response) "
+                     "VALUES (?, ?, ?, ?, ?, ?)")
+        batch = []
+        for i in range(rows):
+            answer = " ".join(rng.choice(words) for _ in range(answer_chars // 6))
+            batch.append((i % users + 1, i % users + 1, (start + timedelta(seconds=i)).isoformat(" "),
+                          f"Prompt {i}?", f"<p>{answer}</p>", answer))
+            if len(batch) == 10_000:
+                cursor.executemany(statement, batch)
+                batch.clear()
+        cursor.executemany(statement, batch)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def export_to(path, batch_size):
+    with gzip.open(path, "wb", compresslevel=6) as f:
+        for _, _, data in export_chunks(None, batch_size):
+            f.write(data)
+
+
+def import_from(path, batch_size):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return import_chats(f, None, batch_size)
+
+
+def measured(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    db.session.remove()
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+    return elapsed, peak / 2 ** 20
+
+
+def database():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    return path
+
+
+def remove(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def run(rows, users, answer_chars, batch_size):
+    rng = random.Random(0)
+    source, target = database(), database()
+    fd, export_path = tempfile.mkstemp(suffix=".ndjson.gz")
+    os.close(fd)
+    try:
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{source}", "RATELIMIT_ENABLED": False})
+        with app.app_context():
+            db.create_all()
+            seed(rows, users, answer_chars, rng)
+            export_seconds, export_peak = measured(export_to, export_path, batch_size)
+            db.engine.dispose()
+
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{target}", "RATELIMIT_ENABLED": False})
+        with app.app_context():
+            db.create_all()
+            # The import finds its users by name, created without hashing a password each
+            db.session.execute(insert(User.__table__), [{"username": f"user{i}", "password": "x"}
+                                                        for i in range(1, users + 1)])
+            db.session.commit()
+            # Imported twice (timed, then traced): the second run appends the same rows again
+            import_seconds, import_peak = measured(import_from, export_path, batch_size)
+            db.engine.dispose()
+
+        return {
+            "rows": rows,
+            "file_mb": round(os.path.getsize(export_path) / 2 ** 20, 1),
+            "export_rows_per_s": round(rows / export_seconds),
+            "import_rows_per_s": round(rows / import_seconds),
+            "export_peak_mb": round(export_peak, 2),
+            "import_peak_mb": round(import_peak, 2),
+        }
+    finally:
+        remove(source)
+        remove(target)
+        os.unlink(export_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", default="100000,400000", help="Comma-separated numbers of chats.")
+    parser.add_argument("--users", type=int, default=100, help="Users the chats are spread over.")
+    parser.add_argument("--answer-chars", type=int, default=600, help="Approximate length of every answer.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per batch, as the commands' option.")
+    args = parser.parse_args()
+
+    results = [run(int(rows), args.users, args.answer_chars, args.batch_size) for rows in args.rows.split(",")]
+    print(json.dumps({"users": args.users, "batch_size": args.batch_size, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
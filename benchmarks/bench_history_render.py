@@ -0,0 +1,130 @@
+"""
+bench_history_render.py
+Measures the home page of a user with a long history rendered with and without the history fragment
+cache, and how soon the streamed page sends its first bytes.
+
+The benchmark:
+    1. Creates a database with one user and `--messages` chats (Markdown answers rendered once, as
+       /chat does) and sets CHAT_PAGE_SIZE to show them all on the home page.
+    2. "cold": clears the fragment cache before every view, so every card is rendered again, as the
+       template did before the cache.
+    3. "warm": keeps the cache, so every card is stitched from its stored HTML.
+    4. Times `--repeat` views of each through the test client, reading the streamed body chunk by
+       chunk: time to the first chunk and time to the whole page.
+
+Reported per mode (JSON):
+    page_ms (float): Median time to the whole page.
+    first_chunk_ms (float): Median time to the first chunk of the body.
+    page_bytes (int): Size of the page.
+
+Usage:
+------
+    python -m benchmarks.bench_history_render --messages 5000 --repeat 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from project import create_app
+from project.db import db
+from project.models import Chat, Conversation, User
+
+ANSWER = """Here is **an answer** with a list:
+
+- first item with `code`
+- second item with a [link](https://example.com)
+
+```python
+print("hello")
+```
+"""
+
+
+def seed(messages):
+    user = User()
+    user.username = "bench"
+    user.password = "bench-password"
+    db.session.add(user)
+    db.session.commit()
+
+    conversation_id = Conversation.start(user.id, "Benchmark thread").id
+    chat = Chat(user_id=user.id, prompt="seed")
+    chat.set_answer(ANSWER)
+    rows = [(user.id, conversation_id, f"History prompt {i} <with markup>", chat.response, chat.raw_response,
+             chat.render_version) for i in range(messages)]
+    conn = db.session.connection().connection
+    # Dated after the thread was started, so it stays the latest thread
+    conn.executemany("INSERT INTO chats (user_id, conversation_id, timestamp, prompt, response, raw_response, "
+                     "render_version) VALUES (?, ?, datetime('now', printf('+%d seconds', ?)), ?, ?, ?, ?)",
+                     [(*row[:2], i, *row[2:]) for i, row in enumerate(rows)])
+    db.session.commit()
+
+
+def view(client):
+    start = time.perf_counter()
+    response = client.get("/", buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks)
+    first_chunk = time.perf_counter() - start
+    size = len(first) + sum(len(chunk) for chunk in chunks)
+    response.close()
+    return time.perf_counter() - start, first_chunk, size
+
+
+def run(app, client, mode, repeat):
+    cache = app.extensions["fragment_cache"]
+    pages, firsts = [], []
+    view(client)  # Warms the template and, for "warm", the fragment cache
+    for _ in range(repeat):
+        if mode == "cold":
+            cache._entries.clear()
+        page, first, size = view(client)
+        pages.append(page)
+        firsts.append(first)
+    return {
+        "mode": mode,
+        "page_ms": round(statistics.median(pages) * 1000, 2),
+        "first_chunk_ms": round(statistics.median(firsts) * 1000, 2),
+        "page_bytes": size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=5000, help="Chats in the history.")
+    parser.add_argument("--repeat", type=int, default=20, help="Views timed per mode.")
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(db_fd)
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "WTF_CSRF_ENABLED": False,
+        "RATELIMIT_ENABLED": False,
+        "METRICS_ENABLED": False,
+        "CHAT_PAGE_SIZE": args.messages,
+        "CHAT_FRAGMENT_CACHE_SIZE": args.messages,
+    })
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(args.messages)
+            db.session.remove()
+
+        client = app.test_client()
+        client.post("/login", data={"username": "bench", "password": "bench-password"})
+        results = [run(app, client, mode, args.repeat) for mode in ("cold", "warm")]
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        os.unlink(db_path)
+
+    print(json.dumps({"messages": args.messages, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
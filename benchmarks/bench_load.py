@@ -0,0 +1,253 @@
+"""
+bench_load.py
+Load test of the real app under gunicorn against a local fake LLM, reporting throughput and latency
+percentiles per route at increasing concurrency, as JSON that can be compared across commits.
+
+The benchmark:
+    1. Starts a fake LLM (benchmarks.fake_llm) answering after `--latency` seconds at `--token-rate`
+       tokens per second, `--tokens` tokens per answer.
+    2. Runs the real app under gunicorn (`--workers` processes, `--threads` gthread threads each).
+    3. For every concurrency level of `--concurrency` and every scenario, runs that many clients in a
+       closed loop (each sends its next request once the previous one is answered) for `--duration`
+       seconds, after `--warmup` seconds whose requests are not counted.
+    4. Writes the results (and the commit they were measured on) to `--output`.
+
+Scenarios:
+    login: POST /login with valid credentials (password hash verification, session cookie).
+    home: GET / as a logged-in user (user loader, history page, template rendering).
+    chat: POST /chat with a new prompt each time (upstream call, answer rendering, chat insert).
+    The history the chat scenario creates is seen by the following runs of "home".
+
+Reported per concurrency and scenario (JSON):
+    requests (int): Requests answered with the expected status.
+    errors (int): Requests answered with another status or failing.
+    throughput (float): requests per second.
+    p50, p95, p99, max (float): Latency percentiles of the answered requests, in seconds.
+
+Comparing two result files:
+------
+    python -m benchmarks.bench_load compare before.json after.json --tolerance 0.1
+    Prints the throughput and p95 change of every measurement and exits with status 1 when one
+    regressed by more than the tolerance.
+
+Usage:
+------
+    python -m benchmarks.bench_load --workers 2 --threads 32 --concurrency 1,8,32,64 --duration 10 \
+        --latency 0.5 --token-rate 50 --tokens 100 --output bench-results.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.harness import ROOT, gunicorn_app, logged_in_session
+
+SCENARIOS = ("login", "home", "chat")
+USERNAME, PASSWORD = "bench", "bench-password"
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an ascending list
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _requester(scenario, base_url, cookies):
+    session = requests.Session()
+    session.cookies.update(cookies)
+    counter = iter(range(sys.maxsize))
+
+    if scenario == "login":
+        def send():
+            # Logged-in users are redirected before their password is checked, log in afresh each time
+            session.cookies.clear()
+            response = session.post(f"{base_url}/login", data={"username": USERNAME, "password": PASSWORD},
+                                    allow_redirects=False, timeout=300)
+            return response.status_code == 302
+    elif scenario == "home":
+        def send():
+            response = session.get(f"{base_url}/", allow_redirects=False, timeout=300)
+            return response.status_code == 200
+    elif scenario == "chat":
+        def send():
+            prompt = f"Load test prompt {threading.get_ident()}-{next(counter)}"
+            response = session.post(f"{base_url}/chat", data={"prompt": prompt}, allow_redirects=False,
+                                    timeout=300)
+            return response.status_code == 302
+    else:
+        raise ValueError(f"Unknown scenario {scenario!r}")
+    return send
+
+
+def run_level(scenario, base_url, cookies, concurrency, duration, warmup):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from, stop_at = start + warmup, start + warmup + duration
+
+    def client():
+        send = _requester(scenario, base_url, cookies)
+        while True:
+            began = time.perf_counter()
+            if began >= stop_at:
+                return
+            try:
+                ok = send()
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - began
+            if began < measure_from:
+                continue
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+
+    latencies.sort()
+    # Requests still in flight when the window closed finish after it, measure the real window
+    window = max(duration, time.perf_counter() - measure_from)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput": round(len(latencies) / window, 2),
+        "p50": _round(percentile(latencies, 0.50)),
+        "p95": _round(percentile(latencies, 0.95)),
+        "p99": _round(percentile(latencies, 0.99)),
+        "max": _round(latencies[-1] if latencies else None),
+        "mean": _round(statistics.fmean(latencies) if latencies else None),
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    llm = FakeLLMServer(latency=args.latency, token_rate=args.token_rate, tokens=args.tokens).start()
+    results = []
+    try:
+        with gunicorn_app(llm.url, workers=args.workers, threads=args.threads) as base_url:
+            cookies = logged_in_session(base_url, USERNAME, PASSWORD).cookies
+            for concurrency in args.concurrency:
+                for scenario in args.scenarios:
+                    result = run_level(scenario, base_url, cookies, concurrency, args.duration, args.warmup)
+                    print(json.dumps(result), file=sys.stderr)
+                    results.append(result)
+    finally:
+        llm.stop()
+
+    return {
+        "commit": _commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {
+            "workers": args.workers,
+            "threads": args.threads,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "latency": args.latency,
+            "token_rate": args.token_rate,
+            "tokens": args.tokens,
+        },
+        "results": results,
+    }
+
+
+def compare(before_path, after_path, tolerance):
+    with open(before_path) as f:
+        before = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    with open(after_path) as f:
+        after = json.load(f)["results"]
+
+    regressed = False
+    print(f"{'scenario':<8} {'conc':>5} {'throughput':>22} {'p95 (s)':>24}")
+    for result in after:
+        old = before.get((result["scenario"], result["concurrency"]))
+        if old is None or not old["throughput"] or old["p95"] is None or result["p95"] is None:
+            continue
+        throughput_change = result["throughput"] / old["throughput"] - 1
+        p95_change = result["p95"] / old["p95"] - 1 if old["p95"] else 0.0
+        flag = ""
+        if throughput_change < -tolerance or p95_change > tolerance:
+            regressed = True
+            flag = "  REGRESSION"
+        print(f"{result['scenario']:<8} {result['concurrency']:>5} "
+              f"{old['throughput']:>8} -> {result['throughput']:>8} ({throughput_change:+.0%}) "
+              f"{old['p95']:>7} -> {result['p95']:>7} ({p95_change:+.0%}){flag}")
+    return 1 if regressed else 0
+
+
+def _levels(value):
+    return [int(level) for level in value.split(",") if level.strip()]
+
+
+def _scenarios(value):
+    scenarios = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return scenarios
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(prog="bench_load compare", description="Compare two result files.")
+        parser.add_argument("before")
+        parser.add_argument("after")
+        parser.add_argument("--tolerance", type=float, default=0.1,
+                            help="Relative throughput drop or p95 increase counted as a regression.")
+        args = parser.parse_args(sys.argv[2:])
+        sys.exit(compare(args.before, args.after, args.tolerance))
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes.")
+    parser.add_argument("--threads", type=int, default=32, help="gthread threads per worker.")
+    parser.add_argument("--concurrency", type=_levels, default=[1, 8, 32, 64],
+                        help="Comma-separated numbers of concurrent clients.")
+    parser.add_argument("--scenarios", type=_scenarios, default=list(SCENARIOS),
+                        help="Comma-separated scenarios among login, home, chat.")
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds per level and scenario.")
+    parser.add_argument("--warmup", type=float, default=2, help="Unmeasured seconds before each measurement.")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake LLM seconds to the first token.")
+    parser.add_argument("--token-rate", type=float, default=50, help="Fake LLM tokens per second.")
+    parser.add_argument("--tokens", type=int, default=100, help="Tokens per fake answer.")
+    parser.add_argument("--output", default=None, help="JSON file to write (default: print to stdout).")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+bench_password_hash.py
+Measures how many logins per second the real app sustains under a login storm, for several
+PASSWORD_HASH_METHOD cost settings.
+
+For every hash method the benchmark:
+    1. Runs the real app under gunicorn (`--workers` processes, gthread) with PASSWORD_HASH_METHOD set.
+    2. Registers `--users` accounts, hashed with that method.
+    3. Fires `--logins` POST /login requests, `--concurrency` at a time, and while they are in
+       flight times a GET /login to show whether other pages are stalled by the hashing.
+
+Reported per method (JSON):
+    logins (int): Successful logins.
+    wall_seconds (float): Time to answer all of them.
+    logins_per_second (float): logins / wall_seconds.
+    login_page_seconds (float): Latency of GET /login during the storm.
+
+Usage:
+------
+    python -m benchmarks.bench_password_hash --workers 4 --logins 400 --concurrency 32
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.harness import gunicorn_app
+
+METHODS = [
+    "pbkdf2:sha256:100000",
+    "pbkdf2:sha256:600000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",  # Werkzeug's default
+    "scrypt:65536:8:1",
+]
+
+
+def run(method, workers, users, logins, concurrency):
+    env = {"PASSWORD_HASH_METHOD": method, "PASSWORD_HASH_MAX_PENDING": str(concurrency)}
+    # The app is never asked for a completion, no LLM is needed
+    with gunicorn_app("http://127.0.0.1:9", workers=workers, threads=concurrency, extra_env=env) as base_url:
+        accounts = [(f"bench{i}", f"bench-password-{i}") for i in range(users)]
+        for username, password in accounts:
+            requests.post(f"{base_url}/register", data={"username": username, "password": password})
+
+        def login(i):
+            username, password = accounts[i % users]
+            response = requests.post(f"{base_url}/login", data={"username": username, "password": password},
+                                     allow_redirects=False, timeout=600)
+            return response.status_code == 302
+
+        login_latency = {}
+
+        def probe_login_page():
+            time.sleep(0.5)  # Let the storm occupy the workers first
+            start = time.perf_counter()
+            requests.get(f"{base_url}/login", timeout=600)
+            login_latency["seconds"] = time.perf_counter() - start
+
+        probe = threading.Thread(target=probe_login_page)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            probe.start()
+            succeeded = sum(pool.map(login, range(logins)))
+        wall = time.perf_counter() - start
+        probe.join()
+
+    return {
+        "method": method,
+        "workers": workers,
+        "concurrency": concurrency,
+        "logins": succeeded,
+        "wall_seconds": round(wall, 3),
+        "logins_per_second": round(succeeded / wall, 2),
+        "login_page_seconds": round(login_latency["seconds"], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes.")
+    parser.add_argument("--users", type=int, default=20, help="Accounts logging in.")
+    parser.add_argument("--logins", type=int, default=200, help="POST /login requests per method.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Simultaneous login requests.")
+    parser.add_argument("--method", action="append", help="Hash method to measure (repeatable, default: a cost sweep).")
+    args = parser.parse_args()
+
+    results = [run(method, args.workers, args.users, args.logins, args.concurrency)
+               for method in args.method or METHODS]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
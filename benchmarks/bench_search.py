@@ -0,0 +1,194 @@
+"""
+bench_search.py
+Measures the full-text search of the chat history (project.search, SQLite FTS5) on a large `chats`
+table, against the LIKE scan it replaces, and what the index costs on every chat insert.
+
+The benchmark:
+    1. Creates the schema with the real models, drops the index triggers and seeds `--rows` chats
+       spread over `--users` users (one thread each), with prompts and answers drawn from a
+       Zipf-distributed vocabulary, so some words are in most chats and others in a handful.
+    2. Times `rebuild_index` (the `flask rebuild-search-index` command) over all of them.
+    3. For a common, a mid-frequency, a rare and an absent word, and a two-word search, times the first page of
+       `search` for one user and the equivalent LIKE query (the user's chats whose prompt or answer
+       contains the word, served by the (user_id, timestamp) index, then scanned).
+    4. Times `--inserts` single-row chat inserts (one transaction each, like /chat) with the index
+       triggers, then without them.
+
+Reported (JSON):
+    rows, users (int): Size of the table.
+    seed_seconds, rebuild_seconds (float): Time to insert the rows and to index them.
+    searches: For every word, the matches of the user and the median ms of the FTS5 page and of the LIKE query.
+    insert_ms_with_index, insert_ms_without_index (float): Median time of a chat insert.
+
+Usage:
+------
+    python -m benchmarks.bench_search --rows 1000000 --users 100
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from project import create_app
+from project.db import db
+from project.models import Chat
+from project.search import rebuild_index, search
+
+VOCABULARY = 20_000
+PROMPT_WORDS, ANSWER_WORDS = 8, 40
+
+
+def vocabulary(rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(4, 9))))
+    # Sorted first, set order changes with hash randomization
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def seed(rows, users, words, rng):
+    # Zipf: the word of rank r is drawn with a weight of 1/r
+    cumulative, total = [], 0.0
+    for rank in range(1, len(words) + 1):
+        total += 1 / rank
+        cumulative.append(total)
+
+    def sentence(count):
+        return " ".join(rng.choices(words, cum_weights=cumulative, k=count))
+
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for statement in ("DROP TRIGGER chats_fts_insert", "DROP TRIGGER chats_fts_delete", "DROP TRIGGER chats_fts_update"):
+            cursor.execute(statement)
+        start = datetime(2025, 1, 1)
+        cursor.executemany("INSERT INTO user (id, username, password) VALUES (?, ?, 'x')",
+                           [(i, f"user{i}") for i in range(1, users + 1)])
+        cursor.executemany("INSERT INTO conversations (id, user_id, title, created_at, last_activity, message_count) "
+                           "VALUES (?, ?, 'thread', ?, ?, 0)",
+                           [(i, i, start.isoformat(" "), start.isoformat(" ")) for i in range(1, users + 1)])
+        statement = ("INSERT INTO chats (user_id, conversation_id, timestamp, prompt, response, raw_response) "
+                     "VALUES (?, ?, ?, ?, ?, ?)")
+        batch = []
+        for i in range(rows):
+            answer = sentence(ANSWER_WORDS)
+            batch.append((i % users + 1, i % users + 1, (start + timedelta(seconds=i)).isoformat(" "),
+                          sentence(PROMPT_WORDS).capitalize() + "?", f"<p>{answer}</p>", answer))
+            if len(batch) == 50_000:
+                cursor.executemany(statement, batch)
+                batch.clear()
+        cursor.executemany(statement, batch)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def like_page(user_id, words, per_page=20):
+    conditions = " AND ".join(f"(prompt LIKE :w{i} OR coalesce(raw_response, response) LIKE :w{i})"
+                              for i in range(len(words)))
+    params = {f"w{i}": f"%{word}%" for i, word in enumerate(words)}
+    return db.session.execute(text(
+        f"SELECT id, prompt FROM chats WHERE user_id = :user_id AND {conditions} "
+        "ORDER BY timestamp DESC LIMIT :limit"
+    ), {"user_id": user_id, "limit": per_page, **params}).all()
+
+
+def time_inserts(user_id, count):
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        db.session.add(Chat(user_id=user_id, conversation_id=user_id, prompt=f"benchmark insert {i}",
+                            response="<p>answer</p>"))
+        db.session.commit()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Chats in the table.")
+    parser.add_argument("--users", type=int, default=100, help="Users the chats are spread over.")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per search.")
+    parser.add_argument("--inserts", type=int, default=200, help="Timed chat inserts with and without the index.")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = vocabulary(rng)
+    db_fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(db_fd)
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}", "RATELIMIT_ENABLED": False})
+    try:
+        with app.app_context():
+            db.create_all()
+            start = time.perf_counter()
+            seed(args.rows, args.users, words, rng)
+            seed_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            rebuild_index()
+            rebuild_seconds = time.perf_counter() - start
+            db.session.execute(text("ANALYZE"))
+            db.session.commit()
+
+            user_id = args.users // 2
+            cases = {"common": [words[0]], "mid": [words[200]], "rare": [words[2_000]], "absent": [words[15_000]],
+                     "two_words": [words[3], words[50]]}
+            searches = {}
+            for name, query in cases.items():
+                matches = db.session.execute(text(
+                    "SELECT count(*) FROM chats_fts WHERE chats_fts MATCH :expression"
+                ), {"expression": f'owner : "u{user_id}" AND (' + " AND ".join(f'"{w}"' for w in query) + ")"}).scalar()
+                searches[name] = {
+                    "query": " ".join(query),
+                    "user_matches": matches,
+                    "fts_page_ms": median_ms(lambda: search(user_id, " ".join(query)), args.repeat),
+                    "like_page_ms": median_ms(lambda: like_page(user_id, query), max(1, args.repeat // 4)),
+                }
+
+            with_index = time_inserts(user_id, args.inserts)
+            for statement in ("DROP TRIGGER chats_fts_insert", "DROP TRIGGER chats_fts_delete",
+                              "DROP TRIGGER chats_fts_update"):
+                db.session.execute(text(statement))
+            db.session.commit()
+            without_index = time_inserts(user_id, args.inserts)
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        os.unlink(db_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+    print(json.dumps({
+        "rows": args.rows,
+        "users": args.users,
+        "seed_seconds": round(seed_seconds, 2),
+        "rebuild_seconds": round(rebuild_seconds, 2),
+        "searches": searches,
+        "insert_ms_with_index": with_index,
+        "insert_ms_without_index": without_index,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+bench_sqlite_writes.py
+Measures Chat insert throughput with several processes writing to the same SQLite file, as the
+gunicorn workers do, with SQLite's defaults and with the production profile (SQLITE_PRAGMAS).
+
+For every profile the benchmark:
+    1. Creates a fresh database file with one user and one thread (Conversation).
+    2. Starts `--processes` processes, each building the real app with `create_app` and running
+       `--threads` threads that insert `--rows` Chat rows each in the thread, one row per transaction
+       (like /chat, the thread's counters are updated in the same transaction), and `--readers` threads
+       reading history pages meanwhile (like the home page).
+    3. Counts the rows committed, the history pages read and the inserts that failed with
+       "database is locked".
+
+Reported per profile (JSON):
+    rows (int): Rows committed.
+    locked_errors (int): Inserts that gave up on the lock.
+    pages_read (int): History pages read during the writes.
+    wall_seconds (float): Time for all processes to finish.
+    rows_per_second (float): rows / wall_seconds.
+
+Usage:
+------
+    python -m benchmarks.bench_sqlite_writes --processes 4 --threads 8 --readers 4 --rows 200
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+PROFILES = {
+    # SQLite defaults: rollback journal, synchronous=FULL, the driver's 5 s timeout
+    "default": {},
+    "production": None,  # SQLITE_PRAGMAS from Config
+}
+
+
+def _app(db_uri, pragmas):
+    from project import create_app
+
+    config = {"SQLALCHEMY_DATABASE_URI": db_uri, "DEEPSEEK_API_KEY": "benchmark", "RATELIMIT_ENABLED": False}
+    if pragmas is not None:
+        config["SQLITE_PRAGMAS"] = pragmas
+    return create_app(config)
+
+
+def _writer(db_uri, pragmas, user_id, conversation_id, threads, readers, rows, start, results):
+    from project.db import db
+    from project.models import Chat
+
+    app = _app(db_uri, pragmas)
+    committed, locked, pages = [0], [0], [0]
+    lock = threading.Lock()
+    writing = threading.Event()
+
+    def insert_rows(worker):
+        with app.app_context():
+            for i in range(rows):
+                try:
+                    db.session.add(Chat(user_id=user_id, conversation_id=conversation_id,
+                                        prompt=f"{os.getpid()}-{worker}-{i}", response="<p>answer</p>"))
+                    db.session.commit()
+                    with lock:
+                        committed[0] += 1
+                except OperationalError:
+                    db.session.rollback()
+                    with lock:
+                        locked[0] += 1
+            db.session.remove()
+
+    def read_pages():
+        with app.app_context():
+            while writing.is_set():
+                try:
+                    Chat.history_page(conversation_id, 20)
+                    with lock:
+                        pages[0] += 1
+                except OperationalError:
+                    pass
+                db.session.remove()
+
+    start.wait()
+    writing.set()
+    pool = [threading.Thread(target=insert_rows, args=(worker,)) for worker in range(threads)]
+    reading = [threading.Thread(target=read_pages) for _ in range(readers)]
+    for thread in pool + reading:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    writing.clear()
+    for thread in reading:
+        thread.join()
+    results.put((committed[0], locked[0], pages[0]))
+
+
+def run(profile, processes, threads, readers, rows):
+    from project.db import db
+    from project.models import Conversation, User
+
+    pragmas = PROFILES[profile]
+    directory = tempfile.mkdtemp()
+    db_uri = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    app = _app(db_uri, pragmas)
+    with app.app_context():
+        db.create_all()
+        user = User()
+        user.username = "bench"
+        user.password = "bench-password"
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        conversation_id = Conversation.start(user_id, "Benchmark thread").id
+        db.session.remove()
+        db.engine.dispose()
+
+    context = multiprocessing.get_context("spawn")
+    start, results = context.Event(), context.Queue()
+    workers = [context.Process(target=_writer, args=(db_uri, pragmas, user_id, conversation_id, threads, readers, rows,
+                                                          start, results))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    time.sleep(3)  # Let every process import the app before the clock starts
+    began = time.perf_counter()
+    start.set()
+    totals = [results.get() for _ in workers]
+    wall = time.perf_counter() - began
+    for worker in workers:
+        worker.join()
+
+    committed = sum(total[0] for total in totals)
+    return {
+        "profile": profile,
+        "processes": processes,
+        "threads": threads,
+        "readers": readers,
+        "rows": committed,
+        "locked_errors": sum(total[1] for total in totals),
+        "pages_read": sum(total[2] for total in totals),
+        "wall_seconds": round(wall, 3),
+        "rows_per_second": round(committed / wall, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=4, help="Writer processes (gunicorn workers).")
+    parser.add_argument("--threads", type=int, default=8, help="Writing threads per process.")
+    parser.add_argument("--readers", type=int, default=4, help="Reading threads per process.")
+    parser.add_argument("--rows", type=int, default=200, help="Rows inserted per thread.")
+    args = parser.parse_args()
+
+    results = [run(profile, args.processes, args.threads, args.readers, args.rows) for profile in PROFILES]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
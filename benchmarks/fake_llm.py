@@ -0,0 +1,112 @@
+"""
+fake_llm.py
+A local stand-in for the DeepSeek chat completion API, used by the benchmarks so that
+load tests measure the application and not the real upstream.
+
+Classes:
+    FakeLLMServer:
+        Threaded HTTP server answering POST requests on any path with an OpenAI/DeepSeek
+        compatible chat completion.
+        Parameters:
+            latency (float): Seconds to wait before the first token, simulating model latency.
+            port (int): Port to bind on 127.0.0.1, 0 picks a free one.
+            token_rate (float or None): Tokens generated per second after the first one (None sends
+                the whole answer at once). Streams send one token per chunk at that pace; JSON answers
+                are sent once every token is "generated".
+            tokens (int): Length of each answer, in tokens (words).
+        Attributes:
+            url (str): Full URL of the completion endpoint, for DEEPSEEK_API_URL.
+        Methods:
+            start(): Serves requests on a background thread and returns the server.
+            stop(): Shuts the server down.
+
+Usage:
+------
+    python -m benchmarks.fake_llm --latency 2 --token-rate 50 --tokens 200 --port 8089
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server.latency)
+
+        words = self.server.answer
+        gap = 1 / self.server.token_rate if self.server.token_rate else 0
+        usage = {"prompt_tokens": sum(len(str(m.get("content", "")).split()) for m in body.get("messages", [])),
+                 "completion_tokens": len(words)}
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i, word in enumerate(words):
+                if i and gap:
+                    time.sleep(gap)
+                chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            if body.get("stream_options", {}).get("include_usage"):
+                self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+            return
+
+        time.sleep(gap * (len(words) - 1))
+        content = " ".join(words)
+        payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}],
+                              "usage": usage}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=1.0, port=0, token_rate=None, tokens=5):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.token_rate = token_rate
+        self.answer = (["This", "is", "a", "**fake**", "answer."] + ["token"] * max(0, tokens - 5))[:max(1, tokens)]
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake DeepSeek compatible completion server.")
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds before each answer.")
+    parser.add_argument("--token-rate", type=float, default=None, help="Tokens per second after the first.")
+    parser.add_argument("--tokens", type=int, default=5, help="Tokens per answer.")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(latency=args.latency, port=args.port, token_rate=args.token_rate, tokens=args.tokens)
+    print(f"Fake LLM listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,79 @@
+"""
+harness.py
+Helpers shared by the benchmark scripts to run the real application under gunicorn.
+
+Functions:
+    free_port(): Returns a free TCP port on 127.0.0.1.
+    gunicorn_app(llm_url, worker_class="gthread", workers=1, threads=1, extra_env=None):
+        Context manager starting `benchmarks.wsgi:app` under gunicorn, with the repository's
+        gunicorn.conf.py, against a fresh temporary SQLite database (and circuit breaker file).
+        Yields the base URL.
+    logged_in_session(base_url, username="bench", password="bench-password"):
+        Registers a benchmark user and returns a requests.Session carrying its login cookie.
+"""
+
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def gunicorn_app(llm_url, worker_class="gthread", workers=1, threads=1, extra_env=None):
+    port = free_port()
+    db_fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(db_fd)
+    env = dict(os.environ,
+               BENCH_DATABASE_URI=f"sqlite:///{db_path}",
+               CIRCUIT_BREAKER_PATH=f"{db_path}-circuits",
+               DEEPSEEK_API_URL=llm_url,
+               **(extra_env or {}))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn",
+         "--config", os.path.join(ROOT, "gunicorn.conf.py"),
+         "--bind", f"127.0.0.1:{port}",
+         "--workers", str(workers),
+         "--worker-class", worker_class,
+         "--threads", str(threads),
+         "--access-logfile", os.devnull,
+         "benchmarks.wsgi:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(f"{base_url}/login", timeout=1)
+                break
+            except (requests.ConnectionError, requests.Timeout):
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        for suffix in ("", "-wal", "-shm", "-circuits", "-circuits-wal", "-circuits-shm"):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(db_path + suffix)
+
+
+def logged_in_session(base_url, username="bench", password="bench-password"):
+    session = requests.Session()
+    session.post(f"{base_url}/register", data={"username": username, "password": password})
+    session.post(f"{base_url}/login", data={"username": username, "password": password})
+    return session
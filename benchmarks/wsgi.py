@@ -0,0 +1,29 @@
+"""
+wsgi.py
+Gunicorn entry point used by the benchmarks. Builds the real application with
+`create_app`, with CSRF and rate limiting disabled so that load generators can post
+directly and the chat job queue disabled so that /chat answers inline, and creates the
+tables of the benchmark database.
+
+Environment:
+    BENCH_DATABASE_URI (str): Database used by the benchmarked app.
+    DEEPSEEK_API_URL (str): Completion endpoint, normally a benchmarks.fake_llm server.
+"""
+
+import os
+
+from project import create_app
+from project.db import db
+
+app = create_app({
+    "SQLALCHEMY_DATABASE_URI": os.environ["BENCH_DATABASE_URI"],
+    "DEEPSEEK_API_URL": os.environ["DEEPSEEK_API_URL"],
+    "DEEPSEEK_API_KEY": "benchmark",
+    "WTF_CSRF_ENABLED": False,
+    "RATELIMIT_ENABLED": False,
+    # /chat answers inline, the benchmarks measure the upstream path of the web workers
+    "CHAT_QUEUE_ENABLED": False,
+})
+
+with app.app_context():
+    db.create_all()
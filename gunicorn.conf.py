@@ -4,15 +4,45 @@ Gunicorn configuration file.
 Settings:
     bind (str): The socket to bind. "0.0.0.0:5000" means the server will be accessible on all network interfaces at port 5000.
     workers (int): The number of worker processes for handling requests. Set to 4 for handling concurrent requests efficiently.
+    worker_class (str): "gthread" runs every request on a thread of the worker's pool, so a request waiting on the
+        DeepSeek API no longer pins a whole worker process. The requests spend nearly all their time blocked on
+        network I/O, which releases the GIL, so one process can keep hundreds of completions in flight.
+    threads (int): The number of request threads per worker (env GUNICORN_THREADS, default 100).
+        Total in-flight requests is workers * threads.
     timeout (int): Workers silent for more than this many seconds are killed and restarted. Set to 120 seconds.
+        With gthread the heartbeat runs on the worker's main loop, so a slow request does not trip it.
     keepalive (int): The number of seconds to wait for requests on a Keep-Alive connection. Set to 5 seconds.
     accesslog (str): The file to write access logs to. "-" means log to stdout.
     errorlog (str): The file to write error logs to. "-" means log to stderr.
+
+Metrics:
+    PROMETHEUS_MULTIPROC_DIR (env, default: a directory in the system temp dir) is exported to the workers
+    so that each writes its metric samples there and /metrics aggregates all of them.
+    on_starting(server): Empties the directory, samples of a previous run must not be reported.
+    child_exit(server, worker): Marks an exited worker dead so its live samples are dropped.
 """
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "aifacade-metrics"))
 
 bind = "0.0.0.0:5000"
 workers = 4
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "100"))
 timeout = 120
 keepalive = 5
 accesslog = "-"
-errorlog = "-"
\ No newline at end of file
+errorlog = "-"
+
+
+def on_starting(server):
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
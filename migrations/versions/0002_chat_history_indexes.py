@@ -0,0 +1,28 @@
+"""Index per-user chat history.
+
+Username lookups need no index of their own, the UNIQUE constraint of user.username has one.
+
+Revision ID: 0002_chat_history_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_chat_history_indexes'
+down_revision = '0001_initial_schema'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.create_index('ix_chats_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_index('ix_chats_user_id_timestamp')
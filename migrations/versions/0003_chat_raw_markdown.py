@@ -0,0 +1,28 @@
+"""Store the raw Markdown answer and the renderer version next to the rendered HTML.
+
+Revision ID: 0003_chat_raw_markdown
+Revises: 0002_chat_history_indexes
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_chat_raw_markdown'
+down_revision = '0002_chat_history_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('raw_response', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('render_version', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_column('render_version')
+        batch_op.drop_column('raw_response')
@@ -0,0 +1,74 @@
+"""Group chats in conversation threads with denormalized counters.
+
+Revision ID: 0006_conversations
+Revises: 0005_chat_jobs
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_conversations'
+down_revision = '0005_chat_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=120), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_activity', sa.DateTime(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('last_snippet', sa.String(length=200), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.create_index('ix_conversations_user_id_last_activity', ['user_id', 'last_activity'], unique=False)
+
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', sa.Integer(), nullable=True))
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_jobs_conversation_id_conversations', 'conversations', ['conversation_id'], ['id'])
+
+    # The existing history of each user becomes one thread, titled after its first prompt
+    op.execute(
+        "INSERT INTO conversations (user_id, title, created_at, last_activity, message_count, last_snippet) "
+        "SELECT user_id, "
+        "substr((SELECT prompt FROM chats AS first WHERE first.user_id = chats.user_id "
+        "ORDER BY timestamp, id LIMIT 1), 1, 80), "
+        "min(timestamp), max(timestamp), count(*), "
+        "substr((SELECT prompt FROM chats AS last WHERE last.user_id = chats.user_id "
+        "ORDER BY timestamp DESC, id DESC LIMIT 1), 1, 120) "
+        "FROM chats GROUP BY user_id"
+    )
+    op.execute("UPDATE chats SET conversation_id = "
+               "(SELECT id FROM conversations WHERE conversations.user_id = chats.user_id)")
+    op.execute("UPDATE jobs SET conversation_id = "
+               "(SELECT id FROM conversations WHERE conversations.user_id = jobs.user_id)")
+
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.alter_column('conversation_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_chats_conversation_id_conversations', 'conversations', ['conversation_id'], ['id'])
+        batch_op.create_index('ix_chats_conversation_id_timestamp', ['conversation_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_index('ix_chats_conversation_id_timestamp')
+        batch_op.drop_constraint('fk_chats_conversation_id_conversations', type_='foreignkey')
+        batch_op.drop_column('conversation_id')
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_jobs_conversation_id_conversations', type_='foreignkey')
+        batch_op.drop_column('conversation_id')
+
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversations_user_id_last_activity')
+
+    op.drop_table('conversations')
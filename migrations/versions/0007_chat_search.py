@@ -0,0 +1,43 @@
+"""Full-text search index over the chats (FTS5), kept in sync by triggers.
+
+Revision ID: 0007_chat_search
+Revises: 0006_conversations
+Create Date: 2026-10-17 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_chat_search'
+down_revision = '0006_conversations'
+branch_labels = None
+depends_on = None
+
+
+ANSWER = "coalesce({row}.raw_response, {row}.response)"
+INDEX_ROW = ("INSERT INTO chats_fts (rowid, prompt, answer, owner) "
+             "VALUES ({row}.id, {row}.prompt, " + ANSWER + ", 'u' || {row}.user_id);")
+
+
+def upgrade():
+    op.execute("CREATE VIRTUAL TABLE chats_fts USING fts5("
+               "prompt, answer, owner, tokenize = 'unicode61 remove_diacritics 2')")
+    op.execute("CREATE TRIGGER chats_fts_insert AFTER INSERT ON chats BEGIN "
+               + INDEX_ROW.format(row="new") + " END")
+    op.execute("CREATE TRIGGER chats_fts_delete AFTER DELETE ON chats BEGIN "
+               "DELETE FROM chats_fts WHERE rowid = old.id; END")
+    op.execute("CREATE TRIGGER chats_fts_update AFTER UPDATE OF prompt, response, raw_response, user_id "
+               "ON chats WHEN old.prompt IS NOT new.prompt OR old.user_id IS NOT new.user_id OR "
+               + ANSWER.format(row="old") + " IS NOT " + ANSWER.format(row="new") + " BEGIN "
+               "DELETE FROM chats_fts WHERE rowid = old.id; " + INDEX_ROW.format(row="new") + " END")
+    # Existing chats, in one statement; large databases can use `flask rebuild-search-index` instead
+    op.execute("INSERT INTO chats_fts (rowid, prompt, answer, owner) "
+               "SELECT id, prompt, " + ANSWER.format(row="chats") + ", 'u' || user_id FROM chats")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS chats_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS chats_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS chats_fts_insert")
+    op.execute("DROP TABLE IF EXISTS chats_fts")
@@ -0,0 +1,46 @@
+"""Record the tokens of every chat and keep per-user daily usage totals.
+
+Revision ID: 0008_token_usage
+Revises: 0007_chat_search
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_token_usage'
+down_revision = '0007_chat_search'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Nullable columns are added in place, `chats` (and its search triggers) is not rebuilt
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('prompt_tokens', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('completion_tokens', sa.Integer(), nullable=True))
+
+    op.create_table('usage_daily',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('requests', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+    sa.Column('completion_tokens', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+
+    # The chats saved so far count as requests; their tokens were not recorded
+    op.execute(
+        "INSERT INTO usage_daily (user_id, day, requests, prompt_tokens, completion_tokens) "
+        "SELECT user_id, date(timestamp), count(*), 0, 0 FROM chats GROUP BY user_id, date(timestamp)"
+    )
+
+
+def downgrade():
+    op.drop_table('usage_daily')
+    # Native DROP COLUMN (SQLite 3.35+): a batch operation would rebuild `chats` without its search triggers
+    op.drop_column('chats', 'completion_tokens')
+    op.drop_column('chats', 'prompt_tokens')
@@ -4,7 +4,7 @@ This module initializes and configures the Flask application for the project.
 Main Components:
 ----------------
 - Imports necessary Flask modules and extensions.
-- Initializes CSRF protection, database, login manager, and rate limiter.
+- Initializes CSRF protection, database, login manager, rate limiter and metrics.
 - Defines a factory function `create_app` to create and configure the Flask app instance.
 Functions:
 ----------
@@ -23,7 +23,17 @@ create_app(test_config=None)
     --------------
     - Loads configuration from the Config class and optionally from a config file or test config.
     - Initializes Flask extensions: CSRF protection, database, login manager, and rate limiter.
-    - Registers blueprints for modular structure (chat and auth).
+    - Registers the request metrics hooks and the `/metrics` endpoint (see project.metrics).
+    - Creates the worker's pooled DeepSeek client and stores it in `app.extensions["deepseek"]`.
+    - Creates the router over the LLM backends of LLM_PROVIDERS and stores it in `app.extensions["llm_router"]`.
+    - Creates the completion cache, when enabled, and stores it in `app.extensions["completion_cache"]`.
+    - Creates the password hashing pool and stores it in `app.extensions["password_hasher"]`.
+    - Creates the user identity cache and stores it in `app.extensions["user_cache"]`.
+    - Creates the request coalescer, when enabled, and stores it in `app.extensions["coalescer"]`.
+    - Creates the conversation context store (windows per thread) and stores it in `app.extensions["chat_context"]`.
+    - Creates the cache of rendered history cards and stores it in `app.extensions["fragment_cache"]`.
+    - Registers the `export-chats` and `import-chats` commands (see project.export).
+    - Registers blueprints for modular structure (chat, auth, search, export and usage).
     - Sets up custom error handlers for 404 and 505 errors, rendering custom templates.
     - Provides a route `/simulate-505` to trigger a 505 error for testing.
     - Sets security-related HTTP headers after each request to enhance security.
@@ -35,7 +45,18 @@ Notes:
 from project.config import Config
 from .auth import login_manager
 from . import db
+from . import metrics
+from . import jobs
+from . import export
 from .extensions import limiter
+from .client import DeepSeekClient
+from .providers import ProviderRouter
+from .cache import CompletionCache
+from .coalesce import SingleFlight
+from .context import ContextStore
+from .fragments import FragmentCache
+from .passwords import PasswordHasher
+from .user_cache import UserCache
 from flask_wtf import CSRFProtect
 from flask import Flask, render_template, abort
 
@@ -63,12 +84,40 @@ def create_app(test_config = None):
     login_manager.session_protection = "strong"  # Extra session security
     login_manager.login_view = "login"  # Redirect to 'login' view if not authenticated
     limiter.init_app(app)        # Rate limiting
+    metrics.init_app(app)        # Prometheus metrics on /metrics
+    jobs.init_app(app)           # `flask run-worker` answering queued prompts
+    export.init_app(app)         # `flask export-chats` and `flask import-chats`
+
+    # Long-lived upstream client, one connection pool per worker process
+    app.extensions["deepseek"] = DeepSeekClient.from_config(app.config)
+    # Backends answering the prompts, tried by measured latency and health
+    app.extensions["llm_router"] = ProviderRouter.from_config(app.config, app.extensions["deepseek"])
+    # Answers to repeated prompts, shared by the worker's threads (and workers with COMPLETION_CACHE_PATH)
+    if app.config["COMPLETION_CACHE_ENABLED"]:
+        app.extensions["completion_cache"] = CompletionCache.from_config(app.config)
+    # Password hashes run in a bounded pool, off the request threads
+    app.extensions["password_hasher"] = PasswordHasher.from_config(app.config)
+    # Identities of logged-in users, sparing the user loader a query per request
+    app.extensions["user_cache"] = UserCache.from_config(app.config)
+    # Concurrent identical prompts wait for a single upstream call
+    if app.config["COALESCE_ENABLED"]:
+        app.extensions["coalescer"] = SingleFlight.from_config(app.config)
+    # Token-budgeted windows of recent turns, kept in sync incrementally per thread
+    app.extensions["chat_context"] = ContextStore.from_config(app.config)
+    # Rendered HTML of the history cards, an exchange never changes once saved
+    app.extensions["fragment_cache"] = FragmentCache.from_config(app.config)
 
     # Import and register blueprints for modular app structure
     from .chat import bp as chat
     from .auth import bp as auth
+    from .search import bp as search
+    from .export import bp as export_bp
+    from .usage import bp as usage
     app.register_blueprint(chat)
     app.register_blueprint(auth)
+    app.register_blueprint(search)
+    app.register_blueprint(export_bp)
+    app.register_blueprint(usage)
 
     # Custom error handler for 404 Not Found
     @app.errorhandler(404)
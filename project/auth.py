@@ -16,7 +16,8 @@ Blueprints:
     bp (Blueprint): The authentication blueprint for registering auth-related routes.
 Functions:
     load_user(user_id):
-        Flask-Login user loader callback. Loads a user from the database by user ID.
+        Flask-Login user loader callback. Returns the user's identity (UserIdentity, not the ORM instance)
+        from the per-process user cache, loading it from the database by user ID on a miss.
     register():
         Handles user registration.
         - GET: Renders the registration form.
@@ -27,6 +28,9 @@ Functions:
         - GET: Renders the login form.
         - POST: Validates input using Pydantic, checks credentials, logs in the user, and redirects
           to the chat home page. Handles validation errors and incorrect credentials.
+        - Attempts are limited by LOGIN_RATELIMIT per client address and per username.
+        - Rehashes the password when its stored hash uses outdated parameters (PASSWORD_HASH_METHOD).
+        - Answers 503 when the password hashing pool is saturated.
     logout():
         Logs out the current user and redirects to the login page.
 Dependencies:
@@ -49,14 +53,27 @@ from .models import User
 from .db import db                                                               # SQLAlchemy database instance
 from pydantic import ValidationError                                             # Pydantic for input validation
 from .schemas import UserRegisterSchema, UserLoginSchema                         # Pydantic schemas for registration and login validation
+from flask import current_app                                                    # Access to the LOGIN_RATELIMIT setting and the user cache
+from .extensions import limiter                                                  # Rate limiting of login attempts
+from .ratelimit import login_username                                            # Rate-limit key of login attempts per username
+from .passwords import PasswordHasherBusy                                        # Raised when too many password hashes are pending
+from .user_cache import UserIdentity                                             # Lightweight cached identity returned by the user loader
 
 login_manager = LoginManager()
 bp = Blueprint('auth', __name__)
 
-# Load user by ID for session management
+# Load user by ID for session management, from the per-process cache when possible
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    user_id = int(user_id)
+    cache = current_app.extensions["user_cache"]
+    identity = cache.get(user_id)
+    if identity is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = cache.put(UserIdentity.from_user(user))
+    return identity
 
 
 @bp.route("/register", methods=['GET', 'POST'])
@@ -95,7 +112,13 @@ def register():
     return render_template("register.html")
 
 
+def _login_limit():
+    return current_app.config["LOGIN_RATELIMIT"]
+
+
 @bp.route("/login", methods=["GET", "POST"])
+@limiter.limit(_login_limit, methods=["POST"])
+@limiter.limit(_login_limit, key_func=login_username, methods=["POST"])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("chat.home"))
@@ -111,7 +134,20 @@ def login():
 
         # Check user credentials
         user = User.find_by_username(data.username)
-        if user and user.check_password(data.password):
+        try:
+            valid = user is not None and user.check_password(data.password)
+        except PasswordHasherBusy:
+            flash("Too many logins in progress, please try again in a moment.", "error")
+            return render_template("login.html"), 503
+
+        if valid:
+            # Upgrade hashes made with outdated parameters while the password is at hand
+            if user.password_needs_rehash():
+                try:
+                    user.password = data.password
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
             login_user(user)
             flash("Logged in successfully", "success")
             return redirect(url_for("chat.home"))
@@ -0,0 +1,99 @@
+"""
+breaker.py
+This module holds the circuit breakers of the LLM backends, so that when a backend degrades the
+workers stop waiting on it: after `threshold` consecutive failures its circuit opens and calls to it
+fail fast, until one probe call shows it has recovered.
+Classes:
+    CircuitBreaker:
+        One circuit per backend name, stored in a SQLite file shared by all the gunicorn workers, so
+        the failures seen by one worker open the circuit for every worker.
+        - closed: calls go through; each failure counts, a success resets the count.
+        - open: calls are refused for `reset_timeout` seconds after the circuit opened.
+        - half-open: once that delay has passed, a single call (the first worker to ask) is let
+          through as a probe. Its success closes the circuit, its failure opens it again. When the probe
+          does not report back within `reset_timeout` seconds (its worker died), another probe is allowed.
+        Parameters:
+            path (str): SQLite file of the circuit table.
+            threshold (int): Consecutive failures opening a circuit.
+            reset_timeout (float): Seconds a circuit stays open before a probe.
+            clock (callable): Wall clock, shared by the workers (time.time).
+        Methods:
+            from_config(config): Class method building the breaker from the Flask config.
+            allow(name): Returns whether a call to the backend may go through now.
+            record(name, ok): Reports the outcome of a call.
+            state(name): Returns "closed", "open" or "half_open".
+Functions:
+    counts_as_failure(error):
+        Whether an UpstreamError says the backend is unhealthy: network errors, timeouts, 429 and 5xx
+        answers. Other 4xx answers are about the request itself and never open a circuit.
+"""
+
+import time
+# time: Opening timestamps and probe deadlines
+
+from .shared_sqlite import SharedSQLite
+# SharedSQLite: Per-thread connections to the SQLite file shared by the workers
+
+
+def counts_as_failure(error):
+    status = getattr(error, "status", None)
+    return status is None or status == 429 or status >= 500
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS circuits ("
+        "name TEXT PRIMARY KEY, state TEXT NOT NULL, failures INTEGER NOT NULL, opened_at REAL NOT NULL);"
+    )
+
+    def __init__(self, path, threshold=5, reset_timeout=30, clock=time.time):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._db = SharedSQLite(path, self.SCHEMA)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            path=config["CIRCUIT_BREAKER_PATH"],
+            threshold=config["CIRCUIT_BREAKER_THRESHOLD"],
+            reset_timeout=config["CIRCUIT_BREAKER_RESET_TIMEOUT"],
+        )
+
+    def state(self, name):
+        row = self._db.connection().execute("SELECT state FROM circuits WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else self.CLOSED
+
+    def allow(self, name):
+        if self.state(name) == self.CLOSED:
+            return True
+        now = self._clock()
+        # Only the worker whose update lands gets the probe; opened_at becomes the probe's start
+        row = self._db.connection().execute(
+            "UPDATE circuits SET state = ?, opened_at = ? "
+            "WHERE name = ? AND state != ? AND opened_at <= ? RETURNING name",
+            (self.HALF_OPEN, now, name, self.CLOSED, now - self.reset_timeout),
+        ).fetchone()
+        return row is not None
+
+    def record(self, name, ok):
+        conn = self._db.connection()
+        if ok:
+            # Writes only when there is something to reset, successes are the common case
+            conn.execute(
+                "UPDATE circuits SET state = ?, failures = 0 WHERE name = ? AND (state != ? OR failures > 0)",
+                (self.CLOSED, name, self.CLOSED),
+            )
+            return
+        now = self._clock()
+        opened = self.OPEN if self.threshold <= 1 else self.CLOSED
+        conn.execute(
+            "INSERT INTO circuits (name, state, failures, opened_at) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT(name) DO UPDATE SET "
+            "state = CASE WHEN circuits.state = ? OR circuits.failures + 1 >= ? THEN ? ELSE circuits.state END, "
+            "opened_at = CASE WHEN circuits.state != ? THEN ? ELSE circuits.opened_at END, "
+            "failures = circuits.failures + 1",
+            (name, opened, now, self.HALF_OPEN, self.threshold, self.OPEN, self.OPEN, now),
+        )
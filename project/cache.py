@@ -0,0 +1,172 @@
+"""
+cache.py
+This module provides the completion cache used to answer repeated prompts without calling DeepSeek again.
+Entries are keyed on the normalized prompt, the model name and the conversation history sent with the
+prompt, and hold the raw Markdown answer.
+Classes:
+    LRUTier:
+        In-process tier. An OrderedDict evicting the least recently used entry once `maxsize`
+        is reached; every entry expires `ttl` seconds after it was stored.
+    SQLiteTier:
+        Optional shared tier. A table in a SQLite file that every gunicorn worker opens, so an
+        answer fetched by one worker is served by all of them. Expired rows are ignored on read
+        and purged periodically on write.
+    CompletionCache:
+        Looks tiers up in order (fastest first), back-fills the faster tiers on a hit in a slower
+        one and counts hits and misses. Any object with `get(key)` and `set(key, value)` can be
+        used as a tier.
+        Methods:
+            from_config(config): Class method building the cache from the Flask config.
+            make_key(prompt, model, history=()): Static method returning the cache key of a prompt.
+            get(prompt, model, history=()): Returns the cached answer or None.
+            set(prompt, model, value, history=()): Stores an answer in every tier.
+            stats(): Returns the hit/miss counters.
+Notes:
+    - Only successful answers should be stored, errors must always reach the user fresh.
+    - All tiers are thread-safe, gunicorn runs requests on several threads per worker.
+"""
+
+import hashlib
+# hashlib: To build fixed-size cache keys from prompts of any length
+
+import threading
+# threading: Locks for the in-process tier and the counters
+
+import time
+# time: Expiry timestamps
+
+import json
+# json: Canonical serialization of the history part of a key
+
+from collections import OrderedDict
+# OrderedDict: Keeps entries in recency order for LRU eviction
+
+from .shared_sqlite import SharedSQLite
+# SharedSQLite: Per-thread connections to the SQLite file shared by the workers
+
+from .metrics import CACHE_LOOKUPS
+# CACHE_LOOKUPS: Hit/miss counter aggregated across workers
+
+
+class LRUTier:
+    def __init__(self, maxsize=1024, ttl=3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteTier:
+    PURGE_EVERY = 100  # Writes between two purges of expired rows
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS completion_cache ("
+        "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);"
+    )
+
+    def __init__(self, path, ttl=3600, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._db = SharedSQLite(path, self.SCHEMA)
+        self._writes = 0
+
+    def get(self, key):
+        row = self._db.connection().execute(
+            "SELECT value FROM completion_cache WHERE key = ? AND expires_at > ?",
+            (key, self._clock()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        now = self._clock()
+        conn = self._db.connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO completion_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, now + self.ttl),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM completion_cache WHERE expires_at <= ?", (now,))
+
+
+class CompletionCache:
+    def __init__(self, tiers):
+        self.tiers = list(tiers)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        tiers = [LRUTier(maxsize=config["COMPLETION_CACHE_SIZE"], ttl=config["COMPLETION_CACHE_TTL"])]
+        if config.get("COMPLETION_CACHE_PATH"):
+            tiers.append(SQLiteTier(config["COMPLETION_CACHE_PATH"], ttl=config["COMPLETION_CACHE_TTL"]))
+        return cls(tiers)
+
+    @staticmethod
+    def make_key(prompt, model, history=()):
+        # Case and whitespace differences should not defeat the cache
+        normalized = " ".join(prompt.split()).casefold()
+        key = f"{model}\0{normalized}"
+        if history:
+            # The same prompt in another conversation is another question
+            key += "\0" + json.dumps(list(history), sort_keys=True)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, prompt, model, history=()):
+        key = self.make_key(prompt, model, history)
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                # Promote the entry into the faster tiers that missed it
+                for faster in self.tiers[:index]:
+                    faster.set(key, value)
+                self._count(hit=True)
+                return value
+        self._count(hit=False)
+        return None
+
+    def set(self, prompt, model, value, history=()):
+        key = self.make_key(prompt, model, history)
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def _count(self, hit):
+        CACHE_LOOKUPS.labels(cache="completion", result="hit" if hit else "miss").inc()
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
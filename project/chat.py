@@ -4,47 +4,106 @@ This module defines the chat blueprint for handling chat-related routes in the F
 Blueprints:
     bp: Flask Blueprint for chat routes.
 Routes:
-    - "/" (GET): Home page displaying the user's chat history.
+    - "/" (GET): Home page displaying the user's latest conversation (thread).
         * Redirects to login if the user is not authenticated.
-        * Retrieves all chat messages for the current user, ordered by timestamp.
-        * Renders 'index.html' with the conversation history.
+        * Lists the CONVERSATION_LIST_SIZE most recently active threads in a sidebar (title, message
+          count, last snippet) from the `conversations` table alone; the first of them is the active thread.
+        * Retrieves only the latest CHAT_PAGE_SIZE chat messages of the active thread, ordered by timestamp.
+        * Streams 'index.html' with the thread's history and the cursor of the older messages; the
+          cards of each chat come from the fragment cache (`app.extensions["fragment_cache"]`).
+        * Pops the flashed messages and creates the CSRF token before streaming: the session cookie
+          is sent with the headers, it cannot change once the body has started.
+    - "/c/<id>" (GET): The same page with another thread active, only its messages are loaded.
+      404 for threads of other users.
+    - "/new" (GET): The same page without an active thread, the first prompt sent starts a new one.
+    - "/history" (GET): JSON page of older chat messages of a thread, used to load history while scrolling up.
+        * Returns 401 if the user is not authenticated, 404 if the thread is not theirs.
+        * Reads the `conversation` id and the opaque `before` cursor (400 if either is malformed) and
+          returns up to CHAT_PAGE_SIZE messages older than it, plus the cursor of the next page (null
+          when there is none).
     - "/chat" (POST): Handles chat prompt submissions.
+        * Redirects to login if the user is not authenticated.
         * Validates the submitted prompt using ChatPromptSchema.
         * If validation fails, flashes error messages and redirects to home.
-        * Queries DeepSeek for a response to the prompt.
-        * Saves the prompt and response as a new Chat entry in the database.
-        * Handles database errors by rolling back and flashing an error message.
-        * Redirects to home after processing.
+        * Refuses the prompt (flash and redirect) when the user has used their TOKEN_QUOTA_DAILY tokens
+          today, before anything is queued or sent upstream (see project.usage).
+        * Continues the thread of the submitted `conversation_id` (404 if not the user's), or the
+          user's latest thread when there is none; starts a new thread titled after the prompt when
+          `new_conversation` is set or the user has none yet. Redirects to that thread afterwards.
+        * With CHAT_QUEUE_ENABLED (set by docker-compose.yml, which runs the workers), queues the prompt as a Job for the background workers
+          (`flask run-worker`) and redirects to home right away; the page polls "/jobs/<id>".
+        * Otherwise, answers inline:
+            - Queries the LLM backends (DeepSeek by default) for a response, sending the recent turns of the
+              thread (see ContextStore) as context.
+            - Saves the prompt, the raw Markdown response and its rendered HTML as a new Chat entry in the database
+              (or the error message when the upstream call failed), with the tokens the upstream billed.
+            - Handles database errors by rolling back and flashing an error message.
+        * Limited by CHAT_RATELIMIT per user, long prompts costing more (see project.ratelimit.chat_cost).
+    - "/chat/stream" (POST): Streams the answer to a chat prompt as Server-Sent Events.
+        * Validates the submitted prompt using ChatPromptSchema (400 with the errors on failure).
+        * 429 with the quota message when the daily token quota is used, before the upstream call.
+        * Continues or starts a thread and sends its recent turns as context, like "/chat".
+        * Relays every content delta of the backend as a `data:` event as soon as it arrives.
+        * Renders the full answer once the upstream stream is finished, saves the Chat entry
+          (raw Markdown, HTML and the token usage the stream reported) and sends a final `done` event with the rendered HTML and the thread id.
+        * Shares the CHAT_RATELIMIT budget of "/chat".
+        * Always answers inline, the job queue does not apply; the page only uses it when the queue is disabled.
+    - "/jobs/<id>" (GET): JSON status of a queued prompt: "queued", "running", "done" with the saved chat,
+      or "failed" with the reason. 401 if not authenticated, 404 for jobs of other users.
     - "/clear" (POST): Clears the user's chat history.
-        * Deletes all chat entries for the current user.
-        * Commits the transaction and flashes a success message.
+        * Deletes all chat entries and threads of the current user, cancels their queued prompts and
+          drops the cached context of their threads.
+        * Deletes in batches of CHAT_DELETE_BATCH_SIZE rows, each committed on its own, so a large
+          history does not hold SQLite's write lock for the whole deletion.
+        * Flashes a success message.
         * Handles errors by rolling back and flashing an error message.
         * Redirects to home after processing.
 Dependencies:
     - Flask (Blueprint, render_template, request, redirect, url_for, flash)
     - flask_login (current_user)
-    - .models (Chat)
-    - .utils (query_deepseek)
+    - .models (Chat, Conversation, Job)
+    - .utils (query_deepseek, stream_deepseek, UpstreamError)
+    - .usage (quota_exceeded, QUOTA_MESSAGE)
     - .db (db)
     - pydantic (ValidationError)
     - .schemas (ChatPromptSchema)
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, stream_with_context, abort, jsonify, current_app, stream_template, get_flashed_messages
 # Blueprint: For modular route organization
 # render_template: To render HTML templates
 # request: To access form data from POST requests
 # redirect, url_for: For redirecting users and generating URLs
 # flash: For displaying feedback messages to users
+# Response, stream_with_context: To stream Server-Sent Events while keeping the request context alive
+# abort, jsonify: To reject unauthenticated or invalid streaming requests
+# current_app: To read the configuration and the conversation context store
+# stream_template, get_flashed_messages: To stream the home page, after popping the flashes
+
+from flask_wtf.csrf import generate_csrf
+# generate_csrf: To store the CSRF token in the session before the home page streams
+
+import json
+# json: To encode the payload of each Server-Sent Event
+
+import base64
+# base64: To encode history cursors as opaque URL-safe strings
+
+from datetime import datetime
+# datetime: To decode the timestamp part of history cursors
 
 from flask_login import current_user
 # current_user: To check authentication and get the current user's ID
 
-from .models import Chat  # Import after db is defined in models.py
+from .models import Chat, Conversation, Job  # Import after db is defined in models.py
 # Chat: The database model for storing chat messages
+# Conversation: The threads grouping the chats
+# Job: Prompts queued for the background workers
 
-from .utils import query_deepseek
+from .utils import query_deepseek, stream_deepseek, UpstreamError
 # query_deepseek: Utility function to get responses from the DeepSeek API
+# stream_deepseek: Utility generator yielding DeepSeek answers token by token
+# UpstreamError: Raised by stream_deepseek when the DeepSeek call fails
 
 from .db import db
 # db: SQLAlchemy database instance for database operations
@@ -55,23 +114,140 @@ from pydantic import ValidationError
 from .schemas import ChatPromptSchema
 # ChatPromptSchema: Pydantic schema for validating chat prompts
 
+from .jobs import enqueue
+# enqueue: Queues a prompt for the background workers
+
+from .db import delete_in_batches
+# delete_in_batches: Clears histories without holding the write lock for the whole deletion
+
+from .extensions import limiter
+# limiter: Per-route rate limits
+
+from sqlalchemy import select
+# select: To list the ids of the threads being cleared
+
+from .ratelimit import chat_cost, user_or_address
+# chat_cost, user_or_address: Cost and key of the chat rate limit
+
+from .usage import quota_exceeded, QUOTA_MESSAGE
+# quota_exceeded, QUOTA_MESSAGE: Daily token quota of the user, checked before the upstream call
+
 
 bp = Blueprint('chat', __name__)
 
 
+def _encode_cursor(chat):
+    # Keyset of the oldest chat of a page, the next page starts right before it
+    raw = f"{chat.timestamp.isoformat()}|{chat.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    timestamp, chat_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(timestamp), int(chat_id)
+
+
+def _owned_conversation(conversation_id):
+    conversation = Conversation.owned_by(conversation_id, current_user.id)
+    if conversation is None:
+        abort(404)
+    return conversation
+
+
+def _prompt_conversation(data):
+    # The thread a prompt continues: the page's, else the latest one, else a new one
+    if data.conversation_id is not None:
+        return _owned_conversation(data.conversation_id)
+    if not data.new_conversation:
+        latest = Conversation.latest(current_user.id)
+        if latest is not None:
+            return latest
+    return Conversation.start(current_user.id, data.prompt)
+
+
+def _threads():
+    return Conversation.for_user(current_user.id, current_app.config["CONVERSATION_LIST_SIZE"])
+
+
+def _render_home(active, threads):
+    chats, has_more, pending = [], False, []
+    if active is not None:
+        # Keys only, the texts are loaded for the cards missing from the fragment cache
+        chats, has_more = Chat.history_page(active.id, current_app.config["CHAT_PAGE_SIZE"], keys_only=True)
+        pending = [(job.prompt, url_for("chat.job_status", job_id=job.id))
+                   for job in Job.pending_for(current_user.id) if job.conversation_id == active.id]
+    older_cursor = _encode_cursor(chats[0]) if has_more else None
+
+    # Both change the session, which is saved with the headers, before the first byte of the body
+    get_flashed_messages(with_categories=True)
+    generate_csrf()
+    # Cards are stitched from cached fragments while the top of the page is already on its way
+    conversation = current_app.extensions["fragment_cache"].cards(chats, Chat.contents)
+    return Response(stream_template("index.html", conversation=conversation, older_cursor=older_cursor,
+                                   threads=threads, active=active, pending=pending,
+                                   queue_enabled=current_app.config["CHAT_QUEUE_ENABLED"]))
+
+
 # Routes
 @bp.route("/")
 def home():
     if not current_user.is_authenticated:
         return redirect(url_for("auth.login"))
 
-    chats = Chat.query.filter_by(user_id=current_user.id).order_by(Chat.timestamp.asc()).all()
-    conversation = [(chat.prompt, chat.response) for chat in chats]
-    return render_template("index.html", conversation=conversation)
+    threads = _threads()
+    # Listed by latest activity, the first thread is the one to continue
+    return _render_home(threads[0] if threads else None, threads)
+
+
+@bp.route("/c/<int:conversation_id>")
+def conversation(conversation_id):
+    if not current_user.is_authenticated:
+        return redirect(url_for("auth.login"))
+
+    return _render_home(_owned_conversation(conversation_id), _threads())
+
+
+@bp.route("/new")
+def new_conversation():
+    if not current_user.is_authenticated:
+        return redirect(url_for("auth.login"))
+
+    return _render_home(None, _threads())
+
+
+@bp.route("/history")
+def history():
+    if not current_user.is_authenticated:
+        abort(401)
+
+    try:
+        before = _decode_cursor(request.args["before"])
+        conversation_id = int(request.args["conversation"])
+    except (KeyError, ValueError):
+        abort(400)
+
+    conversation = _owned_conversation(conversation_id)
+    chats, has_more = Chat.history_page(conversation.id, current_app.config["CHAT_PAGE_SIZE"], before=before)
+    return jsonify(
+        chats=[{"id": chat.id, "prompt": chat.prompt, "response": chat.response} for chat in chats],
+        next=_encode_cursor(chats[0]) if has_more else None,
+    )
+
+
+def _chat_limit():
+    return current_app.config["CHAT_RATELIMIT"]
+
+
+# One budget for both chat routes, streaming must not double the allowance
+chat_limit = limiter.shared_limit(_chat_limit, scope="chat", key_func=user_or_address, cost=chat_cost)
 
 
 @bp.route("/chat", methods=["POST"])
+@chat_limit
 def chat():
+    if not current_user.is_authenticated:
+        return redirect(url_for("auth.login"))
+
     try:
         data = ChatPromptSchema(**request.form)
     except ValidationError as e:
@@ -79,16 +255,35 @@ def chat():
             flash(err["msg"], "error")
         return redirect(url_for("chat.home"))
 
+    if quota_exceeded(current_user.id):
+        flash(QUOTA_MESSAGE, "error")
+        return redirect(url_for("chat.home"))
+
+    conversation_id = _prompt_conversation(data).id
+    if current_app.config["CHAT_QUEUE_ENABLED"]:
+        try:
+            enqueue(current_user.id, data.prompt, conversation_id)
+        except Exception:
+            db.session.rollback()
+            flash("Something went wrong while sending the prompt.", "error")
+        return redirect(url_for("chat.conversation", conversation_id=conversation_id))
+
     try:
-        # Get response from DeepSeek
-        answer = query_deepseek(data.prompt)
+        # Get response from DeepSeek, with the recent turns of the thread
+        history = current_app.extensions["chat_context"].history(conversation_id)
+        completion = query_deepseek(data.prompt, history)
 
         # Save chat
         new_chat = Chat(
             user_id=current_user.id,
+            conversation_id=conversation_id,
             prompt=data.prompt,
-            response=answer,
         )
+        if completion.ok:
+            new_chat.set_answer(completion.content)
+            new_chat.set_usage(completion.usage)
+        else:
+            new_chat.set_error(completion.content)
         db.session.add(new_chat)
         db.session.commit()
 
@@ -96,14 +291,114 @@ def chat():
         db.session.rollback()
         flash("Something went wrong while saving the chat.", "error")
 
-    return redirect(url_for("chat.home"))
+    return redirect(url_for("chat.conversation", conversation_id=conversation_id))
+
+
+def _sse(data, event=None):
+    # Format a single Server-Sent Event frame
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+def _relay(stream, parts):
+    # Relay every delta as an event, keeping it in `parts`; returns what the stream returns (its usage)
+    while True:
+        try:
+            delta = next(stream)
+        except StopIteration as stop:
+            return stop.value
+        parts.append(delta)
+        yield _sse({"delta": delta})
+
+
+@bp.route("/chat/stream", methods=["POST"])
+@chat_limit
+def chat_stream():
+    if not current_user.is_authenticated:
+        abort(401)
+
+    try:
+        data = ChatPromptSchema(**request.form)
+    except ValidationError as e:
+        return jsonify(errors=[err["msg"] for err in e.errors()]), 400
+
+    if quota_exceeded(current_user.id):
+        return jsonify(errors=[QUOTA_MESSAGE]), 429
+
+    # Resolve the user and the thread before streaming, the generator outlives the view function
+    user_id = current_user.id
+    conversation_id = _prompt_conversation(data).id
+    history = current_app.extensions["chat_context"].history(conversation_id)
+
+    def generate():
+        parts = []
+        error = None
+        usage = None
+        try:
+            usage = yield from _relay(stream_deepseek(data.prompt, history), parts)
+        except UpstreamError as e:
+            error = str(e)
+            yield _sse({"delta": error})
+
+        try:
+            # Save chat once the whole answer is known
+            new_chat = Chat(
+                user_id=user_id,
+                conversation_id=conversation_id,
+                prompt=data.prompt,
+            )
+            if error is None:
+                new_chat.set_answer("".join(parts))
+                new_chat.set_usage(usage)
+            else:
+                new_chat.set_error(error)
+            html = new_chat.response
+            db.session.add(new_chat)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            yield _sse({"error": "Something went wrong while saving the chat."}, event="error")
+            return
+
+        yield _sse({"html": html, "conversation": conversation_id}, event="done")
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    # Ask proxies not to cache or buffer the event stream
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@bp.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    if not current_user.is_authenticated:
+        abort(401)
+
+    job = db.session.get(Job, job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+
+    chat = db.session.get(Chat, job.chat_id) if job.status == Job.DONE else None
+    return jsonify(
+        id=job.id,
+        status=job.status,
+        chat={"id": chat.id, "prompt": chat.prompt, "response": chat.response} if chat else None,
+        error=job.error if job.status == Job.FAILED else None,
+    )
 
 
 @bp.route("/clear", methods=["POST"])
 def clear_chat():
     try:
-        Chat.query.filter_by(user_id=current_user.id).delete()
-        db.session.commit()
+        batch_size = current_app.config["CHAT_DELETE_BATCH_SIZE"]
+        jobs, chats, conversations = Job.__table__.c, Chat.__table__.c, Conversation.__table__.c
+        thread_ids = db.session.execute(select(conversations.id).where(conversations.user_id == current_user.id)).scalars().all()
+        # Running jobs are left to finish, their worker holds them
+        delete_in_batches(Job.__table__, (jobs.user_id == current_user.id) & (jobs.status != Job.RUNNING), batch_size)
+        delete_in_batches(Chat.__table__, chats.user_id == current_user.id, batch_size)
+        delete_in_batches(Conversation.__table__, conversations.user_id == current_user.id, batch_size)
+        for thread_id in thread_ids:
+            current_app.extensions["chat_context"].invalidate(thread_id)
         flash("Chat history cleared", "success")
     except Exception:
         db.session.rollback()
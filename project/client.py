@@ -0,0 +1,83 @@
+"""
+client.py
+This module defines the long-lived HTTP client used to talk to the DeepSeek API.
+Classes:
+    DeepSeekClient:
+        Owns a `requests.Session` whose connection pool keeps TCP/TLS connections to the
+        upstream alive between prompts, so only the first request of a worker pays the handshake.
+        Attributes:
+            url (str): Chat completion endpoint.
+            api_key (str): Bearer token sent with every request.
+            model (str): Model name sent with every request.
+            timeout (tuple): (connect, read) timeouts in seconds.
+            session (requests.Session): Pooled session shared by every request of the worker.
+        Methods:
+            from_config(config): Class method building a client from the Flask config.
+            post(payload, stream=False): Sends a completion request and returns the `requests.Response`.
+            close(): Closes every pooled connection.
+Notes:
+    - One client is created per worker process by `create_app` and stored in
+      `app.extensions["deepseek"]`.
+    - The pool size should match the number of gunicorn threads, otherwise threads queue
+      for a free connection.
+    - Retries with exponential backoff cover connection errors and 429/503 answers, the answers that
+      say the request was refused before any work. Read timeouts, other errors after the request was
+      sent, and other 5xx (500, 502 and 504 from a proxy) are not retried: the upstream may still be
+      generating (and billing) the answer, and a retry would wait another read timeout on top.
+"""
+
+import requests
+# requests: Session object providing connection pooling and keep-alive
+
+from requests.adapters import HTTPAdapter
+# HTTPAdapter: Transport adapter holding the urllib3 connection pool
+
+from urllib3.util.retry import Retry
+# Retry: urllib3 retry policy with exponential backoff
+
+
+class DeepSeekClient:
+    def __init__(self, url, api_key, model, pool_size=10, connect_timeout=5, read_timeout=30,
+                 max_retries=2, retry_backoff=0.5):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=max_retries,
+            read=0,                               # A sent completion is never sent again on a read error
+            other=0,
+            backoff_factor=retry_backoff,
+            status_forcelist=(429, 503),          # Refused before any generation started
+            allowed_methods=frozenset({"POST"}),  # Completion requests are POSTs
+            raise_on_status=False,                # Hand the last error response back to the caller
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+        })
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            url=config["DEEPSEEK_API_URL"],
+            api_key=config["DEEPSEEK_API_KEY"],
+            model=config["DEEPSEEK_MODEL"],
+            pool_size=config["DEEPSEEK_POOL_SIZE"],
+            connect_timeout=config["DEEPSEEK_CONNECT_TIMEOUT"],
+            read_timeout=config["DEEPSEEK_READ_TIMEOUT"],
+            max_retries=config["DEEPSEEK_MAX_RETRIES"],
+            retry_backoff=config["DEEPSEEK_RETRY_BACKOFF"],
+        )
+
+    def post(self, payload, stream=False):
+        return self.session.post(self.url, json=payload, timeout=self.timeout, stream=stream)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,154 @@
+"""
+coalesce.py
+This module deduplicates concurrent identical upstream calls ("single flight"): while one request is
+fetching the answer to a prompt, the requests asking the same thing wait for it and share its result
+instead of calling DeepSeek again.
+Classes:
+    SingleFlight:
+        Runs at most one call per key at a time.
+        - Within a worker, followers wait on an Event set by the leading thread and receive its result
+          (or its exception).
+        - Across workers, when a lock file is configured, the leading thread also holds a row of an
+          `inflight` table. Leaders of other workers then poll that row and, once it is released, read
+          the answer from the shared completion cache with `lookup()`. When the answer is not there
+          (the call failed, errors are not cached) they try to lead themselves.
+        Parameters:
+            lock_path (str or None): SQLite file of the lock table (None coalesces within the worker only).
+            timeout (float): Seconds a lock is held at most, and a worker waits for another worker.
+            poll_interval (float): Seconds between two checks of a lock held by another worker.
+        Methods:
+            from_config(config): Class method building it from the Flask config.
+            do(key, fn, lookup=None): Returns fn(), or the result of the identical call in flight.
+            stats(): Returns the number of upstream calls made and of requests served by another call.
+Notes:
+    - Locks expire after `timeout` seconds, so a worker killed while leading does not block the key.
+    - Cross-worker coalescing needs the shared cache tier (COMPLETION_CACHE_PATH), it is how the
+      answer travels between workers.
+"""
+
+import threading
+# threading: Events the followers wait on, lock protecting the in-flight map
+
+import time
+# time: Lock expiry and polling deadlines
+
+import uuid
+# uuid: Owner token of a lock row
+
+from .shared_sqlite import SharedSQLite
+# SharedSQLite: Per-thread connections to the SQLite file shared by the workers
+
+from .metrics import COALESCED_REQUESTS
+# COALESCED_REQUESTS: Leader/follower counter aggregated across workers
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS inflight ("
+        "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);"
+    )
+
+    def __init__(self, lock_path=None, timeout=30, poll_interval=0.05):
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._db = SharedSQLite(lock_path, self.SCHEMA) if lock_path else None
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            lock_path=config.get("COALESCE_LOCK_PATH") or config.get("COMPLETION_CACHE_PATH"),
+            timeout=config["COALESCE_TIMEOUT"],
+        )
+
+    def do(self, key, fn, lookup=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            self._count(shared=True)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_shared(key, fn, lookup)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def _run_shared(self, key, fn, lookup):
+        if self._db is None or lookup is None:
+            self._count(shared=False)
+            return fn()
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            owner = self._acquire(key)
+            if owner is not None:
+                try:
+                    self._count(shared=False)
+                    return fn()
+                finally:
+                    self._release(key, owner)
+
+            # Another worker is fetching it, wait for its answer to land in the shared cache
+            while self._held(key) and time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+            result = lookup()
+            if result is not None:
+                self._count(shared=True)
+                return result
+            if time.monotonic() >= deadline:
+                self._count(shared=False)
+                return fn()
+
+    def _acquire(self, key):
+        owner = uuid.uuid4().hex
+        now = time.time()
+        # Inserts the lock, or takes over an expired one; returns no row when it is held
+        row = self._db.connection().execute(
+            "INSERT INTO inflight (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE inflight.expires_at <= ? RETURNING owner",
+            (key, owner, now + self.timeout, now),
+        ).fetchone()
+        return owner if row else None
+
+    def _held(self, key):
+        return self._db.connection().execute(
+            "SELECT 1 FROM inflight WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone() is not None
+
+    def _release(self, key, owner):
+        self._db.connection().execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner))
+
+    def _count(self, shared):
+        COALESCED_REQUESTS.labels(role="follower" if shared else "leader").inc()
+        with self._lock:
+            if shared:
+                self.shared += 1
+            else:
+                self.calls += 1
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared}
@@ -8,10 +8,89 @@ Classes:
 Config class attributes:
     SECRET_KEY (str): Secret key for session management and CSRF protection.
     DEEPSEEK_API_KEY (str): API key for DeepSeek integration, loaded from environment.
+    DEEPSEEK_API_URL (str): Chat completion endpoint, overridable to point at a proxy or a local fake server.
+    DEEPSEEK_MODEL (str): Model name sent with every completion request.
+    DEEPSEEK_POOL_SIZE (int): Maximum pooled keep-alive connections to DeepSeek per worker (match gunicorn threads).
+    DEEPSEEK_CONNECT_TIMEOUT (float): Seconds allowed to open a connection to DeepSeek.
+    DEEPSEEK_READ_TIMEOUT (float): Seconds allowed between bytes of a DeepSeek answer.
+    DEEPSEEK_MAX_RETRIES (int): Retries on connection errors and 429/5xx answers.
+    DEEPSEEK_RETRY_BACKOFF (float): Exponential backoff factor between retries, in seconds.
+    LLM_PROVIDERS (list): Backends answering the prompts, from the comma-separated env variable:
+        "deepseek", "openai" (any OpenAI-compatible endpoint) and "stub" (local echo, no network).
+        With several, each call goes to the fastest healthy one and fails over to the others.
+    OPENAI_COMPAT_API_URL (str): Chat completion endpoint of the "openai" backend; it shares the
+        DEEPSEEK_* pool, timeout and retry settings.
+    OPENAI_COMPAT_API_KEY (str): Bearer token of the "openai" backend.
+    OPENAI_COMPAT_MODEL (str): Model name sent to the "openai" backend.
+    STUB_PROVIDER_LATENCY (float): Seconds the "stub" backend takes to answer.
+    LLM_ROUTER_WINDOW (int): Last calls per backend whose latency and outcome drive the routing.
+    LLM_ROUTER_ERROR_RATE (float): Error rate over the window making a backend unhealthy (tried last).
+    LLM_ROUTER_COOLDOWN (float): Seconds after its last error an unhealthy backend is tried first again.
+    CIRCUIT_BREAKER_ENABLED (bool): Backends failing CIRCUIT_BREAKER_THRESHOLD times in a row are not called
+        for CIRCUIT_BREAKER_RESET_TIMEOUT seconds, then probed with a single call.
+    CIRCUIT_BREAKER_PATH (str): SQLite file of the circuit states, shared by all workers (default: instance/).
+    CIRCUIT_BREAKER_THRESHOLD (int): Consecutive failures (errors, timeouts, 429/5xx) opening a circuit.
+    CIRCUIT_BREAKER_RESET_TIMEOUT (float): Seconds an open circuit waits before a probe call.
+    HEDGE_ENABLED (bool): Sends a second attempt of a completion not answered within the backend's p95 latency.
+    HEDGE_MIN_DELAY (float): Minimum seconds before a second attempt is sent.
+    HEDGE_WORKERS (int): Threads per worker process running hedged attempts. Defaults to twice
+        GUNICORN_THREADS (100), so every request thread can run both of its attempts; when the pool is
+        busy, completions run unhedged on the request thread.
     SQLALCHEMY_DATABASE_URI (str): Database URI for SQLAlchemy and Flask-Login.
+    SQLALCHEMY_ENGINE_OPTIONS (dict): Engine options; the connection pool of each worker process
+        (DB_POOL_SIZE connections kept, DB_MAX_OVERFLOW more under load, DB_POOL_TIMEOUT seconds to wait
+        for one). An in-memory SQLite database needs `{}` here, it uses a static pool.
+    SQLITE_PRAGMAS (dict): Pragmas run on every new SQLite connection (WAL journal, synchronous=NORMAL,
+        SQLITE_BUSY_TIMEOUT milliseconds of busy_timeout, SQLITE_MMAP_SIZE bytes of mmap_size and
+        SQLITE_CACHE_SIZE of cache_size, negative meaning KiB). `{}` keeps SQLite's defaults.
+    PASSWORD_HASH_METHOD (str): Werkzeug hash method and cost of new password hashes, e.g. "scrypt:32768:8:1"
+        or "pbkdf2:sha256:600000"; stored hashes made with other parameters are upgraded on login.
+    PASSWORD_HASH_WORKERS (int): Password hashes computed concurrently per worker process.
+    PASSWORD_HASH_MAX_PENDING (int): Password hashes running or waiting per worker before logins get a 503.
+    USER_CACHE_TTL (float): Seconds a logged-in user's identity is served from the per-process cache.
+    USER_CACHE_SIZE (int): Identities kept in the per-process user cache (LRU).
+    COMPLETION_CACHE_ENABLED (bool): Serves repeated prompts from the completion cache instead of calling DeepSeek.
+    COMPLETION_CACHE_SIZE (int): Maximum entries of the in-process LRU tier.
+    COMPLETION_CACHE_TTL (int): Seconds a cached answer stays valid.
+    COMPLETION_CACHE_PATH (str or None): SQLite file of the tier shared by all workers (None disables it).
+    COALESCE_ENABLED (bool): Concurrent identical prompts share one upstream call instead of one each.
+    COALESCE_LOCK_PATH (str or None): SQLite file of the lock table coalescing calls across workers
+        (defaults to COMPLETION_CACHE_PATH; with neither, calls are coalesced within each worker only).
+    COALESCE_TIMEOUT (float): Seconds a worker waits for another worker's call, and a lock is held at most.
+    MARKDOWN_RENDERER (str): Markdown backend used to render answers, "markdown2" or "markdown-it".
+    CHAT_CONTEXT_TOKEN_BUDGET (int): Estimated tokens of prior turns sent with a prompt (0 disables context).
+    CHAT_CONTEXT_MAX_TURNS (int): Maximum prior turns considered for the context window.
+    CHAT_CONTEXT_WINDOWS (int): Conversation windows kept in memory per worker (LRU).
+    CHAT_QUEUE_ENABLED (bool): "/chat" queues prompts for the background workers (`flask run-worker`)
+        instead of calling DeepSeek inline. Off by default, so `flask run` alone answers (and streams)
+        prompts; docker-compose.yml turns it on for the web service next to its worker service.
+    JOB_WORKER_THREADS (int): Prompts answered concurrently by one `flask run-worker` process; over all
+        worker processes, the cap on concurrent upstream calls.
+    JOB_POLL_INTERVAL (float): Seconds an idle worker thread waits before looking for queued prompts again.
+    JOB_LEASE_SECONDS (int): Seconds after which a running job whose worker died is claimed again.
+    JOB_MAX_ATTEMPTS (int): Claims of a job before it is marked failed.
+    CHAT_DELETE_BATCH_SIZE (int): Rows deleted per transaction when a history is cleared.
+    BACKUP_DIR (str): Directory `flask backup-db` writes the backups of the SQLite database to (default: backups/).
+    CHAT_PAGE_SIZE (int): Number of exchanges rendered on the home page and returned per older history page.
+    CHAT_FRAGMENT_CACHE_SIZE (int): Rendered history cards kept in memory per worker (LRU).
+    CONVERSATION_LIST_SIZE (int): Most recently active threads listed in the sidebar of the home page.
+    SEARCH_PAGE_SIZE (int): Results per page of the chat history search.
+    EXPORT_BATCH_SIZE (int): Rows read from the database per compressed chunk of a history download.
+    TOKEN_QUOTA_DAILY (int): Tokens (prompt and completion) a user may use per UTC day; prompts are refused
+        once they are used. 0 disables the quota.
+    TOKEN_PRICE_PROMPT, TOKEN_PRICE_COMPLETION (float): Prices per million prompt and completion tokens,
+        for the cost estimates of the usage page (0 for both hides them).
+    USAGE_DAYS (int): Days listed on the usage page.
     RATELIMIT_DEFAULT (str): Default rate limit policy (e.g., "30 per hour").
     SQLALCHEMY_TRACK_MODIFICATIONS (bool): Flag to disable SQLAlchemy modification tracking.
-    RATELIMIT_STORAGE_URI (str): URI for rate limit storage backend (default: in-memory).
+    RATELIMIT_STORAGE_URI (str): URI for rate limit storage backend (default: SQLite file in instance/,
+        shared by all gunicorn workers; "memory://" gives each worker its own counters).
+    CHAT_RATELIMIT (str): Limit of the /chat and /chat/stream routes, replacing RATELIMIT_DEFAULT there.
+    CHAT_RATELIMIT_COST_CHARS (int): Prompt characters per extra unit of cost against CHAT_RATELIMIT.
+    LOGIN_RATELIMIT (str): Limit of login attempts (POST /login), per client address and per username.
+    METRICS_ENABLED (bool): Instruments requests and serves Prometheus metrics on /metrics.
+    METRICS_TOKEN (str): When set, /metrics requires `Authorization: Bearer <token>` (401 otherwise), for
+        deployments where the app's port is reachable by more than the scraper. Empty by default.
     WTF_CSRF_ENABLED (bool): Enables CSRF protection for Flask-WTF forms.
     WTF_CSRF_TIME_LIMIT (int or None): Time limit for CSRF tokens (None disables expiration).
 """
@@ -20,12 +99,85 @@ import os
 
 load_dotenv()
 
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance")
+
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY") or "dev-key-123"
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
+    DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL") or "https://api.deepseek.com/v1/chat/completions"
+    DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL") or "deepseek-chat"
+    DEEPSEEK_POOL_SIZE = int(os.getenv("DEEPSEEK_POOL_SIZE", "100"))
+    DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv("DEEPSEEK_CONNECT_TIMEOUT", "5"))
+    DEEPSEEK_READ_TIMEOUT = float(os.getenv("DEEPSEEK_READ_TIMEOUT", "30"))
+    DEEPSEEK_MAX_RETRIES = int(os.getenv("DEEPSEEK_MAX_RETRIES", "2"))
+    DEEPSEEK_RETRY_BACKOFF = float(os.getenv("DEEPSEEK_RETRY_BACKOFF", "0.5"))
+    LLM_PROVIDERS = [name.strip() for name in (os.getenv("LLM_PROVIDERS") or "deepseek").split(",") if name.strip()]
+    OPENAI_COMPAT_API_URL = os.getenv("OPENAI_COMPAT_API_URL") or "https://api.openai.com/v1/chat/completions"
+    OPENAI_COMPAT_API_KEY = os.getenv("OPENAI_COMPAT_API_KEY")
+    OPENAI_COMPAT_MODEL = os.getenv("OPENAI_COMPAT_MODEL") or "gpt-4o-mini"
+    STUB_PROVIDER_LATENCY = float(os.getenv("STUB_PROVIDER_LATENCY", "0"))
+    LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "50"))
+    LLM_ROUTER_ERROR_RATE = float(os.getenv("LLM_ROUTER_ERROR_RATE", "0.5"))
+    LLM_ROUTER_COOLDOWN = float(os.getenv("LLM_ROUTER_COOLDOWN", "30"))
+    CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+    CIRCUIT_BREAKER_PATH = os.getenv("CIRCUIT_BREAKER_PATH") or os.path.join(INSTANCE_DIR, "circuits.db")
+    CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5"))
+    CIRCUIT_BREAKER_RESET_TIMEOUT = float(os.getenv("CIRCUIT_BREAKER_RESET_TIMEOUT", "30"))
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1"))
+    HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS") or 2 * int(os.getenv("GUNICORN_THREADS", "100")))
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URI") # For Flask-Login
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "80")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    }
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "15000")),
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+        "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    }
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD") or "scrypt:32768:8:1"
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() == "true"
+    COMPLETION_CACHE_SIZE = int(os.getenv("COMPLETION_CACHE_SIZE", "1024"))
+    COMPLETION_CACHE_TTL = int(os.getenv("COMPLETION_CACHE_TTL", "3600"))
+    COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH")
+    COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+    COALESCE_LOCK_PATH = os.getenv("COALESCE_LOCK_PATH")
+    COALESCE_TIMEOUT = float(os.getenv("COALESCE_TIMEOUT", "60"))
+    MARKDOWN_RENDERER = os.getenv("MARKDOWN_RENDERER") or "markdown2"
+    CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "3000"))
+    CHAT_CONTEXT_MAX_TURNS = int(os.getenv("CHAT_CONTEXT_MAX_TURNS", "20"))
+    CHAT_CONTEXT_WINDOWS = int(os.getenv("CHAT_CONTEXT_WINDOWS", "1024"))
+    CHAT_QUEUE_ENABLED = os.getenv("CHAT_QUEUE_ENABLED", "false").lower() == "true"
+    JOB_WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", "8"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+    JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    CHAT_DELETE_BATCH_SIZE = int(os.getenv("CHAT_DELETE_BATCH_SIZE", "1000"))
+    BACKUP_DIR = os.getenv("BACKUP_DIR") or os.path.join(os.path.dirname(INSTANCE_DIR), "backups")
+    CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "20"))
+    CHAT_FRAGMENT_CACHE_SIZE = int(os.getenv("CHAT_FRAGMENT_CACHE_SIZE", "10000"))
+    CONVERSATION_LIST_SIZE = int(os.getenv("CONVERSATION_LIST_SIZE", "50"))
+    SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+    TOKEN_QUOTA_DAILY = int(os.getenv("TOKEN_QUOTA_DAILY", "0"))
+    TOKEN_PRICE_PROMPT = float(os.getenv("TOKEN_PRICE_PROMPT", "0"))
+    TOKEN_PRICE_COMPLETION = float(os.getenv("TOKEN_PRICE_COMPLETION", "0"))
+    USAGE_DAYS = int(os.getenv("USAGE_DAYS", "30"))
     RATELIMIT_DEFAULT = "30 per hour"              # Rate limiting
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    RATELIMIT_STORAGE_URI = "memory://"
+    RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI") or f"sqlite:///{os.path.join(INSTANCE_DIR, 'ratelimit.db')}"
+    CHAT_RATELIMIT = os.getenv("CHAT_RATELIMIT") or "20 per hour"
+    CHAT_RATELIMIT_COST_CHARS = int(os.getenv("CHAT_RATELIMIT_COST_CHARS", "500"))
+    LOGIN_RATELIMIT = os.getenv("LOGIN_RATELIMIT") or "5 per minute"
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = None
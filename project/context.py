@@ -0,0 +1,129 @@
+"""
+context.py
+This module maintains the conversation context sent to the LLM with every prompt: the most recent
+exchanges of the thread the prompt belongs to, truncated to a token budget.
+Functions:
+    estimate_tokens(text): Approximates the number of tokens of a text (about 4 characters per token).
+Classes:
+    ConversationWindow:
+        The most recent turns of one conversation, oldest first, evicting the oldest turns as soon as
+        their total estimated tokens exceed the budget. Tokens are estimated once per turn, when it
+        enters the window.
+    ContextStore:
+        Per-process LRU of windows keyed by conversation (thread). On every prompt the window is synchronised with
+        the database by reading only the chats saved after the newest turn it holds, so history is
+        neither re-queried nor re-tokenized as a whole.
+        Methods:
+            from_config(config): Class method building the store from the Flask config.
+            history(conversation_id): Returns the window as a list of chat completion messages.
+            invalidate(conversation_id): Drops the window of a thread (e.g. after clearing the history).
+Notes:
+    - Only chats holding a raw Markdown answer are used, failed requests and legacy rows are skipped.
+    - Older turns are truncated, not summarized.
+    - The keyset of the newest turn is re-read on every sync; when it disappeared (history cleared by
+      another worker) the window is rebuilt from the database.
+"""
+
+import threading
+# threading: Lock protecting the store, shared by the worker's request threads
+
+from collections import OrderedDict, deque
+# OrderedDict: LRU of windows, deque: turns of a window
+
+from sqlalchemy import tuple_
+# tuple_: Row-value comparison to read only the chats after the newest turn of a window
+
+from .models import Chat
+# Chat: The chat model the windows are built from
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class ConversationWindow:
+    def __init__(self, budget):
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.turns = deque()
+        self.tokens = 0
+        self.last_key = None  # (timestamp, id) of the newest chat seen
+
+    def append(self, chat):
+        self.last_key = (chat.timestamp, chat.id)
+        if chat.raw_response is None:
+            return
+        tokens = estimate_tokens(chat.prompt) + estimate_tokens(chat.raw_response)
+        self.turns.append((chat.prompt, chat.raw_response, tokens))
+        self.tokens += tokens
+        while self.turns and self.tokens > self.budget:
+            self.tokens -= self.turns.popleft()[2]
+
+    def messages(self):
+        messages = []
+        for prompt, answer, _ in self.turns:
+            messages.append({"role": "user", "content": prompt})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+
+class ContextStore:
+    def __init__(self, budget=3000, max_turns=20, max_windows=1024):
+        self.budget = budget
+        self.max_turns = max_turns
+        self.max_windows = max_windows
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            budget=config["CHAT_CONTEXT_TOKEN_BUDGET"],
+            max_turns=config["CHAT_CONTEXT_MAX_TURNS"],
+            max_windows=config["CHAT_CONTEXT_WINDOWS"],
+        )
+
+    def _load(self, conversation_id, window):
+        window.reset()
+        chats, _ = Chat.history_page(conversation_id, self.max_turns)
+        for chat in chats:
+            window.append(chat)
+
+    def _sync(self, conversation_id, window):
+        # Newest known chat plus anything saved after it, by the (conversation_id, timestamp) index
+        columns = Chat.__table__.c
+        chats = (Chat.query
+                 .filter(columns.conversation_id == conversation_id,
+                         tuple_(columns.timestamp, columns.id) >= tuple_(*window.last_key))
+                 .order_by(columns.timestamp, columns.id)
+                 .limit(self.max_turns + 1)
+                 .all())
+        if not chats or chats[0].id != window.last_key[1] or len(chats) > self.max_turns:
+            return False  # History changed under us or too much is new, rebuild
+        for chat in chats[1:]:
+            window.append(chat)
+        return True
+
+    def history(self, conversation_id):
+        if self.budget <= 0:
+            return []
+
+        with self._lock:
+            window = self._windows.get(conversation_id)
+            if window is None:
+                window = self._windows[conversation_id] = ConversationWindow(self.budget)
+                while len(self._windows) > self.max_windows:
+                    self._windows.popitem(last=False)
+            self._windows.move_to_end(conversation_id)
+
+        with window.lock:
+            if window.last_key is None or not self._sync(conversation_id, window):
+                self._load(conversation_id, window)
+            return window.messages()
+
+    def invalidate(self, conversation_id):
+        with self._lock:
+            self._windows.pop(conversation_id, None)
@@ -6,16 +6,65 @@ these commands with the Flask app.
 Modules and Objects:
 --------------------
 - db: SQLAlchemy database instance for ORM operations.
+- migrate: Flask-Migrate instance exposing the `flask db ...` Alembic commands; revisions live
+    in the top-level `migrations/` directory.
 CLI Commands:
 -------------
 - init_db: Creates all database tables based on the defined models.
 - delete_tables: Drops all tables from the database.
 - reset_tables_command: Drops all tables, removes the Alembic version table if it exists,
     and recreates all tables. Intended for development use only.
+- rerender_chats: Re-renders stored answers from their raw Markdown with the configured renderer,
+    in chunks of `--batch-size` rows committed one by one. Only rows stamped with another
+    renderer version are touched unless `--all` is given.
+- rebuild_search_index: Re-indexes every chat in the full-text search index (see project.search),
+    `--batch-size` chats per transaction, creating the index first if the database has none.
+- prune_chats: Retention policy, deletes the chats of all users older than `--days` days (and the
+    finished jobs of that age) with `delete_in_batches`, pausing `--pause` seconds between batches.
+    Threads with no activity since the cutoff are deleted too, the message counts of the other threads
+    that lost chats are recomputed. Threads with a prompt queued or running are left whole, their job
+    would answer into a deleted thread.
+- backup_db: Online backup of the live SQLite database to BACKUP_DIR (or `--dir`) with the SQLite backup
+    API, `--pages` pages per step and `--pause` seconds between steps, gzip-compressed unless
+    `--no-compress`, keeping the `--keep` most recent backups of the database. Reports how long each
+    step held the source (p50, p95, max) and how many times concurrent writes restarted the copy.
+- verify_backup_command (`verify-backup PATH`): Runs an integrity check on a backup and counts its users,
+    threads and chats.
+- restore_db (`restore-db PATH`): Verifies a backup, then copies it over the live database. The workers
+    should be stopped first: the copy locks the database for writing and their caches would be stale.
 Functions:
 ----------
+- delete_in_batches(table, condition, batch_size=1000, pause=0.0, collect=None): Deletes the rows of a
+    table matching a condition, at most `batch_size` rows per transaction, and returns how many were
+    deleted. With `collect`, a (column, set) pair, the value of that column of every deleted row is
+    added to the set (DELETE ... RETURNING), without a separate scan.
+    Each commit releases SQLite's write lock, so other writers get in between the batches instead of
+    waiting for one giant DELETE. The search index follows the deleted chats through its triggers.
+- backup_database(source, destination, pages=256, pause=0.005, max_restarts=3): Copies a SQLite connection
+    into another with the online backup API, `pages` pages per step, and returns the number of pages,
+    the duration of every step, the restarts and the total time. The source is locked only during a
+    step; a write by another connection restarts the copy at the next step, after `max_restarts`
+    restarts the rest is copied in one step (one read snapshot, which writers do not wait for in WAL mode).
+    The destination is written without fsync (journal in memory), the caller syncs it once the source is released.
+- rotate_backups(directory, stem, keep): Deletes the backups of a database but the `keep` most recent.
+- verify_backup(path): Returns the integrity check result, the row counts and the schema revision of
+    a backup (.db or .db.gz).
 - init_app(app): Initializes the database and migration objects with the Flask app,
-    and registers the CLI commands for database management.
+    registers the CLI commands for database management and applies the SQLite profile.
+- apply_sqlite_pragmas(engine, pragmas): Runs `PRAGMA name=value` for every entry of `pragmas` on each
+    new connection of a SQLite engine.
+SQLite profile:
+---------------
+- SQLITE_PRAGMAS (see Config) is applied to every connection: WAL journal so readers never block the
+    writer, synchronous=NORMAL (durable at checkpoints, safe with WAL), a busy_timeout so writers of the
+    other workers wait for the lock instead of failing with "database is locked", mmap_size and cache_size.
+- SQLALCHEMY_ENGINE_OPTIONS sizes the connection pool for the gthread workers.
+Migrations:
+-----------
+- A new database can be created with `flask db upgrade` (or `flask init-db` for the latest schema
+  without Alembic history).
+- A database created with `init-db` before migrations existed is adopted with
+  `flask db stamp 0001_initial_schema` followed by `flask db upgrade`.
 Usage:
 ------
 Import and call `init_app(app)` in your Flask application factory to enable database
@@ -32,18 +81,58 @@ Example:
 from flask_sqlalchemy import SQLAlchemy
 # SQLAlchemy: Provides ORM capabilities for database operations in Flask
 
-from sqlalchemy import text
+from sqlalchemy import text, select, update, delete, bindparam, or_
 # text: Allows execution of raw SQL statements (used for dropping alembic_version table)
+# select, update, bindparam, or_: Used to re-render chats in chunks with bulk updates
+# delete: Used to delete rows in bounded batches
+
+import time
+# time: Pause between deletion batches and backup steps, duration of the steps
+
+from datetime import datetime, timedelta, timezone
+# datetime, timedelta, timezone: Retention cutoff of prune-chats, names of the backups
 
 import click
 # click: Used to create command-line interface (CLI) commands for Flask
 
+from flask import current_app
+# current_app: To read BACKUP_DIR
+
 from flask.cli import with_appcontext
 # with_appcontext: Ensures CLI commands run within the Flask application context
 
+from flask_migrate import Migrate
+# Migrate: Alembic integration providing the `flask db` commands
+
+import os
+# os: Used to locate the migrations directory independently of the working directory
+
+import sqlite3
+# sqlite3: Identifies SQLite DBAPI connections, online backup API
+
+import gzip
+# gzip: Compressed backups
+
+import shutil
+# shutil: Streams backups through gzip
+
+import tempfile
+# tempfile: Decompressed copy of a backup while it is verified or restored
+
+from contextlib import contextmanager
+# contextmanager: Opens a backup, compressed or not, as a plain database file
+
+from sqlalchemy import event
+# event: Connect hook applying the SQLite pragmas
+
 db = SQLAlchemy()
 # db: SQLAlchemy database instance used throughout the app for ORM operations
 
+migrate = Migrate()
+# migrate: Flask-Migrate instance managing schema revisions
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
 
 @click.command("init-db")
 @with_appcontext
@@ -68,15 +157,347 @@ def reset_tables_command():
     db.drop_all()
     db.create_all()
     print("Database dropped and re-created.")
-    
 
 
+@click.command("rerender-chats")
+@click.option("--batch-size", default=500, show_default=True, help="Rows re-rendered per transaction.")
+@click.option("--all", "rerender_all", is_flag=True, help="Re-render rows already stamped with the current version.")
+@with_appcontext
+def rerender_chats(batch_size, rerender_all):
+    """Re-render stored answers from their raw Markdown."""
+    from .models import Chat
+    from .rendering import render_markdown, renderer_version
+
+    chats = Chat.__table__
+    version = renderer_version()
+    stale = chats.c.raw_response.isnot(None)
+    if not rerender_all:
+        stale = stale & or_(chats.c.render_version.is_(None), chats.c.render_version != version)
+
+    statement = (
+        update(chats)
+        .where(chats.c.id == bindparam("chat_id"))
+        .values(response=bindparam("html"), render_version=version)
+    )
+    last_id, total = 0, 0
+    while True:
+        # Walk the primary key so every chunk is an index range, whatever was already updated
+        rows = db.session.execute(
+            select(chats.c.id, chats.c.raw_response)
+            .where(stale, chats.c.id > last_id)
+            .order_by(chats.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.execute(statement, [{"chat_id": row.id, "html": render_markdown(row.raw_response)} for row in rows])
+        db.session.commit()
+        last_id = rows[-1].id
+        total += len(rows)
+    print(f"Re-rendered {total} chats with {version}.")
+
+
+@click.command("rebuild-search-index")
+@click.option("--batch-size", default=5000, show_default=True, help="Chats indexed per transaction.")
+@with_appcontext
+def rebuild_search_index(batch_size):
+    """Rebuild the full-text search index of the chats."""
+    from .search import rebuild_index
+
+    total = rebuild_index(batch_size)
+    print(f"Indexed {total} chats for search.")
+
+
+
+
+def delete_in_batches(table, condition, batch_size=1000, pause=0.0, collect=None):
+    total = 0
+    while True:
+        # No ORDER BY: the first matching rows of whichever index serves the condition are enough
+        ids = select(table.c.id).where(condition).limit(batch_size).scalar_subquery()
+        statement = delete(table).where(table.c.id.in_(ids))
+        if collect is None:
+            deleted = db.session.execute(statement).rowcount
+        else:
+            column, values = collect
+            returned = db.session.execute(statement.returning(column)).scalars().all()
+            values.update(returned)
+            deleted = len(returned)
+        db.session.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+@click.command("prune-chats")
+@click.option("--days", type=click.IntRange(min=1), required=True, help="Delete chats older than this many days.")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows deleted per transaction.")
+@click.option("--pause", default=0.05, show_default=True, help="Seconds to wait between batches.")
+@with_appcontext
+def prune_chats(days, batch_size, pause):
+    """Delete chats older than the retention period."""
+    from .models import Chat, Conversation, Job
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    jobs = Job.__table__.c
+    # Finished jobs first, they reference the chats holding their answers
+    delete_in_batches(Job.__table__, (jobs.created_at < cutoff) & jobs.status.notin_(Job.PENDING), batch_size, pause)
+    chats, conversations = Chat.__table__.c, Conversation.__table__.c
+    # Threads a queued or running prompt will answer into are kept whole (a job queued once the pass
+    # started fails when it finds its thread gone, see jobs.run_job)
+    busy = select(jobs.conversation_id).where(jobs.status.in_(Job.PENDING), jobs.conversation_id.is_not(None))
+    # The threads that lost chats, from the deleted rows themselves: `chats.timestamp` has no index of its own
+    touched = set()
+    total = delete_in_batches(Chat.__table__, (chats.timestamp < cutoff) & chats.conversation_id.notin_(busy),
+                              batch_size, pause, collect=(chats.conversation_id, touched))
+    # Every chat of a thread inactive since the cutoff is gone, the others only lost their older chats
+    delete_in_batches(Conversation.__table__, (conversations.last_activity < cutoff) & conversations.id.notin_(busy),
+                      batch_size, pause)
+    touched = sorted(touched)
+    for start in range(0, len(touched), batch_size):
+        Conversation.recount(conversations.id.in_(touched[start:start + batch_size]))
+    print(f"Pruned {total} chats older than {days} days.")
+
+
+BACKUP_SUFFIXES = (".db", ".db.gz")
+
+
+class BackupRestarted(Exception):
+    """The source kept changing under a stepped backup, more than `max_restarts` times."""
+
+
+class _StepTimer:
+    # Progress callback of sqlite3.Connection.backup, called between steps: the source is not locked
+    # while it runs, so the time since the previous call returned is the time the last step held it
+    def __init__(self, pause, max_restarts):
+        self.pause = pause
+        self.max_restarts = max_restarts
+        self.steps = []
+        self.restarts = 0
+        self.pages = 0
+        self._remaining = None
+        self._last = time.perf_counter()
+
+    def __call__(self, status, remaining, pages):
+        self.steps.append(time.perf_counter() - self._last)
+        self.pages = pages
+        # A write by another connection makes SQLite copy the source again from its first page
+        if self._remaining is not None and remaining > self._remaining:
+            self.restarts += 1
+            if self.restarts > self.max_restarts:
+                raise BackupRestarted()
+        self._remaining = remaining
+        if self.pause and remaining:
+            time.sleep(self.pause)
+        self._last = time.perf_counter()
+
+
+def backup_database(source, destination, pages=256, pause=0.005, max_restarts=3):
+    # The destination is a new file, thrown away if the copy fails: without fsyncs, the last step does
+    # not hold the source while the whole copy is flushed to disk (the caller syncs it). The journal of
+    # an empty file is tiny in memory, and lets an aborted stepped copy roll back before the retry
+    destination.execute("PRAGMA journal_mode=MEMORY")
+    destination.execute("PRAGMA synchronous=OFF")
+    timer = _StepTimer(pause, max_restarts)
+    start = time.perf_counter()
+    try:
+        source.backup(destination, pages=pages, progress=timer)
+        restarts, single_step = timer.restarts, False
+    except BackupRestarted:
+        # One step reads a single snapshot, it cannot be restarted; in WAL mode writers go on meanwhile
+        restarts, single_step = timer.restarts, True
+        timer = _StepTimer(0, 0)
+        source.backup(destination, pages=-1, progress=timer)
+    return {
+        "pages": timer.pages,
+        "steps": timer.steps,
+        "restarts": restarts,
+        "single_step": single_step,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def rotate_backups(directory, stem, keep):
+    # Timestamped names sort in date order
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(f"{stem}_") and name.endswith(BACKUP_SUFFIXES))
+    removed = names[:-keep] if keep else []
+    for name in removed:
+        os.remove(os.path.join(directory, name))
+    return removed
+
+
+@contextmanager
+def _opened_backup(path):
+    if not path.endswith(".gz"):
+        yield path
+        return
+    fd, plain = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as out, gzip.open(path, "rb") as compressed:
+            shutil.copyfileobj(compressed, out, 1024 * 1024)
+        yield plain
+    finally:
+        os.remove(plain)
+
+
+def verify_backup(path):
+    with _opened_backup(path) as plain:
+        conn = sqlite3.connect(f"file:{plain}?mode=ro", uri=True)
+        try:
+            integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            counts = {table: conn.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0]
+                      for table in ("user", "conversations", "chats") if table in tables}
+            revision = (conn.execute("SELECT version_num FROM alembic_version").fetchone()
+                        if "alembic_version" in tables else None)
+        finally:
+            conn.close()
+    return {"integrity": integrity, "counts": counts, "revision": revision[0] if revision else None}
+
+
+def _sqlite_file():
+    url = db.engine.url
+    if db.engine.dialect.name != "sqlite" or url.database in (None, "", ":memory:"):
+        raise click.ClickException("Backups need a SQLite database file.")
+    return url.database
+
+
+def _percentile_ms(sorted_values, fraction):
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index] * 1000
+
+
+@click.command("backup-db")
+@click.option("--dir", "directory", default=None, help="Directory of the backups [default: BACKUP_DIR].")
+@click.option("--compress/--no-compress", default=True, show_default=True, help="Write a gzip file.")
+@click.option("--keep", default=7, show_default=True, help="Backups of this database kept, older ones are deleted (0 keeps all).")
+@click.option("--pages", default=256, show_default=True, help="Pages copied per step, -1 copies in one step.")
+@click.option("--pause", default=0.005, show_default=True, help="Seconds to wait between steps.")
+@click.option("--max-restarts", default=3, show_default=True,
+              help="Restarts caused by concurrent writes before the rest is copied in one step.")
+@with_appcontext
+def backup_db(directory, compress, keep, pages, pause, max_restarts):
+    """Back up the live SQLite database with the online backup API."""
+    source_path = _sqlite_file()
+    directory = directory or current_app.config["BACKUP_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    name = f"{stem}_{datetime.now(timezone.utc):%Y-%m-%dT%H%M%S.%fZ}.db"
+    path = os.path.join(directory, name + (".gz" if compress else ""))
+
+    # Written under a temporary name, rotation and restores only ever see complete backups
+    partial = os.path.join(directory, f".{name}.partial")
+    source = db.engine.raw_connection()
+    try:
+        destination = sqlite3.connect(partial)
+        try:
+            report = backup_database(source.driver_connection, destination, pages, pause, max_restarts)
+            # A single file, whatever the journal mode of the live database
+            destination.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            destination.close()
+    finally:
+        source.close()
+    if compress:
+        with open(partial, "rb") as plain, gzip.open(path + ".partial", "wb", compresslevel=6) as out:
+            shutil.copyfileobj(plain, out, 1024 * 1024)
+        os.remove(partial)
+        partial = path + ".partial"
+    _fsync(partial)
+    os.replace(partial, path)
+    removed = rotate_backups(directory, stem, keep)
+
+    steps = sorted(report["steps"])
+    mode = " (rest copied in one step after too many restarts)" if report["single_step"] else ""
+    print(f"Backed up {report['pages']} pages in {len(steps)} steps, {report['seconds']:.2f} s{mode}: "
+          f"source locked per step p50 {_percentile_ms(steps, 0.5):.2f} ms, p95 {_percentile_ms(steps, 0.95):.2f} ms, "
+          f"max {steps[-1] * 1000:.2f} ms; {report['restarts']} restarts.")
+    print(f"Wrote {path} ({os.path.getsize(path) / 2 ** 20:.1f} MiB), removed {len(removed)} old backups.")
+
+
+@click.command("verify-backup")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def verify_backup_command(path):
+    """Check the integrity of a backup and count its rows."""
+    report = verify_backup(path)
+    counts = ", ".join(f"{count} {table}" for table, count in report["counts"].items())
+    if report["integrity"] != "ok":
+        raise click.ClickException(f"{path} is damaged: {report['integrity']}")
+    print(f"{path}: integrity ok, {counts}, schema revision {report['revision'] or 'none'}.")
+
+
+@click.command("restore-db")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--yes", is_flag=True, help="Do not ask for confirmation.")
+@with_appcontext
+def restore_db(path, yes):
+    """Replace the live SQLite database with a verified backup. Stop the workers first."""
+    target_path = _sqlite_file()
+    report = verify_backup(path)
+    if report["integrity"] != "ok":
+        raise click.ClickException(f"{path} is damaged: {report['integrity']}")
+    if not yes:
+        click.confirm(f"Replace {target_path} with {path}?", abort=True)
+
+    db.session.remove()
+    target = db.engine.raw_connection()
+    try:
+        with _opened_backup(path) as plain:
+            source = sqlite3.connect(f"file:{plain}?mode=ro", uri=True)
+            try:
+                # One step: the target is locked for writing until the copy is complete
+                source.backup(target.driver_connection)
+            finally:
+                source.close()
+    finally:
+        target.close()
+    # Pooled connections may hold the schema and pages of the replaced database
+    db.engine.dispose()
+    print(f"Restored {target_path} from {path}.")
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
 
 def init_app(app):
     db.init_app(app)
+    pragmas = app.config.get("SQLITE_PRAGMAS")
+    if pragmas:
+        with app.app_context():
+            for engine in db.engines.values():
+                apply_sqlite_pragmas(engine, pragmas)
+    from .search import include_object
+    # Batch mode lets Alembic alter SQLite tables by recreating them; the FTS5 tables are not models
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR, render_as_batch=True, include_object=include_object)
     app.cli.add_command(reset_tables_command)
     app.cli.add_command(init_db)
     app.cli.add_command(delete_tables)
+    app.cli.add_command(rerender_chats)
+    app.cli.add_command(rebuild_search_index)
+    app.cli.add_command(prune_chats)
+    app.cli.add_command(backup_db)
+    app.cli.add_command(verify_backup_command)
+    app.cli.add_command(restore_db)
 
 
 
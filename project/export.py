@@ -0,0 +1,318 @@
+"""
+export.py
+This module exports and imports chat histories as gzip-compressed NDJSON, streaming the rows both ways
+so memory stays flat whatever the size of the history.
+Blueprints:
+    bp: Flask Blueprint for the download route.
+Routes:
+    - "/export" (GET): Downloads the user's threads and chats as `chats-<date>.ndjson.gz`.
+        * Redirects to login if the user is not authenticated.
+        * The file is compressed while it is sent, one chunk per batch of EXPORT_BATCH_SIZE rows.
+Functions:
+    export_chunks(user_id=None, batch_size=1000): Yields (kind, rows, data) for the export of one user
+        (every user when None): the header line, then the threads, then the chats, `data` being the
+        NDJSON lines of up to `batch_size` rows read from one server-side cursor.
+    gzip_chunks(chunks, level=6): Compresses a stream of bytes chunk by chunk, yielding gzip data.
+    import_chats(lines, user_id=None, batch_size=1000): Imports the lines of an export, inserting the
+        chats `batch_size` rows per statement and transaction; returns (threads, chats) imported.
+CLI Commands:
+    export-chats PATH: Writes the export of every user, or of `--user`, to PATH (gzip) and reports
+        the rows per second.
+    import-chats PATH: Imports an export into the users of the same names, or into `--user`, and
+        reports the rows per second.
+Format:
+    One JSON object per line, `type` telling which:
+    - {"type": "header", "format": "aifacade-chats", "version": 1}, first.
+    - {"type": "conversation", "id", "user", "title", "created_at"}: a thread and the username of its owner.
+    - {"type": "chat", "id", "conversation", "timestamp", "prompt", "response", "raw_response",
+      "render_version", "prompt_tokens", "completion_tokens"}: a chat of a thread listed before it.
+      Timestamps are ISO 8601, in UTC. The token counts are null when unknown, and optional on import.
+Notes:
+    - Rows are read with `yield_per`, so only one batch of rows is in memory at a time.
+    - An import appends: threads and chats get new ids, the counters of the threads are computed while
+      reading and written with each batch of their chats. The HTML of the file is not trusted: answers
+      are rendered again from their Markdown, and other responses are stored as escaped text. Chats are indexed for search by the triggers of
+      `chats` (see project.search). Imported chats keep their token counts but are not added to the
+      daily usage of their owner (`usage_daily`): they were billed where they were answered.
+    - Each batch is committed on its own, like the other bulk commands, so a large import does not hold
+      SQLite's write lock for its whole duration. A malformed line stops the import with its number;
+      the batches before it stay imported.
+"""
+
+import gzip
+# gzip: The export file format of the CLI commands
+
+import html
+# html: Unescapes the exported text of error responses before they are escaped again
+
+import json
+# json: One object per line
+
+import time
+# time: Throughput of the CLI commands
+
+import zlib
+# zlib: Compresses the download while it streams
+
+from datetime import datetime, timezone
+# datetime, timezone: Parsing the timestamps of an import, naming the download
+
+import click
+# click: Used to create the export-chats and import-chats commands
+
+from flask import Blueprint, Response, redirect, url_for, current_app, stream_with_context
+# Blueprint: For the download route
+# Response, stream_with_context: To stream the download with the request's database session
+# redirect, url_for: To send anonymous users to the login page
+# current_app: To read EXPORT_BATCH_SIZE
+
+from flask.cli import with_appcontext
+# with_appcontext: Ensures the commands run within the Flask application context
+
+from flask_login import current_user
+# current_user: The user whose history is downloaded
+
+from sqlalchemy import select, insert, update, bindparam
+# select: Streamed reads of the threads and chats
+# insert, update, bindparam: Batched writes of an import
+
+from .db import db
+# db: SQLAlchemy database instance
+
+from .models import Chat, Conversation, User, _shorten
+# Chat, Conversation, User: The exported tables
+# _shorten: Snippets of the imported threads, as the insert hook writes them
+
+
+bp = Blueprint('export', __name__)
+
+FORMAT = "aifacade-chats"
+VERSION = 1
+
+
+def _line(record):
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _timestamp(value):
+    # Stored as naive UTC
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def export_chunks(user_id=None, batch_size=1000):
+    conversations, chats, users = Conversation.__table__.c, Chat.__table__.c, User.__table__.c
+    yield "header", 0, _line({"type": "header", "format": FORMAT, "version": VERSION})
+
+    threads = (select(conversations.id, conversations.title, conversations.created_at, users.username)
+               .join(User.__table__, users.id == conversations.user_id)
+               .order_by(conversations.id))
+    messages = select(chats.id, chats.conversation_id, chats.timestamp, chats.prompt, chats.response,
+                      chats.raw_response, chats.render_version, chats.prompt_tokens, chats.completion_tokens)
+    if user_id is None:
+        messages = messages.order_by(chats.id)
+    else:
+        threads = threads.where(conversations.user_id == user_id)
+        # The order of the (user_id, timestamp) index, which holds the rowid: no sort
+        messages = messages.where(chats.user_id == user_id).order_by(chats.timestamp, chats.id)
+
+    # yield_per streams the cursor, one batch of rows in memory at a time
+    options = {"yield_per": batch_size}
+    for rows in db.session.execute(threads, execution_options=options).partitions():
+        yield "conversation", len(rows), b"".join(_line({
+            "type": "conversation", "id": row.id, "user": row.username, "title": row.title,
+            "created_at": _iso(row.created_at),
+        }) for row in rows)
+    for rows in db.session.execute(messages, execution_options=options).partitions():
+        yield "chat", len(rows), b"".join(_line({
+            "type": "chat", "id": row.id, "conversation": row.conversation_id, "timestamp": _iso(row.timestamp),
+            "prompt": row.prompt, "response": row.response, "raw_response": row.raw_response,
+            "render_version": row.render_version, "prompt_tokens": row.prompt_tokens,
+            "completion_tokens": row.completion_tokens,
+        }) for row in rows)
+
+
+def gzip_chunks(chunks, level=6):
+    # wbits 31: deflate with the gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def import_chats(lines, user_id=None, batch_size=1000):
+    conversations, chats = Conversation.__table__, Chat.__table__
+    owners = {}
+    # Exported thread id -> [new id, message count, last activity, last prompt, owner]
+    threads = {}
+    # Exported ids of the threads the pending batch adds chats to
+    touched = set()
+    batch = []
+    total = 0
+
+    def flush():
+        if batch:
+            # One executemany per batch; the search triggers index the rows as they go in
+            db.session.execute(insert(chats), batch)
+            # The insert hook of Chat does not run for bulk inserts: the counters of the threads the
+            # batch added to are written in its transaction, so a failed import leaves them right
+            db.session.execute(
+                update(conversations).where(conversations.c.id == bindparam("thread_id"))
+                .values(message_count=bindparam("count"), last_activity=bindparam("activity"),
+                        last_snippet=bindparam("snippet")),
+                [_counters(threads[key]) for key in touched],
+            )
+            db.session.commit()
+            batch.clear()
+            touched.clear()
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind = record["type"]
+            if kind == "header":
+                if record.get("format") != FORMAT or record.get("version") != VERSION:
+                    raise ValueError(f"unsupported export {record.get('format')!r} version {record.get('version')!r}")
+            elif kind == "conversation":
+                owner = user_id if user_id is not None else _owner(owners, record["user"])
+                created_at = _timestamp(record["created_at"])
+                thread_id = db.session.execute(insert(conversations).values(
+                    user_id=owner, title=_shorten(record["title"], Conversation.TITLE_LENGTH),
+                    created_at=created_at, last_activity=created_at, message_count=0,
+                )).inserted_primary_key[0]
+                threads[record["id"]] = [thread_id, 0, created_at, None, owner]
+            elif kind == "chat":
+                thread = threads.get(record["conversation"])
+                if thread is None:
+                    raise ValueError(f"chat {record.get('id')} belongs to no thread listed before it")
+                timestamp = _timestamp(record["timestamp"])
+                response, raw_response, render_version = _rendered(record)
+                batch.append({
+                    "user_id": thread[4], "conversation_id": thread[0], "timestamp": timestamp,
+                    "prompt": record["prompt"], "response": response,
+                    "raw_response": raw_response, "render_version": render_version,
+                    "prompt_tokens": record.get("prompt_tokens"), "completion_tokens": record.get("completion_tokens"),
+                })
+                touched.add(record["conversation"])
+                thread[1] += 1
+                if thread[3] is None or timestamp >= thread[2]:
+                    thread[2], thread[3] = timestamp, record["prompt"]
+            else:
+                raise ValueError(f"unknown record type {kind!r}")
+        except (KeyError, TypeError, ValueError) as e:
+            db.session.rollback()
+            raise ValueError(f"Line {number}: {e}") from e
+        if len(batch) >= batch_size:
+            total += len(batch)
+            flush()
+    total += len(batch)
+    flush()
+    # Threads without chats were inserted with their counters, they only wait for a commit
+    db.session.commit()
+    return len(threads), total
+
+
+def _rendered(record):
+    # The file's HTML is never stored, the pages render it unescaped: answers are rendered again from
+    # their Markdown, responses without one (upstream errors) are stored as escaped text
+    chat = Chat()
+    if record.get("raw_response"):
+        chat.set_answer(record["raw_response"])
+    else:
+        chat.set_error(html.unescape(record["response"]))
+    return chat.response, chat.raw_response, chat.render_version
+
+
+def _counters(thread):
+    new_id, count, activity, prompt, _ = thread
+    return {"thread_id": new_id, "count": count, "activity": activity,
+            "snippet": _shorten(prompt, Conversation.SNIPPET_LENGTH) if prompt else None}
+
+
+def _owner(owners, username):
+    if username not in owners:
+        user = User.find_by_username(username)
+        if user is None:
+            raise ValueError(f"unknown user {username!r}")
+        owners[username] = user.id
+    return owners[username]
+
+
+def _user_id(username):
+    if username is None:
+        return None
+    user = User.find_by_username(username)
+    if user is None:
+        raise click.ClickException(f"Unknown user {username!r}.")
+    return user.id
+
+
+def _rate(rows, seconds):
+    return f"{rows / seconds:,.0f} rows/s" if seconds > 0 else "n/a rows/s"
+
+
+@click.command("export-chats")
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option("--user", "username", default=None, help="Export only this user's history.")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows read and written per batch.")
+@with_appcontext
+def export_chats_command(path, username, batch_size):
+    """Export chat histories to a gzip-compressed NDJSON file."""
+    user_id = _user_id(username)
+    counts = {"conversation": 0, "chat": 0}
+    start = time.perf_counter()
+    with gzip.open(path, "wb", compresslevel=6) as f:
+        for kind, rows, data in export_chunks(user_id, batch_size):
+            f.write(data)
+            counts[kind] = counts.get(kind, 0) + rows
+    elapsed = time.perf_counter() - start
+    rows = counts["conversation"] + counts["chat"]
+    print(f"Exported {counts['chat']} chats in {counts['conversation']} threads to {path} "
+          f"in {elapsed:.1f} s ({_rate(rows, elapsed)}).")
+
+
+@click.command("import-chats")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--user", "username", default=None, help="Import every thread into this user's history.")
+@click.option("--batch-size", default=1000, show_default=True, help="Chats inserted per transaction.")
+@with_appcontext
+def import_chats_command(path, username, batch_size):
+    """Import chat histories from an export-chats file."""
+    user_id = _user_id(username)
+    start = time.perf_counter()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            threads, total = import_chats(f, user_id, batch_size)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - start
+    print(f"Imported {total} chats in {threads} threads from {path} "
+          f"in {elapsed:.1f} s ({_rate(total + threads, elapsed)}).")
+
+
+@bp.route("/export")
+def download():
+    if not current_user.is_authenticated:
+        return redirect(url_for("auth.login"))
+
+    chunks = export_chunks(current_user.id, current_app.config["EXPORT_BATCH_SIZE"])
+    response = Response(stream_with_context(gzip_chunks(data for _, _, data in chunks)),
+                        mimetype="application/gzip")
+    filename = f"chats-{datetime.now(timezone.utc):%Y-%m-%d}.ndjson.gz"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def init_app(app):
+    app.cli.add_command(export_chats_command)
+    app.cli.add_command(import_chats_command)
@@ -4,12 +4,15 @@ Attributes:
     limiter (Limiter): An instance of Flask-Limiter configured to use the remote address of the client as the key for rate limiting.
 Usage:
     Import the `limiter` object and attach it to your Flask app to enable rate limiting based on client IP address.
+    Importing this module also registers the "sqlite" storage scheme (see project.ratelimit), so
+    RATELIMIT_STORAGE_URI can point at a SQLite file shared by every worker.
 Example:
     app = Flask(__name__)
     limiter.init_app(app)
 """
 from flask_limiter.util import get_remote_address  # get_remote_address: Retrieves the client's IP address for rate limiting purposes
 from flask_limiter import Limiter  # Limiter: Flask-Limiter extension class for enabling rate limiting in the app
+from . import ratelimit  # ratelimit: Registers the SQLite storage backend for the limits library
 
 
 limiter = Limiter(
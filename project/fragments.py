@@ -0,0 +1,87 @@
+"""
+fragments.py
+This module caches the rendered HTML of each exchange of the chat history, so that the home page
+stitches stored fragments together instead of loading and rendering every card again on each view;
+an exchange never changes once it is saved.
+Classes:
+    FragmentCache:
+        Per-process LRU of the HTML of each chat's cards (`_chat_card.html`), keyed by the chat's id,
+        timestamp and render version.
+        Methods:
+            from_config(config): Class method building the cache from the Flask config.
+            cards(keys, load, batch=50): Generator yielding the cards of the chats whose keys (rows with
+                id, timestamp and render_version, see `Chat.history_page(keys_only=True)`) are given,
+                `batch` chats per fragment. The prompts and answers of the cards not cached are loaded
+                with `load(ids)` (see `Chat.contents`), one query per batch, and rendered.
+            stats(): Returns the hit/miss counters.
+Notes:
+    - The timestamp is part of the key because SQLite may reuse the id of the last deleted chat.
+    - A chat re-rendered with another Markdown backend gets a new render version, hence a new entry.
+    - Needs an app context (the card macro is loaded from the app's templates).
+"""
+
+import threading
+# threading: Lock protecting the cache, shared by the worker's request threads
+
+from collections import OrderedDict
+# OrderedDict: Keeps entries in recency order for LRU eviction
+
+from flask import get_template_attribute
+# get_template_attribute: Loads the card macro from the app's templates
+
+from markupsafe import Markup
+# Markup: Fragments are trusted HTML, Jinja must not escape them again
+
+from .metrics import CACHE_LOOKUPS
+# CACHE_LOOKUPS: Hit/miss counter aggregated across workers
+
+
+class FragmentCache:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(maxsize=config["CHAT_FRAGMENT_CACHE_SIZE"])
+
+    def cards(self, keys, load, batch=50):
+        for start in range(0, len(keys), batch):
+            chunk = [(row.id, row.timestamp, row.render_version) for row in keys[start:start + batch]]
+            with self._lock:
+                found = [self._entries.get(key) for key in chunk]
+                for key, html in zip(chunk, found):
+                    if html is not None:
+                        self._entries.move_to_end(key)
+
+            missing = [key for key, html in zip(chunk, found) if html is None]
+            if missing:
+                contents = load([key[0] for key in missing])
+                card = get_template_attribute("_chat_card.html", "card")
+                rendered = {}
+                for key in missing:
+                    # A chat deleted since the page query has no card
+                    if key[0] in contents:
+                        rendered[key] = str(card(*contents[key[0]]))
+                with self._lock:
+                    self._entries.update(rendered)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                found = [html if html is not None else rendered.get(key, "") for key, html in zip(chunk, found)]
+
+            hits = len(chunk) - len(missing)
+            with self._lock:
+                self.hits += hits
+                self.misses += len(missing)
+            # One update per batch, the counters are not free at thousands of cards a page
+            if hits:
+                CACHE_LOOKUPS.labels(cache="fragment", result="hit").inc(hits)
+            if missing:
+                CACHE_LOOKUPS.labels(cache="fragment", result="miss").inc(len(missing))
+            yield Markup("".join(found))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
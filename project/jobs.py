@@ -0,0 +1,191 @@
+"""
+jobs.py
+This module runs the chat prompts queued by "/chat" in background workers, so a web request never
+waits for the model. The queue is the `jobs` table of the application database, no broker is needed.
+Functions:
+    enqueue(user_id, prompt, conversation_id=None):
+        Saves a queued Job for the prompt of a thread and returns it.
+    run_job(job_id):
+        Answers a claimed job: sends the prompt with the context of its thread to DeepSeek, saves the
+        Chat (answer or upstream error, with the tokens billed) in the thread and marks the job done.
+        Jobs queued before threads existed continue the user's latest thread. When saving fails, the job
+        is queued again, or marked failed after JOB_MAX_ATTEMPTS attempts. A job of a user who has used
+        their daily token quota since queueing it fails without calling the upstream. A job whose thread
+        was deleted meanwhile (history cleared or pruned) fails without saving its answer.
+    work(app, threads, poll_interval, stop=None, drain=False):
+        Runs `threads` worker threads, each claiming and answering jobs until `stop` is set (or,
+        with `drain`, until the queue is empty).
+CLI Commands:
+    run-worker: Starts a worker pool (`--threads`, default JOB_WORKER_THREADS). `--drain` answers the
+        jobs currently queued and exits.
+Notes:
+    - The number of worker threads over all worker processes is the cap on concurrent upstream calls.
+    - Claiming sets a lease (JOB_LEASE_SECONDS); a job whose worker was killed mid-call is claimed again
+      once its lease expires, so a restart never loses a prompt.
+    - The page polls "/jobs/<id>" until the job is done (see chat.js).
+"""
+
+import threading
+# threading: Worker threads and their stop event
+
+import time
+# time: Queue wait measurement
+
+import click
+# click: Used to create the run-worker command
+
+from datetime import timezone
+# timezone: Job timestamps are stored as naive UTC
+
+from flask import current_app
+# current_app: Access to the config and the conversation context store
+
+from flask.cli import with_appcontext
+# with_appcontext: Ensures the command runs within the Flask application context
+
+from sqlalchemy import select
+# select: Checks the thread of a job still exists
+
+from .db import db
+# db: SQLAlchemy database instance
+
+from .models import Chat, Conversation, Job
+# Chat, Conversation, Job: The answer, its thread and the queued prompt
+
+from .utils import query_deepseek
+# query_deepseek: The upstream call
+
+from .usage import quota_exceeded, QUOTA_MESSAGE
+# quota_exceeded, QUOTA_MESSAGE: Daily token quota, checked again when the job runs
+
+from .metrics import JOBS, JOB_WAIT_SECONDS
+# JOBS, JOB_WAIT_SECONDS: Job outcome counter and queue wait histogram
+
+
+def enqueue(user_id, prompt, conversation_id=None):
+    job = Job(user_id=user_id, prompt=prompt, conversation_id=conversation_id)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+THREAD_DELETED = "The conversation was deleted before the answer was ready."
+
+
+def _thread_exists(conversation_id):
+    # Read from the database, not the session's identity map: another request may have deleted it
+    conversations = Conversation.__table__.c
+    return db.session.execute(select(conversations.id).where(conversations.id == conversation_id)).first() is not None
+
+
+def _fail_deleted(job):
+    job.fail(THREAD_DELETED, retry=False)
+    db.session.commit()
+    JOBS.labels(outcome="failed").inc()
+
+
+def run_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job.attempts > current_app.config["JOB_MAX_ATTEMPTS"]:
+        # Its worker died every time, give up instead of looping on it
+        job.fail("The request could not be completed.", retry=False)
+        db.session.commit()
+        JOBS.labels(outcome="failed").inc()
+        return
+    if quota_exceeded(job.user_id):
+        # Other prompts of the user answered while this one waited may have used the quota
+        job.fail(QUOTA_MESSAGE, retry=False)
+        db.session.commit()
+        JOBS.labels(outcome="failed").inc()
+        return
+
+    created_at = job.created_at.replace(tzinfo=timezone.utc)
+    JOB_WAIT_SECONDS.observe(max(0.0, time.time() - created_at.timestamp()))
+    try:
+        conversation_id = job.conversation_id
+        if conversation_id is None:
+            latest = Conversation.latest(job.user_id)
+            conversation_id = latest.id if latest else None
+        elif not _thread_exists(conversation_id):
+            _fail_deleted(job)
+            return
+        history = current_app.extensions["chat_context"].history(conversation_id) if conversation_id else []
+        completion = query_deepseek(job.prompt, history)
+        if conversation_id is not None and not _thread_exists(conversation_id):
+            # Cleared while the upstream answered: the chat would belong to no thread
+            _fail_deleted(job)
+            return
+
+        # Dated at submission, so the history keeps the order the prompts were sent in
+        chat = Chat(user_id=job.user_id, prompt=job.prompt, timestamp=job.created_at)
+        if conversation_id is not None:
+            chat.conversation_id = conversation_id
+        if completion.ok:
+            chat.set_answer(completion.content)
+            chat.set_usage(completion.usage)
+        else:
+            chat.set_error(completion.content)
+        db.session.add(chat)
+        db.session.flush()
+        job.finish(chat.id)
+        db.session.commit()
+        JOBS.labels(outcome="done").inc()
+    except Exception as e:
+        db.session.rollback()
+        retry = job.attempts < current_app.config["JOB_MAX_ATTEMPTS"]
+        job.fail(f"Error: {e}", retry=retry)
+        db.session.commit()
+        JOBS.labels(outcome="retried" if retry else "failed").inc()
+
+
+def _work_loop(app, poll_interval, stop, drain):
+    with app.app_context():
+        lease = app.config["JOB_LEASE_SECONDS"]
+        while not stop.is_set():
+            try:
+                job_id = Job.claim_next(lease)
+                if job_id is not None:
+                    run_job(job_id)
+            finally:
+                # Fresh session per job, nothing read by one job leaks into the next
+                db.session.remove()
+            if job_id is None:
+                if drain:
+                    return
+                stop.wait(poll_interval)
+
+
+def work(app, threads, poll_interval, stop=None, drain=False):
+    stop = stop or threading.Event()
+    workers = [
+        threading.Thread(target=_work_loop, args=(app, poll_interval, stop, drain),
+                         name=f"job-worker-{i}", daemon=True)
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            # Joining in slices keeps the main thread responsive to Ctrl+C
+            while worker.is_alive():
+                worker.join(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+
+@click.command("run-worker")
+@click.option("--threads", type=int, default=None, help="Jobs answered concurrently [default: JOB_WORKER_THREADS].")
+@click.option("--drain", is_flag=True, help="Answer the queued jobs and exit instead of waiting for new ones.")
+@with_appcontext
+def run_worker(threads, drain):
+    """Answer the queued chat prompts."""
+    app = current_app._get_current_object()
+    threads = threads or app.config["JOB_WORKER_THREADS"]
+    print(f"Job worker started with {threads} threads.")
+    work(app, threads, app.config["JOB_POLL_INTERVAL"], drain=drain)
+
+
+def init_app(app):
+    app.cli.add_command(run_worker)
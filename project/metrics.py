@@ -0,0 +1,172 @@
+"""
+metrics.py
+This module instruments the application with Prometheus metrics and serves them on /metrics.
+Metrics:
+    aifacade_request_seconds (histogram; endpoint, method, status):
+        Time to produce each response, per route endpoint ("chat.home", "auth.login", ...). For the
+        streaming route this is the time to the first byte, the stream itself is in the upstream metric.
+    aifacade_request_db_queries (histogram; endpoint): SQL statements executed per request.
+    aifacade_db_query_seconds (histogram; endpoint): Duration of each SQL statement.
+    aifacade_upstream_seconds (histogram; mode, provider, outcome): LLM backend call duration, "complete"
+        or "stream", per backend ("deepseek", "openai", "stub"), "ok" or "error".
+    aifacade_upstream_tokens_total (counter; kind): Tokens reported by DeepSeek, "prompt" or "completion".
+    aifacade_markdown_render_seconds (histogram; backend): Time to render an answer to HTML.
+    aifacade_ratelimit_rejections_total (counter; endpoint): Requests refused with 429.
+    aifacade_cache_lookups_total (counter; cache, result): Completion, user and history fragment cache
+        hits and misses.
+    aifacade_coalesced_requests_total (counter; role): Upstream calls made ("leader") and requests
+        served by another identical call ("follower").
+    aifacade_circuit_rejections_total (counter; provider): Calls not sent to a backend whose circuit is open.
+    aifacade_hedged_requests_total (counter; result): Second attempts sent ("fired"), answered first ("won"),
+        and attempts not hedged because every thread of the hedge pool was busy ("skipped").
+    aifacade_jobs_total (counter; outcome): Queued prompts answered ("done"), requeued ("retried") or
+        given up ("failed") by the background workers.
+    aifacade_job_wait_seconds (histogram): Time a queued prompt waited before a worker picked it up.
+Functions:
+    init_app(app):
+        Registers the request hooks and the /metrics route (unless METRICS_ENABLED is False).
+    timed(histogram, **labels):
+        Context manager observing the duration of its block into a histogram.
+Notes:
+    - Under gunicorn, every worker writes its samples to PROMETHEUS_MULTIPROC_DIR (set up by
+      gunicorn.conf.py) and /metrics aggregates all the workers, whichever one answers the scrape.
+      Without that variable, /metrics reports the serving process only (development server, tests).
+    - /metrics is not rate limited and is blocked at the Caddy proxy; the scraper reaches the app on
+      port 5000 over the compose network, which docker-compose.yml does not publish on the host.
+      Where the port is reachable by others, set METRICS_TOKEN and scrape with that bearer token.
+"""
+
+import hmac
+# hmac: Constant time comparison of the scrape token
+
+import os
+# os: Detects multiprocess mode
+
+import time
+# time: Request and query timers
+
+from contextlib import contextmanager
+# contextmanager: Builds the `timed` helper
+
+from flask import Response, abort, current_app, g, has_request_context, request
+# Response, abort, current_app, g, has_request_context, request: Per-request timers, the /metrics
+# response and its token
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+# prometheus_client: Metric types, exposition format and multiprocess aggregation
+
+from sqlalchemy import event
+# event: Cursor execution hooks counting and timing SQL statements
+
+from sqlalchemy.engine import Engine
+# Engine: Hooks are attached to every engine
+
+from .extensions import limiter
+# limiter: /metrics must not be rate limited
+
+REQUEST_SECONDS = Histogram(
+    "aifacade_request_seconds", "Time to produce a response.", ["endpoint", "method", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REQUEST_DB_QUERIES = Histogram(
+    "aifacade_request_db_queries", "SQL statements executed per request.", ["endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_QUERY_SECONDS = Histogram(
+    "aifacade_db_query_seconds", "Duration of each SQL statement.", ["endpoint"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+)
+UPSTREAM_SECONDS = Histogram(
+    "aifacade_upstream_seconds", "Duration of LLM backend calls.", ["mode", "provider", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+UPSTREAM_TOKENS = Counter("aifacade_upstream_tokens", "Tokens reported by DeepSeek.", ["kind"])
+RENDER_SECONDS = Histogram(
+    "aifacade_markdown_render_seconds", "Time to render an answer to HTML.", ["backend"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1),
+)
+RATELIMIT_REJECTIONS = Counter("aifacade_ratelimit_rejections", "Requests refused with 429.", ["endpoint"])
+CACHE_LOOKUPS = Counter("aifacade_cache_lookups", "Cache hits and misses.", ["cache", "result"])
+COALESCED_REQUESTS = Counter("aifacade_coalesced_requests", "Coalesced upstream calls.", ["role"])
+CIRCUIT_REJECTIONS = Counter(
+    "aifacade_circuit_rejections", "Calls refused by an open circuit.", ["provider"])
+HEDGED_REQUESTS = Counter("aifacade_hedged_requests", "Hedged second attempts.", ["result"])
+JOBS = Counter("aifacade_jobs", "Queued prompts processed by the workers.", ["outcome"])
+JOB_WAIT_SECONDS = Histogram(
+    "aifacade_job_wait_seconds", "Time a queued prompt waited for a worker.",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 300),
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def _endpoint():
+    # Unmatched URLs share one label, scanners must not create a series per path
+    return (request.endpoint or "unmatched") if has_request_context() else "none"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, which a failed statement discards with its start time
+    if context is not None:
+        context.metrics_query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "metrics_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    DB_QUERY_SECONDS.labels(endpoint=_endpoint()).observe(elapsed)
+    if has_request_context():
+        g.metrics_db_queries = g.get("metrics_db_queries", 0) + 1
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+    g.metrics_db_queries = 0
+
+
+def _record_request(response):
+    endpoint = _endpoint()
+    start = g.pop("metrics_start", None)
+    # Requests refused by an earlier before_request hook (the limiter) never started the timer
+    if start is not None:
+        REQUEST_SECONDS.labels(endpoint=endpoint, method=request.method, status=response.status_code).observe(
+            time.perf_counter() - start)
+        REQUEST_DB_QUERIES.labels(endpoint=endpoint).observe(g.get("metrics_db_queries", 0))
+    if response.status_code == 429:
+        RATELIMIT_REJECTIONS.labels(endpoint=endpoint).inc()
+    return response
+
+
+@limiter.exempt
+def metrics():
+    token = current_app.config["METRICS_TOKEN"]
+    # Bytes: compare_digest refuses non-ASCII strings, which a client can send
+    if token and not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        abort(401)
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Aggregate the samples every worker wrote to the shared directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
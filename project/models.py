@@ -1,6 +1,7 @@
 """
 models.py
-This module defines the SQLAlchemy ORM models for the application's database, including the User and Chat models.
+This module defines the SQLAlchemy ORM models for the application's database, including the User, Conversation,
+Chat and UsageDaily models.
 Classes:
     User (UserMixin, db.Model):
         Represents a user in the system.
@@ -8,33 +9,115 @@ Classes:
         - username: Unique username (str).
         - password: Write-only property for setting the user's password (hashed).
         - chats: Relationship to Chat objects associated with the user.
+        - conversations: Relationship to the user's Conversation threads.
         Methods:
             - check_password(password): Verifies a password against the stored hash.
+            - password_needs_rehash(): Whether the stored hash uses other parameters than PASSWORD_HASH_METHOD.
             - find_by_username(username): Class method to find a user by username.
+    Conversation (db.Model):
+        Represents a thread of chats of a user, with counters kept up to date on every chat insert so the
+        thread list never aggregates over `chats`.
+        - id: Primary key (int).
+        - user_id: Foreign key referencing User.id (int).
+        - title: The first prompt of the thread, shortened (str).
+        - created_at: Date and time the thread was started (datetime, UTC).
+        - last_activity: Timestamp of the newest chat of the thread, or `created_at` while it has none.
+        - message_count: Number of chats of the thread (int).
+        - last_snippet: The newest prompt of the thread, shortened (str).
+        Methods:
+            - start(user_id, prompt): Class method creating and committing a thread titled after its first prompt.
+            - for_user(user_id, limit): Class method returning the user's most recently active threads.
+            - latest(user_id): Class method returning the user's most recently active thread, or None.
+            - owned_by(conversation_id, user_id): Class method returning the thread if it belongs to the user, or None.
+            - recount(condition): Class method recomputing the counters of the matching threads from `chats`
+              (after rows were deleted in bulk).
     Chat (db.Model):
         Represents a chat record associated with a user.
         - id: Primary key (int).
         - user_id: Foreign key referencing User.id (int).
+        - conversation_id: Foreign key referencing Conversation.id (int).
         - timestamp: Date and time of the chat (datetime, UTC).
         - prompt: The user's prompt (str).
-        - response: The system's response (str).
+        - response: The system's response, rendered to HTML (str).
+        - raw_response: The system's response as the raw Markdown returned by the LLM (str, None for
+          chats saved before it was stored).
+        - render_version: Version stamp of the renderer that produced `response` (str).
+        - prompt_tokens, completion_tokens: Tokens the upstream billed for the answer (int, None when it
+          made no call: cached or shared answers, errors, chats saved before usage was recorded).
+        Methods:
+            - set_answer(markdown_text, backend=None): Stores the raw Markdown answer and renders it.
+            - set_usage(usage): Stores the token counts of the `usage` block of the API response (None for none).
+            - set_error(message): Stores an upstream error message (escaped) as the response, without raw Markdown.
+            - rerender(backend=None): Re-renders `response` from `raw_response` and updates the stamp.
+            - history_page(conversation_id, limit, before=None, keys_only=False): Class method returning one
+              page of a thread using keyset pagination on (conversation_id, timestamp, id).
+            - contents(ids): Class method returning the prompt and rendered answer of the given chats.
         Properties:
             - user_id: Hybrid property for querying and instance access.
             - timestamp: Hybrid property for querying and instance access.
             - prompt: The prompt text.
             - response: The response text.
+    UsageDaily (db.Model):
+        Per-user daily totals of the chats and their tokens, kept up to date on every chat insert so usage
+        pages and quota checks read one row per day instead of aggregating over `chats`.
+        - user_id, day: Primary key, the user and the UTC date the chats were saved, i.e. answered
+          (int, date). A queued chat is dated at submission but counts on the day it is answered.
+        - requests: Chats saved that day (int).
+        - prompt_tokens, completion_tokens: Tokens billed for them (int).
+        - total_tokens: Property, their sum.
+        Methods:
+            - tokens_on(user_id, day): Class method returning the tokens used by the user that day (0 for none).
+            - for_user(user_id, days): Class method returning the rows of the user's last `days` days, newest first.
+            - add(connection, user_id, day, prompt_tokens, completion_tokens): Class method adding one chat
+              to the totals of a day, in a single upsert.
+    Job (db.Model):
+        Represents a prompt queued for the background workers (see project.jobs).
+        - id: Primary key (int).
+        - user_id: Foreign key referencing User.id (int).
+        - conversation_id: The thread the answer goes to (int, None for jobs queued before threads existed).
+        - prompt: The user's prompt (str).
+        - status: "queued", "running", "done" or "failed" (str).
+        - attempts: Number of times a worker claimed the job (int).
+        - created_at: Date and time the prompt was submitted (datetime, UTC); the answer's chat gets it
+          as timestamp so the history keeps the submission order.
+        - lease_expires_at: While running, time after which another worker may claim the job again.
+        - chat_id: The Chat holding the answer once done (int).
+        - error: Why the job failed (str).
+        Methods:
+            - claim_next(lease_seconds): Class method atomically marking the oldest claimable job running
+              and returning its id, or None.
+            - finish(chat_id): Marks the job done with the chat holding its answer.
+            - fail(message, retry): Puts the job back in the queue, or marks it failed.
+            - pending_for(user_id): Class method returning the user's queued and running jobs, oldest first.
 Notes:
-    - Passwords are stored as hashes using Werkzeug security utilities.
+    - Passwords are stored as hashes using Werkzeug security utilities, computed in the bounded pool
+      of project.passwords with the configured method and cost.
     - The User model uses private attributes with public properties for encapsulation.
     - The Chat model uses hybrid properties for user_id and timestamp to support both instance access and query expressions.
     - Relationships are set up with cascading deletes for user chats.
+    - The UNIQUE constraint of `user.username` (its SQLite autoindex) serves `find_by_username`, and
+      `chats` has a composite (user_id, timestamp) index (ix_chats_user_id_timestamp) serving
+      the per-user clear queries without a full scan.
+    - `chats` has a composite (conversation_id, timestamp) index (ix_chats_conversation_id_timestamp)
+      serving the pages of a thread, and `conversations` a (user_id, last_activity) index
+      (ix_conversations_user_id_last_activity) serving the thread list, whose first row is the
+      latest thread: both are index range reads, whatever the size of the history.
+    - Inserting a chat updates its thread's counters in the same transaction, with a single
+      UPDATE that adds to the stored values, so concurrent workers never lose a count. A chat
+      saved without a thread (direct inserts, jobs queued before threads existed) joins the user's
+      latest thread, started if the user has none.
+    - Inserting a chat also adds it to the user's UsageDaily row of the current UTC day (the day its tokens
+      were billed, which the quota counts) in the same transaction, with an
+      upsert that adds to the stored values. Deleting chats (clear, prune) leaves the totals untouched:
+      they account for what was used, not for what is kept.
 """
 from .db import db
 # db: SQLAlchemy database instance used for ORM model definitions
 
-from werkzeug.security import generate_password_hash, check_password_hash
-# generate_password_hash: Used to securely hash user passwords before storing them
-# check_password_hash: Used to verify a password against its stored hash
+from .passwords import hash_password, verify_password, needs_rehash
+# hash_password: Used to securely hash user passwords before storing them (configured method and cost)
+# verify_password: Used to verify a password against its stored hash
+# needs_rehash: Used to detect hashes made with outdated parameters
 
 from flask_login import UserMixin
 # UserMixin: Provides default implementations for Flask-Login user authentication methods
@@ -45,13 +128,40 @@ from datetime import datetime, timezone
 from sqlalchemy.ext.hybrid import hybrid_property
 # hybrid_property: Allows properties to be used at both instance and class/query level in SQLAlchemy
 
+from markupsafe import escape
+# escape: Used to store upstream error messages as safe HTML
+
+from .rendering import render_markdown, renderer_version
+# render_markdown, renderer_version: Used to render answers and stamp the rendered HTML
+
+from sqlalchemy import tuple_, select, update, or_, and_
+# tuple_: Row-value comparison used as the keyset condition of paginated history queries
+# select, update, or_, and_: Used to claim queued jobs in a single UPDATE statement
+
+from datetime import timedelta
+# timedelta: Job lease durations
+
+from sqlalchemy import event, insert, case, func
+# event: Insert hooks maintaining the conversation counters
+# insert, case, func: Statements run by those hooks and by the counter recount
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+# sqlite_insert: INSERT ... ON CONFLICT DO UPDATE adding a chat to its daily usage row
+
+
+def _shorten(text, length):
+    # Single line, at most `length` characters
+    text = " ".join(text.split())
+    return text if len(text) <= length else text[:length - 1] + "\u2026"
+
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
     
     __id = db.Column("id", db.Integer, primary_key=True)
     __username = db.Column("username", db.String(80), unique=True, nullable=False)
-    __password_hash = db.Column("password", db.String(128), nullable=False)
+    __password_hash = db.Column("password", db.String(255), nullable=False)
     __chats = db.relationship('Chat', backref='user', lazy=True, cascade='all, delete-orphan')
+    __conversations = db.relationship('Conversation', backref='user', lazy=True, cascade='all, delete-orphan')
     
     @property
     def id(self):
@@ -75,29 +185,146 @@ class User(UserMixin, db.Model):
     def password(self, password):
         if not password:
             raise ValueError("Password cannot be empty")
-        self.__password_hash = generate_password_hash(password)
+        self.__password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.__password_hash, password)
+        return verify_password(self.__password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.__password_hash)
 
     @property
     def chats(self):
         return self.__chats
 
+    @property
+    def conversations(self):
+        return self.__conversations
+
     @classmethod
     def find_by_username(cls, username):
         return cls.query.filter(cls._User__username == username).first()
 
 
 
+class Conversation(db.Model):
+    __tablename__ = 'conversations'
+    # The thread list reads a user's threads by latest activity, its first row is the active thread
+    __table_args__ = (
+        db.Index("ix_conversations_user_id_last_activity", "user_id", "last_activity"),
+    )
+
+    TITLE_LENGTH = 80
+    SNIPPET_LENGTH = 120
+
+    __id = db.Column("id", db.Integer, primary_key=True)
+    __user_id = db.Column("user_id", db.Integer, db.ForeignKey('user.id'), nullable=False)
+    __title = db.Column("title", db.String(120), nullable=False)
+    __created_at = db.Column("created_at", db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    __last_activity = db.Column("last_activity", db.DateTime, nullable=False)
+    __message_count = db.Column("message_count", db.Integer, default=0, nullable=False)
+    __last_snippet = db.Column("last_snippet", db.String(200), nullable=True)
+
+    @property
+    def id(self):
+        return self.__id
+
+    @property
+    def user_id(self):
+        return self.__user_id
+
+    @user_id.setter
+    def user_id(self, value):
+        if not isinstance(value, int):
+            raise ValueError("user_id must be an integer")
+        self.__user_id = value
+
+    @property
+    def title(self):
+        return self.__title
+
+    @title.setter
+    def title(self, val):
+        if not val or not val.strip():
+            raise ValueError("Title cannot be empty")
+        self.__title = _shorten(val, self.TITLE_LENGTH)
+
+    @property
+    def created_at(self):
+        return self.__created_at
+
+    @property
+    def last_activity(self):
+        return self.__last_activity
+
+    @property
+    def message_count(self):
+        return self.__message_count
+
+    @property
+    def last_snippet(self):
+        return self.__last_snippet
+
+    @classmethod
+    def start(cls, user_id, prompt):
+        now = datetime.now(timezone.utc)
+        conversation = cls(user_id=user_id, title=prompt)
+        conversation.__created_at = conversation.__last_activity = now
+        db.session.add(conversation)
+        # Committed right away, the upstream call that follows must not hold SQLite's write lock
+        db.session.commit()
+        return conversation
+
+    @classmethod
+    def for_user(cls, user_id, limit):
+        columns = cls.__table__.c
+        return (cls.query
+                .filter(columns.user_id == user_id)
+                .order_by(columns.last_activity.desc(), columns.id.desc())
+                .limit(limit)
+                .all())
+
+    @classmethod
+    def latest(cls, user_id):
+        threads = cls.for_user(user_id, 1)
+        return threads[0] if threads else None
+
+    @classmethod
+    def owned_by(cls, conversation_id, user_id):
+        conversation = db.session.get(cls, conversation_id)
+        if conversation is None or conversation.user_id != user_id:
+            return None
+        return conversation
+
+    @classmethod
+    def recount(cls, condition):
+        conversations, chats = cls.__table__, Chat.__table__
+        # Each count is a range of the (conversation_id, timestamp) index
+        count = (select(func.count()).select_from(chats)
+                 .where(chats.c.conversation_id == conversations.c.id)
+                 .scalar_subquery())
+        db.session.execute(update(conversations).where(condition).values(message_count=count))
+        db.session.commit()
+
+
 class Chat(db.Model):
     __tablename__ = 'chats'
+    # Per-user history reads filter on user_id and sort on timestamp (the rowid breaks ties)
+    __table_args__ = (
+        db.Index("ix_chats_user_id_timestamp", "user_id", "timestamp"),
+        db.Index("ix_chats_conversation_id_timestamp", "conversation_id", "timestamp"),
+    )
 
     __id = db.Column("id", db.Integer, primary_key=True)
     __user_id = db.Column("user_id", db.Integer, db.ForeignKey('user.id'), nullable=False)
+    __conversation_id = db.Column("conversation_id", db.Integer, db.ForeignKey('conversations.id'), nullable=False)
     __timestamp = db.Column("timestamp", db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     __prompt = db.Column("prompt", db.Text, nullable=False)
     __response = db.Column("response", db.Text, nullable=False)
+    __raw_response = db.Column("raw_response", db.Text, nullable=True)
+    __render_version = db.Column("render_version", db.String(64), nullable=True)
+    __prompt_tokens = db.Column("prompt_tokens", db.Integer, nullable=True)
+    __completion_tokens = db.Column("completion_tokens", db.Integer, nullable=True)
 
     @property
     def id(self):
@@ -117,6 +344,16 @@ class Chat(db.Model):
             raise ValueError("user_id must be an integer")
         self.__user_id = value
 
+    @property
+    def conversation_id(self):
+        return self.__conversation_id
+
+    @conversation_id.setter
+    def conversation_id(self, value):
+        if not isinstance(value, int):
+            raise ValueError("conversation_id must be an integer")
+        self.__conversation_id = value
+
     @hybrid_property
     def timestamp(self):
         # Return actual datetime value on instance
@@ -127,6 +364,12 @@ class Chat(db.Model):
         # Return column for query usage
         return cls.__table__.c.timestamp
 
+    @timestamp.setter
+    def timestamp(self, value):
+        if not isinstance(value, datetime):
+            raise ValueError("timestamp must be a datetime")
+        self.__timestamp = value
+
     @property
     def prompt(self):
         return self.__prompt
@@ -145,4 +388,309 @@ class Chat(db.Model):
     def response(self, val):
         if not val:
             raise ValueError("Response cannot be empty")
-        self.__response = val
\ No newline at end of file
+        self.__response = val
+
+    @property
+    def raw_response(self):
+        return self.__raw_response
+
+    @property
+    def render_version(self):
+        return self.__render_version
+
+    @property
+    def prompt_tokens(self):
+        return self.__prompt_tokens
+
+    @property
+    def completion_tokens(self):
+        return self.__completion_tokens
+
+    def set_answer(self, markdown_text, backend=None):
+        if not markdown_text:
+            raise ValueError("Response cannot be empty")
+        self.__raw_response = markdown_text
+        self.rerender(backend)
+
+    def set_usage(self, usage):
+        usage = usage or {}
+        self.__prompt_tokens = usage.get("prompt_tokens")
+        self.__completion_tokens = usage.get("completion_tokens")
+
+    def set_error(self, message):
+        self.response = str(escape(message))
+        self.__raw_response = None
+        self.__render_version = None
+
+    def rerender(self, backend=None):
+        if self.__raw_response is None:
+            raise ValueError("Chat has no raw response to render")
+        self.response = render_markdown(self.__raw_response, backend)
+        self.__render_version = renderer_version(backend)
+
+    @classmethod
+    def history_page(cls, conversation_id, limit, before=None, keys_only=False):
+        """
+        Returns (chats, has_more): the `limit` most recent chats of the thread that come before the
+        `before` key, a (timestamp, id) tuple, in chronological order. Only `limit + 1` rows are read
+        whatever the size of the history. With `keys_only`, the chats are rows of (id, timestamp,
+        render_version), enough to find their cards in the fragment cache without loading the texts.
+        """
+        columns = cls.__table__.c
+        if keys_only:
+            query = db.session.query(columns.id, columns.timestamp, columns.render_version)
+        else:
+            query = cls.query
+        query = query.filter(columns.conversation_id == conversation_id)
+        if before is not None:
+            timestamp, chat_id = before
+            # A row value lets SQLite seek the (conversation_id, timestamp) index straight to the cursor
+            query = query.filter(tuple_(columns.timestamp, columns.id) < tuple_(timestamp, chat_id))
+        rows = query.order_by(columns.timestamp.desc(), columns.id.desc()).limit(limit + 1).all()
+        return list(reversed(rows[:limit])), len(rows) > limit
+
+    @classmethod
+    def contents(cls, ids):
+        """
+        Returns {id: (prompt, response)} for the given chat ids, the texts of the cards missing
+        from the fragment cache.
+        """
+        columns = cls.__table__.c
+        rows = db.session.query(columns.id, columns.prompt, columns.response).filter(columns.id.in_(ids))
+        return {row.id: (row.prompt, row.response) for row in rows}
+
+
+@event.listens_for(Chat, "before_insert")
+def _join_latest_conversation(mapper, connection, chat):
+    if chat.conversation_id is not None:
+        return
+    conversations = Conversation.__table__
+    conversation_id = connection.execute(
+        select(conversations.c.id)
+        .where(conversations.c.user_id == chat.user_id)
+        .order_by(conversations.c.last_activity.desc(), conversations.c.id.desc())
+        .limit(1)
+    ).scalar()
+    if conversation_id is None:
+        # Started when its first chat was, which may be an old one
+        now = chat.timestamp or datetime.now(timezone.utc)
+        conversation_id = connection.execute(
+            insert(conversations).values(user_id=chat.user_id, title=_shorten(chat.prompt, Conversation.TITLE_LENGTH),
+                                         created_at=now, last_activity=now, message_count=0)
+        ).inserted_primary_key[0]
+    chat.conversation_id = conversation_id
+
+
+@event.listens_for(Chat, "after_insert")
+def _count_in_conversation(mapper, connection, chat):
+    conversations = Conversation.__table__
+    # Jobs date their chat at submission, an older chat saved late must not move the thread back
+    newest = conversations.c.last_activity <= chat.timestamp
+    connection.execute(
+        update(conversations)
+        .where(conversations.c.id == chat.conversation_id)
+        .values(
+            message_count=conversations.c.message_count + 1,
+            last_activity=case((newest, chat.timestamp), else_=conversations.c.last_activity),
+            last_snippet=case((newest, _shorten(chat.prompt, Conversation.SNIPPET_LENGTH)),
+                              else_=conversations.c.last_snippet),
+        )
+    )
+
+
+@event.listens_for(Chat, "after_insert")
+def _add_to_daily_usage(mapper, connection, chat):
+    # The day of the insert, not of chat.timestamp: a queued prompt is dated at submission, its tokens
+    # are billed (and counted by the quota) the day a worker answers it
+    UsageDaily.add(connection, chat.user_id, datetime.now(timezone.utc).date(), chat.prompt_tokens or 0,
+                   chat.completion_tokens or 0)
+
+
+class UsageDaily(db.Model):
+    __tablename__ = 'usage_daily'
+
+    __user_id = db.Column("user_id", db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    __day = db.Column("day", db.Date, primary_key=True)
+    __requests = db.Column("requests", db.Integer, default=0, nullable=False)
+    __prompt_tokens = db.Column("prompt_tokens", db.Integer, default=0, nullable=False)
+    __completion_tokens = db.Column("completion_tokens", db.Integer, default=0, nullable=False)
+
+    @property
+    def user_id(self):
+        return self.__user_id
+
+    @property
+    def day(self):
+        return self.__day
+
+    @property
+    def requests(self):
+        return self.__requests
+
+    @property
+    def prompt_tokens(self):
+        return self.__prompt_tokens
+
+    @property
+    def completion_tokens(self):
+        return self.__completion_tokens
+
+    @property
+    def total_tokens(self):
+        return self.__prompt_tokens + self.__completion_tokens
+
+    @classmethod
+    def tokens_on(cls, user_id, day):
+        columns = cls.__table__.c
+        # A primary key lookup, whatever the size of the history
+        tokens = db.session.execute(
+            select(columns.prompt_tokens + columns.completion_tokens)
+            .where(columns.user_id == user_id, columns.day == day)
+        ).scalar()
+        return tokens or 0
+
+    @classmethod
+    def for_user(cls, user_id, days):
+        columns = cls.__table__.c
+        since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+        return (cls.query
+                .filter(columns.user_id == user_id, columns.day >= since)
+                .order_by(columns.day.desc())
+                .all())
+
+    @classmethod
+    def add(cls, connection, user_id, day, prompt_tokens, completion_tokens):
+        table = cls.__table__
+        statement = sqlite_insert(table).values(user_id=user_id, day=day, requests=1, prompt_tokens=prompt_tokens,
+                                                completion_tokens=completion_tokens)
+        # Relative, so concurrent workers never lose a count
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.day],
+            set_={
+                "requests": table.c.requests + 1,
+                "prompt_tokens": table.c.prompt_tokens + statement.excluded.prompt_tokens,
+                "completion_tokens": table.c.completion_tokens + statement.excluded.completion_tokens,
+            },
+        ))
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    # Workers claim the oldest queued job, pages list the pending jobs of a user
+    __table_args__ = (
+        db.Index("ix_jobs_status_id", "status", "id"),
+        db.Index("ix_jobs_user_id_status", "user_id", "status"),
+    )
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    PENDING = (QUEUED, RUNNING)
+
+    __id = db.Column("id", db.Integer, primary_key=True)
+    __user_id = db.Column("user_id", db.Integer, db.ForeignKey('user.id'), nullable=False)
+    __conversation_id = db.Column("conversation_id", db.Integer, db.ForeignKey('conversations.id'), nullable=True)
+    __prompt = db.Column("prompt", db.Text, nullable=False)
+    __status = db.Column("status", db.String(16), default=QUEUED, nullable=False)
+    __attempts = db.Column("attempts", db.Integer, default=0, nullable=False)
+    __created_at = db.Column("created_at", db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    __lease_expires_at = db.Column("lease_expires_at", db.DateTime, nullable=True)
+    __chat_id = db.Column("chat_id", db.Integer, db.ForeignKey('chats.id'), nullable=True)
+    __error = db.Column("error", db.Text, nullable=True)
+
+    @property
+    def id(self):
+        return self.__id
+
+    @property
+    def user_id(self):
+        return self.__user_id
+
+    @user_id.setter
+    def user_id(self, value):
+        if not isinstance(value, int):
+            raise ValueError("user_id must be an integer")
+        self.__user_id = value
+
+    @property
+    def conversation_id(self):
+        return self.__conversation_id
+
+    @conversation_id.setter
+    def conversation_id(self, value):
+        if value is not None and not isinstance(value, int):
+            raise ValueError("conversation_id must be an integer")
+        self.__conversation_id = value
+
+    @property
+    def prompt(self):
+        return self.__prompt
+
+    @prompt.setter
+    def prompt(self, val):
+        if not val:
+            raise ValueError("Prompt cannot be empty")
+        self.__prompt = val
+
+    @property
+    def status(self):
+        return self.__status
+
+    @property
+    def attempts(self):
+        return self.__attempts
+
+    @property
+    def created_at(self):
+        return self.__created_at
+
+    @property
+    def chat_id(self):
+        return self.__chat_id
+
+    @property
+    def error(self):
+        return self.__error
+
+    @classmethod
+    def claim_next(cls, lease_seconds):
+        jobs = cls.__table__
+        now = datetime.now(timezone.utc)
+        # Queued jobs, and running ones whose worker died without finishing them
+        candidate = (
+            select(jobs.c.id)
+            .where(or_(jobs.c.status == cls.QUEUED,
+                       and_(jobs.c.status == cls.RUNNING, jobs.c.lease_expires_at < now)))
+            .order_by(jobs.c.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        # One statement, so two workers can never claim the same job
+        job_id = db.session.execute(
+            update(jobs)
+            .where(jobs.c.id == candidate)
+            .values(status=cls.RUNNING, attempts=jobs.c.attempts + 1,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds))
+            .returning(jobs.c.id)
+        ).scalar()
+        db.session.commit()
+        return job_id
+
+    @classmethod
+    def pending_for(cls, user_id):
+        jobs = cls.__table__.c
+        return (cls.query
+                .filter(jobs.user_id == user_id, jobs.status.in_(cls.PENDING))
+                .order_by(jobs.id)
+                .all())
+
+    def finish(self, chat_id):
+        self.__status = self.DONE
+        self.__chat_id = chat_id
+        self.__lease_expires_at = None
+
+    def fail(self, message, retry):
+        self.__status = self.QUEUED if retry else self.FAILED
+        self.__error = message
+        self.__lease_expires_at = None
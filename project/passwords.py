@@ -0,0 +1,109 @@
+"""
+passwords.py
+This module hashes and verifies user passwords with tunable cost, off the request threads.
+Classes:
+    PasswordHasherBusy (Exception):
+        Raised when more hashes are pending than PASSWORD_HASH_MAX_PENDING; the login storm is shed
+        instead of queueing without bound.
+    PasswordHasher:
+        Runs the Werkzeug hash functions in a bounded thread pool. hashlib releases the GIL while
+        hashing, so at most `workers` hashes use CPU at once per worker process and the other request
+        threads keep being served meanwhile.
+        Parameters:
+            method (str): Werkzeug hash method with its cost, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000".
+            workers (int): Threads hashing concurrently.
+            max_pending (int): Hashes running or queued before new ones are refused.
+        Methods:
+            from_config(config): Class method building the hasher from the Flask config.
+            hash(password): Returns the hash of a password with the configured method.
+            verify(pwhash, password): Returns whether the password matches the stored hash.
+            needs_rehash(pwhash): Returns whether a stored hash was made with other parameters.
+Functions:
+    hash_password(password), verify_password(pwhash, password), needs_rehash(pwhash):
+        Use the hasher of the current app (`current_app.extensions["password_hasher"]`), or hash inline
+        with the default method outside of an application context (scripts, shell).
+Notes:
+    - Werkzeug hashes embed their method ("scrypt:32768:8:1$salt$hash"), so hashes made with older
+      parameters still verify and are upgraded on the next successful login.
+"""
+
+import threading
+# threading: Semaphore bounding the pending hashes
+
+from concurrent.futures import ThreadPoolExecutor
+# ThreadPoolExecutor: Pool the hashes run in
+
+from functools import lru_cache
+# lru_cache: Resolves the full parameters of a method once
+
+from flask import current_app, has_app_context
+# current_app, has_app_context: The app's hasher, when there is an app
+
+from werkzeug.security import generate_password_hash, check_password_hash
+# generate_password_hash, check_password_hash: The hash functions themselves
+
+DEFAULT_METHOD = "scrypt:32768:8:1"  # Werkzeug's default, spelled out
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # Werkzeug fills in the default cost of a bare method name ("scrypt", "pbkdf2"),
+    # let it tell us what it writes into the stored hashes
+    return generate_password_hash("", method).split("$", 1)[0]
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, workers=2, max_pending=64):
+        self.method = method
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            method=config["PASSWORD_HASH_METHOD"],
+            workers=config["PASSWORD_HASH_WORKERS"],
+            max_pending=config["PASSWORD_HASH_MAX_PENDING"],
+        )
+
+    def _run(self, fn, *args):
+        if not self._pending.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._pending.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split("$", 1)[0] != _method_prefix(self.method)
+
+
+def _hasher():
+    if has_app_context():
+        return current_app.extensions["password_hasher"]
+    return None
+
+
+def hash_password(password):
+    hasher = _hasher()
+    return hasher.hash(password) if hasher else generate_password_hash(password, DEFAULT_METHOD)
+
+
+def verify_password(pwhash, password):
+    hasher = _hasher()
+    return hasher.verify(pwhash, password) if hasher else check_password_hash(pwhash, password)
+
+
+def needs_rehash(pwhash):
+    hasher = _hasher()
+    return hasher.needs_rehash(pwhash) if hasher else pwhash.split("$", 1)[0] != _method_prefix(DEFAULT_METHOD)
@@ -0,0 +1,488 @@
+"""
+providers.py
+This module abstracts the LLM backends answering the prompts and routes each call to the fastest
+healthy one, failing over to the next when a backend errors.
+Classes:
+    UpstreamError (Exception):
+        Raised when a backend (or every backend) fails; the message is user facing. `status` is the
+        HTTP status of the upstream answer, None for network errors and timeouts.
+    Provider:
+        Interface of a backend.
+        Attributes:
+            name (str): Label of the backend in the config, the metrics and the router stats.
+            model (str): Model name the backend answers with.
+        Methods:
+            complete(messages): Returns (content, usage) for a chat completion `messages` array.
+            stream(messages): Generator yielding the content deltas; returns (finished, usage), finished
+                being False when the upstream stopped before marking the answer complete.
+    OpenAICompatibleProvider(Provider):
+        Any endpoint speaking the OpenAI chat completion protocol (JSON answers, Server-Sent Events with
+        `stream: true`), called through a pooled DeepSeekClient.
+    DeepSeekProvider(OpenAICompatibleProvider):
+        The DeepSeek API, using the app's client (`app.extensions["deepseek"]`).
+    StubProvider(Provider):
+        Local backend echoing the prompt after `latency` seconds, without network; for tests and load
+        benchmarks. With `fail=True` every call raises UpstreamError.
+    ProviderRouter:
+        Orders the providers for each call and fails over along that order.
+        - Keeps the outcome and latency of the last `window` calls of every provider (latency is the
+          time to the answer, or to the first delta of a stream).
+        - A provider whose error rate over its window reaches `error_rate` (after `min_samples` calls)
+          is unhealthy for `cooldown` seconds after its last error, and only tried after the healthy ones.
+        - Healthy providers are tried by increasing median (p50) latency; providers without samples yet
+          come first, so every backend gets measured.
+        - With a CircuitBreaker, backends whose circuit is open are skipped; when every circuit is open
+          the call fails at once with UNAVAILABLE instead of waiting on a timeout.
+        - With `hedge`, a completion whose first attempt has not answered after the provider's observed
+          p95 latency (at least `hedge_min_delay` seconds) gets a second attempt, on the next backend or
+          the same one, and the first answer wins. Streams are not hedged. Attempts only run on the pool
+          while it has an idle thread: otherwise the first attempt runs on the request thread, unhedged,
+          and no second attempt is sent, so a busy pool neither caps the calls nor adds load.
+        Methods:
+            from_config(config, deepseek): Class method building the providers listed in LLM_PROVIDERS.
+            order(): Returns the providers in the order the next call tries them.
+            complete(messages): Returns (provider, content, usage) from the first provider answering.
+            stream(messages): Generator yielding the deltas of the first provider answering; fails over
+                only until a delta has been relayed. Returns (finished, usage): whether the answer is
+                complete, and its token counts when the provider reported them.
+            stats(): Returns the calls, error rate, p50/p95 latency and health of every provider.
+Functions:
+    tee(stream, parts):
+        Relays the deltas of a stream generator while appending them to `parts`, and returns the
+        stream's return value.
+Notes:
+    - Statistics are kept per worker process; each worker learns the latencies of its own calls.
+    - With several providers, set DEEPSEEK_MAX_RETRIES low: failing over to another backend is faster
+      than retrying a failing one.
+    - Errors about the request itself (4xx other than 429) still fail over, but count neither against
+      a backend's health nor its circuit.
+    - A hedged call costs up to two upstream calls (and tokens); the attempts run on a pool of
+      `hedge_workers` threads per worker process (HEDGE_WORKERS, twice the request threads by default,
+      so every request thread can have both of its attempts running).
+"""
+
+import json
+# json: Used to decode the JSON chunks of a streamed completion
+
+import statistics
+# statistics: Median latency of a provider's window
+
+import threading
+# threading: Lock protecting the router statistics, shared by the worker's threads
+
+import time
+# time: Call timers and cooldowns
+
+from collections import deque
+# deque: Fixed-size window of the last calls of a provider
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+# ThreadPoolExecutor, wait: Run the attempts of a hedged call and keep the first answer
+
+from .breaker import CircuitBreaker, counts_as_failure
+# CircuitBreaker, counts_as_failure: Fail fast on backends that keep failing, shared by the workers
+
+from .client import DeepSeekClient
+# DeepSeekClient: Pooled HTTP client of the OpenAI-compatible backends
+
+from .context import estimate_tokens
+# estimate_tokens: Token counts reported by the stub backend
+
+from .metrics import CIRCUIT_REJECTIONS, HEDGED_REQUESTS, UPSTREAM_SECONDS, UPSTREAM_TOKENS
+# CIRCUIT_REJECTIONS, HEDGED_REQUESTS, UPSTREAM_SECONDS, UPSTREAM_TOKENS: Routing and upstream metrics
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def tee(stream, parts):
+    try:
+        while True:
+            try:
+                delta = next(stream)
+            except StopIteration as stop:
+                return stop.value
+            parts.append(delta)
+            yield delta
+    finally:
+        # Closing the stream releases the upstream connection when the consumer stops early
+        stream.close()
+
+
+def _error_message(response):
+    try:
+        error_msg = response.json().get("error", {}).get("message", "Unknown error")
+    except ValueError:
+        error_msg = "Unknown error"
+    return f"API Error {response.status_code}: {error_msg}"
+
+
+def _record_upstream(mode, provider, ok, start, usage=None):
+    UPSTREAM_SECONDS.labels(mode=mode, provider=provider, outcome="ok" if ok else "error").observe(
+        time.perf_counter() - start)
+    if usage:
+        UPSTREAM_TOKENS.labels(kind="prompt").inc(usage.get("prompt_tokens", 0))
+        UPSTREAM_TOKENS.labels(kind="completion").inc(usage.get("completion_tokens", 0))
+
+
+class Provider:
+    name = None
+    model = None
+
+    def complete(self, messages):
+        raise NotImplementedError
+
+    def stream(self, messages):
+        raise NotImplementedError
+
+
+class OpenAICompatibleProvider(Provider):
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.model = client.model
+
+    def complete(self, messages):
+        try:
+            response = self.client.post({"model": self.model, "messages": messages})
+            if response.status_code != 200:
+                raise UpstreamError(_error_message(response), response.status_code)
+            result = response.json()
+            return result["choices"][0]["message"]["content"], result.get("usage")
+        except UpstreamError:
+            raise
+        except Exception as e:
+            raise UpstreamError(f"Error: {str(e)}") from e
+
+    def stream(self, messages):
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        }
+        usage = None
+        try:
+            # Closing the response hands the connection back to the pool
+            with self.client.post(data, stream=True) as response:
+                if response.status_code != 200:
+                    raise UpstreamError(_error_message(response), response.status_code)
+
+                for line in response.iter_lines(decode_unicode=True):
+                    # Skip keep-alive blank lines and SSE comments
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        return True, usage
+                    chunk = json.loads(payload)
+                    # The last chunk carries the token counts when the upstream reports them
+                    usage = chunk.get("usage") or usage
+                    if not chunk.get("choices"):
+                        continue
+                    delta = chunk["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+            return False, usage
+        except UpstreamError:
+            raise
+        except Exception as e:
+            raise UpstreamError(f"Error: {str(e)}") from e
+
+
+class DeepSeekProvider(OpenAICompatibleProvider):
+    def __init__(self, client):
+        super().__init__("deepseek", client)
+
+
+class StubProvider(Provider):
+    def __init__(self, name="stub", model="stub", latency=0.0, fail=False):
+        self.name = name
+        self.model = model
+        self.latency = latency
+        self.fail = fail
+
+    def _answer(self, messages):
+        time.sleep(self.latency)
+        if self.fail:
+            raise UpstreamError(f"Error: {self.name} is unavailable")
+        prompt = messages[-1]["content"]
+        content = f"Echo: {prompt}"
+        usage = {
+            "prompt_tokens": sum(estimate_tokens(message["content"]) for message in messages),
+            "completion_tokens": estimate_tokens(content),
+        }
+        return content, usage
+
+    def complete(self, messages):
+        return self._answer(messages)
+
+    def stream(self, messages):
+        content, usage = self._answer(messages)
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            yield word if i == len(words) - 1 else word + " "
+        return True, usage
+
+
+class _Stats:
+    def __init__(self, window):
+        self.calls = deque(maxlen=window)  # (ok, seconds)
+        self.last_error = None
+
+
+class ProviderRouter:
+    UNAVAILABLE = "Error: The AI service is temporarily unavailable, please try again in a moment."
+
+    def __init__(self, providers, window=50, min_samples=5, error_rate=0.5, cooldown=30, clock=time.monotonic,
+                 breaker=None, hedge=False, hedge_min_delay=1.0, hedge_workers=200):
+        if not providers:
+            raise ValueError("At least one LLM provider is required.")
+        self.providers = list(providers)
+        self.min_samples = min_samples
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.breaker = breaker
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self._clock = clock
+        self._stats = {provider.name: _Stats(window) for provider in self.providers}
+        self._lock = threading.Lock()
+        # Hedged calls run off the request thread, which waits for the first answer
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="hedge") if hedge else None
+        # Idle threads of the pool: attempts are never queued, a queued attempt would count its wait
+        # against the hedge delay
+        self._idle = threading.BoundedSemaphore(hedge_workers) if hedge else None
+
+    @classmethod
+    def from_config(cls, config, deepseek):
+        providers = []
+        for name in config["LLM_PROVIDERS"]:
+            if name == "deepseek":
+                providers.append(DeepSeekProvider(deepseek))
+            elif name == "openai":
+                client = DeepSeekClient(
+                    url=config["OPENAI_COMPAT_API_URL"],
+                    api_key=config["OPENAI_COMPAT_API_KEY"],
+                    model=config["OPENAI_COMPAT_MODEL"],
+                    pool_size=config["DEEPSEEK_POOL_SIZE"],
+                    connect_timeout=config["DEEPSEEK_CONNECT_TIMEOUT"],
+                    read_timeout=config["DEEPSEEK_READ_TIMEOUT"],
+                    max_retries=config["DEEPSEEK_MAX_RETRIES"],
+                    retry_backoff=config["DEEPSEEK_RETRY_BACKOFF"],
+                )
+                providers.append(OpenAICompatibleProvider("openai", client))
+            elif name == "stub":
+                providers.append(StubProvider(latency=config["STUB_PROVIDER_LATENCY"]))
+            else:
+                raise ValueError(f"Unknown LLM provider {name!r} in LLM_PROVIDERS.")
+        return cls(
+            providers,
+            window=config["LLM_ROUTER_WINDOW"],
+            error_rate=config["LLM_ROUTER_ERROR_RATE"],
+            cooldown=config["LLM_ROUTER_COOLDOWN"],
+            breaker=CircuitBreaker.from_config(config) if config["CIRCUIT_BREAKER_ENABLED"] else None,
+            hedge=config["HEDGE_ENABLED"],
+            hedge_min_delay=config["HEDGE_MIN_DELAY"],
+            hedge_workers=config["HEDGE_WORKERS"],
+        )
+
+    @property
+    def model(self):
+        # Identifies the answers of this set of backends in the completion cache
+        return "+".join(provider.model for provider in self.providers)
+
+    def _summary(self, name, now):
+        stats = self._stats[name]
+        calls = len(stats.calls)
+        errors = sum(1 for ok, _ in stats.calls if not ok)
+        latencies = [seconds for ok, seconds in stats.calls if ok]
+        error_rate = errors / calls if calls else 0.0
+        healthy = not (
+            calls >= self.min_samples and error_rate >= self.error_rate
+            and stats.last_error is not None and now - stats.last_error < self.cooldown
+        )
+        return {
+            "calls": calls,
+            "error_rate": error_rate,
+            "p50": statistics.median(latencies) if latencies else None,
+            "p95": statistics.quantiles(latencies, n=20)[18] if len(latencies) >= max(2, self.min_samples) else None,
+            "healthy": healthy,
+        }
+
+    def order(self):
+        now = self._clock()
+        with self._lock:
+            summaries = {provider.name: self._summary(provider.name, now) for provider in self.providers}
+
+        def rank(provider):
+            summary = summaries[provider.name]
+            return (not summary["healthy"], summary["p50"] or 0.0)
+
+        # sorted() is stable, ties keep the LLM_PROVIDERS order
+        return sorted(self.providers, key=rank)
+
+    def _allow(self, provider):
+        if self.breaker is None or self.breaker.allow(provider.name):
+            return True
+        CIRCUIT_REJECTIONS.labels(provider=provider.name).inc()
+        return False
+
+    def _record(self, provider, ok, seconds, error=None):
+        if not ok and error is not None and not counts_as_failure(error):
+            # The backend answered, the request itself was refused (400, 401, ...)
+            if self.breaker is not None:
+                self.breaker.record(provider.name, True)
+            return
+        with self._lock:
+            stats = self._stats[provider.name]
+            stats.calls.append((ok, seconds))
+            if not ok:
+                stats.last_error = self._clock()
+        if self.breaker is not None:
+            self.breaker.record(provider.name, ok)
+
+    def _attempt(self, provider, messages):
+        start = time.perf_counter()
+        try:
+            content, usage = provider.complete(messages)
+        except UpstreamError as e:
+            self._record(provider, False, time.perf_counter() - start, e)
+            _record_upstream("complete", provider.name, False, start)
+            raise
+        self._record(provider, True, time.perf_counter() - start)
+        _record_upstream("complete", provider.name, True, start, usage)
+        return content, usage
+
+    def _hedge_delay(self, provider):
+        with self._lock:
+            p95 = self._summary(provider.name, self._clock())["p95"]
+        return None if p95 is None else max(p95, self.hedge_min_delay)
+
+    def complete(self, messages):
+        candidates = self.order()
+        if self.hedge:
+            delay = self._hedge_delay(candidates[0])
+            if delay is not None:
+                return self._complete_hedged(candidates, messages, delay)
+
+        error = None
+        for provider in candidates:
+            if not self._allow(provider):
+                continue
+            try:
+                content, usage = self._attempt(provider, messages)
+            except UpstreamError as e:
+                error = e
+                continue
+            return provider, content, usage
+        raise error or UpstreamError(self.UNAVAILABLE)
+
+    def _submit(self, provider, messages):
+        # Runs an attempt on an idle thread of the pool, None when every thread is busy
+        if not self._idle.acquire(blocking=False):
+            return None
+        future = self._executor.submit(self._attempt, provider, messages)
+        future.add_done_callback(lambda _: self._idle.release())
+        return future
+
+    def _complete_hedged(self, candidates, messages, delay):
+        queue = list(candidates)
+        pending = {}
+        error = None
+        primary = None
+        hedge = None  # Future of the second attempt, or False when none can be sent
+        while True:
+            if not pending:
+                # Start (or fail over to) the next backend the breaker lets through
+                while queue and primary is None:
+                    provider = queue.pop(0)
+                    if self._allow(provider):
+                        primary = provider
+                if primary is None:
+                    raise error or UpstreamError(self.UNAVAILABLE)
+                future = self._submit(primary, messages)
+                if future is None:
+                    # The pool is busy: no hedging for this attempt, it runs on the request thread
+                    HEDGED_REQUESTS.labels(result="skipped").inc()
+                    try:
+                        content, usage = self._attempt(primary, messages)
+                    except UpstreamError as e:
+                        error = e
+                        primary = None
+                        continue
+                    return primary, content, usage
+                pending[future] = primary
+                hedge = None
+
+            done, _ = wait(pending, timeout=None if hedge is not None else delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # The first attempt is slower than the usual 95%: send a second one, to the next
+                # backend when there is one, and keep whichever answers first
+                target = next((provider for provider in queue if self._allow(provider)), primary)
+                hedge = self._submit(target, messages)
+                if hedge is None:
+                    # Every thread of the pool is busy, a second attempt would only add to the load
+                    hedge = False
+                    HEDGED_REQUESTS.labels(result="skipped").inc()
+                    continue
+                if target in queue:
+                    queue.remove(target)
+                pending[hedge] = target
+                HEDGED_REQUESTS.labels(result="fired").inc()
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    content, usage = future.result()
+                except UpstreamError as e:
+                    error = e
+                    continue
+                if future is hedge:
+                    HEDGED_REQUESTS.labels(result="won").inc()
+                # The slower attempt finishes in the background, its answer is dropped
+                return provider, content, usage
+            if not pending:
+                primary = None
+
+    def stream(self, messages):
+        error = None
+        for provider in self.order():
+            if not self._allow(provider):
+                continue
+            start = time.perf_counter()
+            first = None  # Seconds to the first delta
+            stream = provider.stream(messages)
+            try:
+                while True:
+                    try:
+                        delta = next(stream)
+                    except StopIteration as stop:
+                        finished, usage = stop.value
+                        break
+                    if first is None:
+                        first = time.perf_counter() - start
+                    yield delta
+            except UpstreamError as e:
+                self._record(provider, False, first if first is not None else time.perf_counter() - start, e)
+                _record_upstream("stream", provider.name, False, start)
+                if first is not None:
+                    # Deltas were relayed already, the answer cannot switch to another backend
+                    raise
+                error = e
+                continue
+            finally:
+                stream.close()
+            self._record(provider, finished, first if first is not None else time.perf_counter() - start)
+            _record_upstream("stream", provider.name, finished, start, usage)
+            return finished, usage
+        raise error or UpstreamError(self.UNAVAILABLE)
+
+    def stats(self):
+        now = self._clock()
+        with self._lock:
+            return {provider.name: self._summary(provider.name, now) for provider in self.providers}
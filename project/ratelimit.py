@@ -0,0 +1,120 @@
+"""
+ratelimit.py
+This module defines a SQLite storage backend for the `limits` library used by Flask-Limiter, so
+that rate-limit counters are shared by every gunicorn worker and survive worker restarts, without
+running Redis or Memcached.
+Classes:
+    SQLiteStorage (limits.storage.Storage):
+        Registered for the "sqlite" scheme: `RATELIMIT_STORAGE_URI = "sqlite:///path/to/file.db"`
+        (an absolute path needs four slashes, like SQLAlchemy URIs).
+        Each counter is one row (key, count, expires_at). Incrementing is a single UPSERT, so
+        concurrent workers never lose a hit, and restarts the window once the row has expired.
+        Supports the fixed-window strategy (Flask-Limiter's default).
+Functions:
+    chat_cost(): Cost of a /chat request for the cost-weighted chat limit, growing with the prompt length.
+    user_or_address(): Rate-limit key of the chat routes, the user id when logged in, else the client address.
+    login_username(): Rate-limit key of login attempts per targeted username.
+Notes:
+    - Importing this module registers the scheme; `project.extensions` imports it before the limiter
+      is initialized.
+    - Expired rows are ignored on read and purged every PURGE_EVERY increments.
+"""
+
+import time
+# time: Window expiry timestamps
+
+import sqlite3
+# sqlite3: Error types reported to Flask-Limiter
+
+from flask import current_app, request
+# current_app, request: Used to weight /chat requests by prompt length and build keys
+
+from flask_limiter.util import get_remote_address
+# get_remote_address: Fallback key for anonymous clients
+
+from flask_login import current_user
+# current_user: Chat limits are counted per user, not per (possibly shared) address
+
+from limits.storage import Storage
+# Storage: Base class; subclasses are registered for their STORAGE_SCHEME
+
+from .shared_sqlite import SharedSQLite
+# SharedSQLite: Per-thread connections to the SQLite file shared by the workers
+
+
+class SQLiteStorage(Storage):
+    STORAGE_SCHEME = ["sqlite"]
+    PURGE_EVERY = 1000  # Increments between two purges of expired rows
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS ratelimit ("
+        "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL);"
+    )
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        self._db = SharedSQLite(uri[len("sqlite:///"):], self.SCHEMA)
+        self._increments = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        conn = self._db.connection()
+        count = conn.execute(
+            "INSERT INTO ratelimit (key, count, expires_at) VALUES (:key, :amount, :expires_at) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "count = CASE WHEN expires_at <= :now THEN :amount ELSE count + :amount END, "
+            "expires_at = CASE WHEN expires_at <= :now THEN :expires_at ELSE expires_at END "
+            "RETURNING count",
+            {"key": key, "amount": amount, "expires_at": now + expiry, "now": now},
+        ).fetchone()[0]
+
+        self._increments += 1
+        if self._increments % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM ratelimit WHERE expires_at <= ?", (now,))
+        return count
+
+    def get(self, key):
+        row = self._db.connection().execute(
+            "SELECT count FROM ratelimit WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._db.connection().execute(
+            "SELECT expires_at FROM ratelimit WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            self._db.connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._db.connection().execute("DELETE FROM ratelimit").rowcount
+
+    def clear(self, key):
+        self._db.connection().execute("DELETE FROM ratelimit WHERE key = ?", (key,))
+
+
+def chat_cost():
+    # Long prompts cost more upstream tokens, so they consume more of the limit
+    prompt = request.form.get("prompt", "")
+    return 1 + len(prompt) // current_app.config["CHAT_RATELIMIT_COST_CHARS"]
+
+
+def user_or_address():
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    return get_remote_address()
+
+
+def login_username():
+    # Spreading attempts on one account over many addresses must not bypass the limit
+    return "login:" + request.form.get("username", "").strip().casefold()
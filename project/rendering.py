@@ -0,0 +1,72 @@
+"""
+rendering.py
+This module renders the Markdown answers of the assistant to HTML with a selectable backend.
+Constants:
+    RENDER_REVISION (int): Local revision of the rendering pipeline. Bump it whenever the output
+        of a backend changes (options, sanitizing, ...) so stored HTML is re-rendered.
+    RENDERERS (dict): Maps backend names to their render functions:
+        - "markdown2": markdown2, the historical renderer, in its "escape" safe mode.
+        - "markdown-it": markdown-it-py (CommonMark + tables), several times faster.
+        Both escape the raw HTML of the Markdown instead of passing it through, and drop
+        `javascript:` links: the rendered HTML is shown unescaped, and the Markdown comes from the
+        model or from an imported file.
+Functions:
+    render_markdown(text, backend=None):
+        Renders Markdown to HTML with the given backend, or the MARKDOWN_RENDERER configured on
+        the current app ("markdown2" outside of an application context).
+    renderer_version(backend=None):
+        Returns the version stamp stored next to rendered HTML: backend name, library version and
+        RENDER_REVISION. HTML with a different stamp is stale.
+"""
+
+from functools import partial
+# partial: Binds the safe mode of markdown2
+
+from importlib.metadata import version
+# version: Used to stamp rendered HTML with the version of the rendering library
+
+from flask import current_app, has_app_context
+# current_app, has_app_context: Used to read the configured backend when running inside the app
+
+from markdown2 import markdown
+# markdown: markdown2 renderer
+
+from markdown_it import MarkdownIt
+# MarkdownIt: markdown-it-py renderer
+
+from .metrics import RENDER_SECONDS, timed
+# RENDER_SECONDS, timed: Render time histogram, per backend
+
+# 2: markdown2 escapes raw HTML
+RENDER_REVISION = 2
+
+_markdown_it = MarkdownIt("commonmark", {"html": False}).enable("table")
+
+RENDERERS = {
+    "markdown2": partial(markdown, safe_mode="escape"),
+    "markdown-it": _markdown_it.render,
+}
+
+_LIBRARIES = {
+    "markdown2": "markdown2",
+    "markdown-it": "markdown-it-py",
+}
+
+
+def _backend(backend):
+    if backend is None:
+        backend = current_app.config["MARKDOWN_RENDERER"] if has_app_context() else "markdown2"
+    if backend not in RENDERERS:
+        raise ValueError(f"Unknown Markdown renderer: {backend}")
+    return backend
+
+
+def render_markdown(text, backend=None):
+    backend = _backend(backend)
+    with timed(RENDER_SECONDS, backend=backend):
+        return RENDERERS[backend](text)
+
+
+def renderer_version(backend=None):
+    backend = _backend(backend)
+    return f"{backend}-{version(_LIBRARIES[backend])}-r{RENDER_REVISION}"
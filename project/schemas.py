@@ -17,11 +17,15 @@ Classes:
         Schema for chat prompt input.
         Fields:
             prompt (str): The chat prompt. Must be up to 1000 characters and not empty.
+            conversation_id (int, optional): The thread the prompt continues; None for the latest thread.
+            new_conversation (bool): Start a new thread instead (sent by the /new page).
         Validators:
             not_empty: Ensures that the prompt field is not empty or whitespace.
+            blank_is_none: Treats an empty conversation_id form field as None.
 """
 
 from pydantic import BaseModel, Field, field_validator # BaseModel: Pydantic base class for data validation
+from typing import Optional # Optional: For the conversation_id field, absent when starting a thread
 
 class UserBaseSchema(BaseModel):
     username: str = Field(..., min_length=3, max_length=80)
@@ -45,6 +49,8 @@ class UserLoginSchema(UserBaseSchema):
 
 class ChatPromptSchema(BaseModel):
     prompt: str = Field(..., max_length=1000)
+    conversation_id: Optional[int] = None
+    new_conversation: bool = False
 
     @field_validator("prompt")
     @classmethod
@@ -52,3 +58,8 @@ class ChatPromptSchema(BaseModel):
         if not value.strip():
             raise ValueError("Prompt cannot be empty.")
         return value
+
+    @field_validator("conversation_id", mode="before")
+    @classmethod
+    def blank_is_none(cls, value):
+        return None if value == "" else value
@@ -0,0 +1,209 @@
+"""
+search.py
+This module provides full-text search over the chat history: a SQLite FTS5 index kept in sync with
+`chats` by triggers, so finding an old answer never scans the text columns with LIKE.
+Blueprints:
+    bp: Flask Blueprint for the search page.
+Routes:
+    - "/search" (GET): Search page of the user's chats.
+        * Redirects to login if the user is not authenticated.
+        * Reads the words to find from `q` and the page number from `page` (1 by default).
+        * Renders 'search.html' with SEARCH_PAGE_SIZE results, best first: the prompt with the matching
+          words highlighted, a highlighted snippet of the answer and a link to the thread.
+Functions:
+    create_index(connection): Creates the FTS5 table and its triggers, if missing.
+    drop_index(connection): Drops the FTS5 table (its triggers go with `chats`).
+    rebuild_index(batch_size=5000): Re-indexes every chat, `batch_size` chats per transaction, and
+        returns how many were indexed.
+    match_expression(user_id, query): Builds the FTS5 query of a user's search, or None when the
+        search has no word.
+    search(user_id, query, page=1, per_page=20): Returns (results, has_more), one page of the user's
+        chats matching the query ranked by bm25; each result holds the chat id, thread id, timestamp and
+        the highlighted prompt and answer snippet (Markup).
+    include_object(object, name, type_, reflected, compare_to): Alembic autogenerate filter hiding
+        the FTS5 table and its shadow tables, which are not models.
+Index:
+    chats_fts(prompt, answer, owner), rowid = chats.id:
+    - answer is the raw Markdown answer, or the stored HTML for failed requests and legacy rows.
+    - owner is the token "u<user_id>". Every search is `owner:u<id> AND (words)`, so FTS5 intersects
+      the posting list of the user with those of the words instead of ranking the matches of every
+      user and filtering them afterwards.
+    - The triggers index inserted chats, drop deleted ones and re-index chats whose prompt, answer or
+      user changed (re-rendering the HTML of a Markdown answer does not touch the index).
+Notes:
+    - The index stores its own copy of the text (a standalone FTS5 table): snippets need the text,
+      and the owner token is not a column of `chats`.
+    - The table is created with `chats` (create_all, `flask init-db`) or by migration 0007; databases
+      predating it, or whose index was lost, are re-indexed with `flask rebuild-search-index`.
+    - Search words are quoted, FTS5 operators typed by the user are searched as plain words.
+    - Pages are read with LIMIT/OFFSET, deep pages re-rank the skipped results.
+"""
+
+import re
+# re: Splits the search into words
+
+from flask import Blueprint, render_template, request, redirect, url_for, current_app
+# Blueprint: For the search route
+# render_template: To render the results page
+# request: To read the search words and the page number
+# redirect, url_for: To send anonymous users to the login page
+# current_app: To read SEARCH_PAGE_SIZE
+
+from flask_login import current_user
+# current_user: The user whose chats are searched
+
+from markupsafe import Markup, escape
+# Markup, escape: Snippets are escaped, only the highlight marks are HTML
+
+from sqlalchemy import event, select, text, bindparam, Integer, DateTime, Text
+# event: Creates the index with the `chats` table
+# select, text, bindparam: Batch bounds and the FTS5 statements
+# Integer, DateTime, Text: Result types of the search query
+
+from .db import db
+# db: SQLAlchemy database instance
+
+from .models import Chat
+# Chat: The indexed table
+
+
+bp = Blueprint('search', __name__)
+
+TABLE = "chats_fts"
+# Delimiters of the matching words in the FTS5 output, replaced by <mark> once the text is escaped
+OPEN, CLOSE = "\x02", "\x03"
+MAX_WORDS = 16
+
+_ANSWER = "coalesce({row}.raw_response, {row}.response)"
+_INDEX_ROW = ("INSERT INTO chats_fts (rowid, prompt, answer, owner) "
+              "VALUES ({row}.id, {row}.prompt, " + _ANSWER + ", 'u' || {row}.user_id);")
+
+SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts USING fts5("
+    "prompt, answer, owner, tokenize = 'unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS chats_fts_insert AFTER INSERT ON chats BEGIN "
+    + _INDEX_ROW.format(row="new") + " END",
+    "CREATE TRIGGER IF NOT EXISTS chats_fts_delete AFTER DELETE ON chats BEGIN "
+    "DELETE FROM chats_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS chats_fts_update AFTER UPDATE OF prompt, response, raw_response, user_id "
+    "ON chats WHEN old.prompt IS NOT new.prompt OR old.user_id IS NOT new.user_id OR "
+    + _ANSWER.format(row="old") + " IS NOT " + _ANSWER.format(row="new") + " BEGIN "
+    "DELETE FROM chats_fts WHERE rowid = old.id; " + _INDEX_ROW.format(row="new") + " END",
+]
+
+
+def create_index(connection):
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in SCHEMA:
+        connection.execute(text(statement))
+
+
+def drop_index(connection):
+    if connection.dialect.name != "sqlite":
+        return
+    connection.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+
+# Created and dropped with `chats`, so create_all and drop_all keep them together
+event.listen(Chat.__table__, "after_create", lambda target, connection, **kw: create_index(connection))
+event.listen(Chat.__table__, "before_drop", lambda target, connection, **kw: drop_index(connection))
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (type_ == "table" and name.startswith(TABLE))
+
+
+def rebuild_index(batch_size=5000):
+    create_index(db.session.connection())
+    db.session.commit()
+
+    chats = Chat.__table__.c
+    last_id, total = 0, 0
+    while True:
+        # Walk the primary key; each range is cleared and re-indexed in one transaction, so chats
+        # inserted meanwhile (indexed by the trigger) are never indexed twice
+        ids = db.session.execute(
+            select(chats.id).where(chats.id > last_id).order_by(chats.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        bounds = {"first": last_id, "last": ids[-1]}
+        db.session.execute(text("DELETE FROM chats_fts WHERE rowid > :first AND rowid <= :last"), bounds)
+        db.session.execute(text(
+            "INSERT INTO chats_fts (rowid, prompt, answer, owner) "
+            "SELECT id, prompt, " + _ANSWER.format(row="chats") + ", 'u' || user_id "
+            "FROM chats WHERE id > :first AND id <= :last"
+        ), bounds)
+        db.session.commit()
+        total += len(ids)
+        last_id = ids[-1]
+
+    # Entries past the last chat belong to deleted chats
+    db.session.execute(text("DELETE FROM chats_fts WHERE rowid > :last AND rowid NOT IN "
+                            "(SELECT id FROM chats WHERE id > :last)"), {"last": last_id})
+    # Merges the index segments written batch by batch
+    db.session.execute(text("INSERT INTO chats_fts (chats_fts) VALUES ('optimize')"))
+    db.session.commit()
+    return total
+
+
+def match_expression(user_id, query):
+    words = re.findall(r"\w+", query)[:MAX_WORDS]
+    if not words:
+        return None
+    # Quoted, so AND, NEAR, column filters or stars in the search are plain words
+    terms = " AND ".join(f'"{word}"' for word in words)
+    return f'owner : "u{user_id}" AND ({terms})'
+
+
+def _highlighted(value):
+    return Markup(str(escape(value or "")).replace(OPEN, "<mark>").replace(CLOSE, "</mark>"))
+
+
+def search(user_id, query, page=1, per_page=20):
+    expression = match_expression(user_id, query)
+    if expression is None:
+        return [], False
+
+    # Ranks first, reading only the rowids; the snippets and the chat columns are built for one page
+    # of results, not for every match of a common word
+    ranked = db.session.execute(text(
+        "SELECT rowid FROM chats_fts WHERE chats_fts MATCH :expression "
+        # Matches in the prompt weigh double, the owner token never counts
+        "ORDER BY bm25(chats_fts, 2.0, 1.0, 0.0) LIMIT :limit OFFSET :offset"
+    ), {"expression": expression, "limit": per_page + 1, "offset": (page - 1) * per_page}).scalars().all()
+    ids = ranked[:per_page]
+    if not ids:
+        return [], False
+
+    rows = db.session.execute(text(
+        "SELECT chats.id, chats.conversation_id, chats.timestamp, "
+        "highlight(chats_fts, 0, :open, :close) AS prompt, "
+        "snippet(chats_fts, 1, :open, :close, '…', 24) AS answer "
+        "FROM chats_fts JOIN chats ON chats.id = chats_fts.rowid "
+        "WHERE chats_fts MATCH :expression AND chats_fts.rowid IN :ids"
+    ).bindparams(bindparam("ids", expanding=True))
+     .columns(id=Integer, conversation_id=Integer, timestamp=DateTime, prompt=Text, answer=Text),
+        {"open": OPEN, "close": CLOSE, "expression": expression, "ids": ids}).all()
+    by_id = {row.id: row for row in rows}
+
+    results = [{
+        "id": row.id,
+        "conversation_id": row.conversation_id,
+        "timestamp": row.timestamp,
+        "prompt": _highlighted(row.prompt),
+        "answer": _highlighted(row.answer),
+    } for row in (by_id[chat_id] for chat_id in ids if chat_id in by_id)]
+    return results, len(ranked) > per_page
+
+
+@bp.route("/search")
+def search_page():
+    if not current_user.is_authenticated:
+        return redirect(url_for("auth.login"))
+
+    query = request.args.get("q", "").strip()
+    page = max(1, request.args.get("page", 1, type=int))
+    results, has_more = search(current_user.id, query, page, current_app.config["SEARCH_PAGE_SIZE"])
+    return render_template("search.html", query=query, page=page, results=results, has_more=has_more)
@@ -0,0 +1,47 @@
+"""
+shared_sqlite.py
+This module provides access to the small SQLite files used to share state between the gunicorn
+worker processes without an external service (shared completion cache, rate-limit counters, ...).
+Classes:
+    SharedSQLite:
+        Opens one connection per thread to a SQLite file, lazily, in autocommit mode with WAL
+        journaling and a busy timeout, and creates the given schema on first use.
+        Parameters:
+            path (str): Path of the SQLite file; missing parent directories are created.
+            schema (str): SQL script (CREATE ... IF NOT EXISTS statements) run on every new connection.
+            timeout (float): Seconds a writer waits for a lock before failing.
+        Methods:
+            connection(): Returns the connection of the calling thread.
+Notes:
+    - sqlite3 connections cannot be shared between threads, hence one per thread.
+    - Connections are opened after gunicorn forks its workers, never inherited from the master.
+"""
+
+import os
+# os: Used to create the directory of the SQLite file
+
+import sqlite3
+# sqlite3: Standard library SQLite driver
+
+import threading
+# threading: Per-thread connection storage
+
+
+class SharedSQLite:
+    def __init__(self, path, schema, timeout=5):
+        self.path = path
+        self.schema = schema
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,206 @@
+/*
+
+    Description:
+    Streams assistant answers into the chat page as they are generated.
+
+    Usage:
+    Loaded by index.html. When the browser supports fetch streaming, the prompt form is
+    submitted to the URL in its `data-stream-url` attribute and the Server-Sent Events
+    sent back by /chat/stream are rendered while they arrive:
+        - `data: {"delta": "..."}`          appends raw text to the assistant card.
+        - `event: done` `{"html": "...", "conversation": id}`   replaces the card with the rendered
+                                            Markdown; the thread id is kept in the form, so a
+                                            prompt starting a thread is followed by prompts in it.
+        - `event: error` `{"error": "..."}` shows the error in the card.
+
+    Prompts queued for the background workers are shown with a placeholder answer carrying
+    `data-job-url`; the job is polled (with a growing delay) until it is done or failed.
+
+    It also loads older history: the "Load older messages" button (rendered only when older
+    messages exist) fetches the next page from the /history URL of the thread with its cursor and prepends it,
+    automatically when the button scrolls into view.
+
+    Note:
+    Without JavaScript (or streaming support) the form falls back to a normal POST to /chat.
+*/
+
+(function () {
+    "use strict";
+
+    var container = document.getElementById("chat-container");
+    if (!container || !window.fetch) {
+        return;
+    }
+
+    // Build a card matching the server rendered conversation markup,
+    // appended to the conversation or inserted before `reference`
+    function card(title, headerClass, marginClass, reference) {
+        var wrapper = document.createElement("div");
+        wrapper.className = "card " + marginClass;
+        var header = document.createElement("div");
+        header.className = "card-header text-white " + headerClass;
+        header.textContent = title;
+        var body = document.createElement("div");
+        body.className = "card-body";
+        var text = document.createElement("div");
+        text.className = "card-text";
+        body.appendChild(text);
+        wrapper.appendChild(header);
+        wrapper.appendChild(body);
+        container.insertBefore(wrapper, reference || null);
+        return text;
+    }
+
+    var older = document.getElementById("load-older");
+    if (older) {
+        var loading = false;
+
+        function loadOlder() {
+            if (loading || !older.dataset.cursor) {
+                return;
+            }
+            loading = true;
+            var separator = older.dataset.url.indexOf("?") < 0 ? "?" : "&";
+            var url = older.dataset.url + separator + "before=" + encodeURIComponent(older.dataset.cursor);
+            fetch(url, { credentials: "same-origin" })
+                .then(function (response) { return response.json(); })
+                .then(function (page) {
+                    // Keep the messages on screen in place while the page grows above them
+                    var first = container.firstChild;
+                    var height = document.documentElement.scrollHeight;
+                    page.chats.forEach(function (chat) {
+                        card("You", "bg-primary", "mb-2", first).textContent = chat.prompt;
+                        card("Assistant", "bg-success", "mb-4", first).innerHTML = chat.response;
+                    });
+                    window.scrollBy(0, document.documentElement.scrollHeight - height);
+
+                    if (page.next) {
+                        older.dataset.cursor = page.next;
+                    } else {
+                        older.remove();
+                    }
+                })
+                .finally(function () {
+                    loading = false;
+                });
+        }
+
+        older.addEventListener("click", loadOlder);
+        if (window.IntersectionObserver) {
+            new IntersectionObserver(function (entries) {
+                if (entries[0].isIntersecting) {
+                    loadOlder();
+                }
+            }).observe(older);
+        }
+    }
+
+    // Poll a queued prompt until a worker answered it
+    function pollJob(placeholder, delay) {
+        fetch(placeholder.dataset.jobUrl, { credentials: "same-origin" })
+            .then(function (response) { return response.json(); })
+            .then(function (job) {
+                if (job.status === "done") {
+                    placeholder.classList.remove("text-muted");
+                    placeholder.innerHTML = job.chat.response;
+                } else if (job.status === "failed") {
+                    placeholder.classList.remove("text-muted");
+                    placeholder.textContent = job.error;
+                } else {
+                    setTimeout(pollJob, delay, placeholder, Math.min(delay * 1.5, 5000));
+                }
+            })
+            .catch(function () {
+                setTimeout(pollJob, 5000, placeholder, 5000);
+            });
+    }
+
+    document.querySelectorAll("[data-job-url]").forEach(function (placeholder) {
+        pollJob(placeholder, 1000);
+    });
+
+    var form = document.getElementById("prompt-form");
+    // Without a stream URL (prompts are queued) the form is posted normally
+    if (!form || !form.dataset.streamUrl || !window.ReadableStream || !window.TextDecoder) {
+        return;
+    }
+
+    // Parse one Server-Sent Event frame into {event, data}
+    function parseFrame(frame) {
+        var event = "message";
+        var data = "";
+        frame.split("\n").forEach(function (line) {
+            if (line.indexOf("event:") === 0) {
+                event = line.slice(6).trim();
+            } else if (line.indexOf("data:") === 0) {
+                data += line.slice(5).trim();
+            }
+        });
+        return { event: event, data: data ? JSON.parse(data) : {} };
+    }
+
+    form.addEventListener("submit", function (e) {
+        var textarea = form.querySelector("textarea[name='prompt']");
+        var prompt = textarea.value;
+        if (!prompt.trim()) {
+            return; // Let the server flash the validation error
+        }
+        e.preventDefault();
+
+        var body = new FormData(form);
+        var button = form.querySelector("button[type='submit']");
+        button.disabled = true;
+        textarea.value = "";
+
+        card("You", "bg-primary", "mb-2").textContent = prompt;
+        var answer = card("Assistant", "bg-success", "mb-4");
+        var raw = "";
+
+        fetch(form.dataset.streamUrl, { method: "POST", body: body, credentials: "same-origin" })
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error("HTTP " + response.status);
+                }
+                var reader = response.body.getReader();
+                var decoder = new TextDecoder();
+                var buffer = "";
+
+                function pump() {
+                    return reader.read().then(function (result) {
+                        if (result.done) {
+                            return;
+                        }
+                        buffer += decoder.decode(result.value, { stream: true });
+                        var frames = buffer.split("\n\n");
+                        buffer = frames.pop();
+                        frames.forEach(function (frame) {
+                            var message = parseFrame(frame);
+                            if (message.event === "done") {
+                                answer.innerHTML = message.data.html;
+                                form.elements.conversation_id.value = message.data.conversation;
+                            } else if (message.event === "error") {
+                                answer.textContent = message.data.error;
+                            } else if (message.data.delta) {
+                                raw += message.data.delta;
+                                answer.textContent = raw;
+                            }
+                        });
+                        return pump();
+                    });
+                }
+                return pump();
+            })
+            .catch(function () {
+                if (raw) {
+                    answer.textContent = raw + "\n\n[stream interrupted]";
+                    return;
+                }
+                // Streaming failed before any output, fall back to the classic form submission
+                textarea.value = prompt;
+                form.submit();
+            })
+            .finally(function () {
+                button.disabled = false;
+            });
+    });
+})();
@@ -0,0 +1,74 @@
+"""
+usage.py
+This module reports the token usage of each user and enforces the daily token quota, both from the
+per-user daily totals of `usage_daily` (see UsageDaily), never from an aggregate over `chats`.
+Blueprints:
+    bp: Flask Blueprint for the usage page.
+Routes:
+    - "/usage" (GET): Usage page of the user.
+        * Redirects to login if the user is not authenticated.
+        * Shows today's tokens against TOKEN_QUOTA_DAILY, and the requests, prompt and completion tokens
+          of each of the last USAGE_DAYS days with activity, with their estimated cost when
+          TOKEN_PRICE_PROMPT / TOKEN_PRICE_COMPLETION are set.
+Functions:
+    today(): The current UTC date, the day the quota counts.
+    quota_exceeded(user_id): Whether the user has used TOKEN_QUOTA_DAILY tokens today (always False when
+        the quota is 0). One primary key read. Tokens count on the UTC day they were billed: a prompt
+        queued before midnight and answered after it counts on the new day.
+    cost(prompt_tokens, completion_tokens): Estimated cost of tokens with the configured prices.
+Constants:
+    QUOTA_MESSAGE: User facing message of a prompt refused by the quota.
+Notes:
+    - The quota is checked before the upstream call ("/chat", "/chat/stream" and the job workers), with
+      the tokens already used: the answer that crosses the quota is still delivered, the next prompt is
+      refused until the next UTC day.
+    - Tokens are those the upstream billed: cached answers, and answers shared with an identical call in
+      flight (see SingleFlight), count as requests without tokens.
+"""
+
+from datetime import datetime, timezone
+# datetime, timezone: The UTC day of the quota
+
+from flask import Blueprint, render_template, redirect, url_for, current_app
+# Blueprint: For the usage route
+# render_template: To render the usage page
+# redirect, url_for: To send anonymous users to the login page
+# current_app: To read the quota, the prices and USAGE_DAYS
+
+from flask_login import current_user
+# current_user: The user whose usage is shown
+
+from .models import UsageDaily
+# UsageDaily: Per-user daily totals
+
+
+bp = Blueprint('usage', __name__)
+
+QUOTA_MESSAGE = "You have used your daily token quota, please try again tomorrow."
+
+
+def today():
+    return datetime.now(timezone.utc).date()
+
+
+def quota_exceeded(user_id):
+    quota = current_app.config["TOKEN_QUOTA_DAILY"]
+    return bool(quota) and UsageDaily.tokens_on(user_id, today()) >= quota
+
+
+def cost(prompt_tokens, completion_tokens):
+    # Prices are per million tokens
+    config = current_app.config
+    return (prompt_tokens * config["TOKEN_PRICE_PROMPT"] + completion_tokens * config["TOKEN_PRICE_COMPLETION"]) / 1_000_000
+
+
+@bp.route("/usage")
+def usage_page():
+    if not current_user.is_authenticated:
+        return redirect(url_for("auth.login"))
+
+    days = UsageDaily.for_user(current_user.id, current_app.config["USAGE_DAYS"])
+    used = days[0].total_tokens if days and days[0].day == today() else 0
+    priced = bool(current_app.config["TOKEN_PRICE_PROMPT"] or current_app.config["TOKEN_PRICE_COMPLETION"])
+    return render_template("usage.html", days=days, used=used, quota=current_app.config["TOKEN_QUOTA_DAILY"],
+                           cost=cost if priced else None)
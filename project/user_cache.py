@@ -0,0 +1,146 @@
+"""
+user_cache.py
+This module caches the identity of logged-in users so that Flask-Login's user loader does not query
+the database on every authenticated request.
+Classes:
+    UserIdentity:
+        Lightweight, read-only stand-in for the User model held by the cache and exposed as
+        `current_user`. Declares `__slots__` (id, username) and implements the interface of
+        flask_login.UserMixin (is_authenticated, is_active, is_anonymous, get_id, equality).
+        UserMixin itself is not subclassed because it has no `__slots__`, which would give every
+        identity a `__dict__` again.
+        Methods:
+            from_user(user): Class method copying the identity of a User instance.
+    UserCache:
+        Per-process LRU of identities keyed by user id, each entry expiring `ttl` seconds after it
+        was loaded.
+        Methods:
+            from_config(config): Class method building the cache from the Flask config.
+            get(user_id): Returns the cached identity or None, counting hits and misses.
+            put(identity): Stores an identity and returns it.
+            invalidate(user_id): Drops a user's identity.
+            stats(): Returns the hit/miss counters and the database queries saved.
+Functions:
+    invalidate_user(mapper, connection, target):
+        SQLAlchemy `after_update`/`after_delete` listener on User dropping the changed user from the
+        cache of the current app, so a new username or a deleted account is seen on the next request.
+Notes:
+    - Invalidation only reaches the worker that made the change; the other workers see it once the
+      entry expires (USER_CACHE_TTL), keep the TTL short.
+    - Code needing the ORM instance (relationships, password checks) loads the User explicitly.
+"""
+
+import threading
+# threading: Lock protecting the cache, shared by the worker's request threads
+
+import time
+# time: Expiry timestamps
+
+from collections import OrderedDict
+# OrderedDict: Keeps entries in recency order for LRU eviction
+
+from flask import current_app, has_app_context
+# current_app, has_app_context: The cache of the app whose session changed a user
+
+from sqlalchemy import event
+# event: Mapper events invalidating changed users
+
+from .models import User
+# User: The model whose updates and deletes invalidate the cache
+
+from .metrics import CACHE_LOOKUPS
+# CACHE_LOOKUPS: Hit/miss counter aggregated across workers
+
+
+class UserIdentity:
+    __slots__ = ("id", "username")
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username)
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if hasattr(other, "get_id"):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<UserIdentity {self.id} {self.username!r}>"
+
+
+class UserCache:
+    def __init__(self, ttl=30, maxsize=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(ttl=config["USER_CACHE_TTL"], maxsize=config["USER_CACHE_SIZE"])
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] <= self._clock():
+                del self._entries[user_id]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                CACHE_LOOKUPS.labels(cache="user", result="miss").inc()
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+        CACHE_LOOKUPS.labels(cache="user", result="hit").inc()
+        return entry[0]
+
+    def put(self, identity):
+        with self._lock:
+            self._entries[identity.id] = (identity, self._clock() + self.ttl)
+            self._entries.move_to_end(identity.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "db_calls_saved": self.hits,
+        }
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_user(mapper, connection, target):
+    if has_app_context():
+        cache = current_app.extensions.get("user_cache")
+        if cache is not None:
+            cache.invalidate(target.id)
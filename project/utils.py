@@ -1,48 +1,139 @@
 
 """
-Utility functions for interacting with the DeepSeek API and rendering responses as Markdown.
+Utility functions for asking the configured LLM backends (DeepSeek by default) for answers.
+Classes:
+--------
+Completion (namedtuple):
+    Result of `query_deepseek`.
+    Fields:
+        content (str): The Markdown answer, or the error message when `ok` is False.
+        ok (bool): True when the upstream returned an answer.
+        usage (dict or None): The `usage` block of the API response (token counts), when present. None
+            for answers served by the completion cache or shared with an identical call in flight:
+            only the call that reached the upstream is billed.
+UpstreamError (Exception):
+    Raised by `stream_deepseek` when the upstream call fails; the message is user facing
+    (defined in project.providers).
+
 Functions:
 ----------
-query_deepseek(prompt):
-    Sends a prompt to the DeepSeek chat completion API and returns the response as HTML-rendered Markdown.
+build_messages(prompt, history=()):
+    Returns the `messages` array of a completion request: the prior turns followed by the prompt.
+
+query_deepseek(prompt, history=()):
+    Sends a prompt to the fastest healthy LLM backend and returns the raw Markdown answer.
     Parameters:
-        prompt (str): The user's input or question to be sent to the DeepSeek API.
+        prompt (str): The user's input or question to be sent to the backend.
+        history (list): Prior turns of the conversation as chat completion messages (see `ContextStore`).
     Returns:
-        str: The API's response rendered as HTML from Markdown if successful,
-             or an error message string if the request fails.
+        Completion: The API's Markdown answer if successful, or the error message with `ok=False`
+             if the request fails. Rendering to HTML is left to the caller (see `Chat.set_answer`).
     Raises:
         Exception: Catches and returns any exceptions that occur during the API request.
     Notes:
-        - Requires a valid DeepSeek API key set in Flask's current_app configuration under 'DEEPSEEK_API_KEY'.
-        - Uses the 'markdown2' library to convert Markdown responses to HTML.
+        - Uses the provider router stored in `current_app.extensions["llm_router"]`, which tries the
+          backends listed in LLM_PROVIDERS by measured latency and health, failing over to the next one
+          when a backend errors (see `ProviderRouter`). The error of the last backend tried is returned.
         - Handles API errors gracefully and provides informative error messages.
+        - Answers are looked up in, and successful ones stored into, the completion cache
+          (`current_app.extensions["completion_cache"]`) when it is enabled; the history is part of the key.
+        - On a cache miss, concurrent identical requests (same normalized prompt, model and history) are
+          coalesced into one upstream call by `current_app.extensions["coalescer"]` when it is enabled,
+          within the worker and, with a shared lock file, across workers (see `SingleFlight`).
+
+stream_deepseek(prompt, history=()):
+    Sends a prompt to the fastest healthy LLM backend with `stream: true` and yields the
+    raw Markdown content deltas as soon as they arrive.
+    Parameters:
+        prompt (str): The user's input or question to be sent to the backend.
+        history (list): Prior turns of the conversation as chat completion messages.
+    Yields:
+        str: Content fragments of the completion, in order.
+    Returns:
+        dict or None: The `usage` block of the answer (None when cached or not reported), as the
+            generator's return value (`usage = yield from stream_deepseek(...)`).
+    Raises:
+        UpstreamError: When the request fails, with the same message `query_deepseek` would return.
+    Notes:
+        - The router fails over to the next backend only until the first delta has been relayed.
+        - The caller is responsible for joining the deltas and rendering the final Markdown.
+        - A cached answer is yielded as a single delta; a fully streamed answer is cached.
+        - Streams are not coalesced, every stream relays its own upstream response.
 """
-from markdown2 import markdown # markdown2: Library for converting Markdown text to HTML
-import requests # requests: Library for making HTTP requests to the DeepSeek API
-from flask import current_app # current_app: Flask's proxy for the current application context, used to access configuration variables
-
-
-def query_deepseek(prompt):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {current_app.config['DEEPSEEK_API_KEY']}" #.env api key
-    }
-    data = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "user", "content": prompt}] # Sending the user's prompt as a message
-    }
+from collections import namedtuple # namedtuple: Lightweight result type of query_deepseek
+from flask import current_app # current_app: Flask's proxy for the current application context, used to access the provider router
+from .cache import CompletionCache # CompletionCache: Its key function also identifies identical calls in flight
+from .providers import UpstreamError, tee # UpstreamError: Raised by the providers, tee: Keeps a copy of the relayed deltas
+
+
+Completion = namedtuple("Completion", ["content", "ok", "usage"])
+
+
+def build_messages(prompt, history=()):
+    return [*history, {"role": "user", "content": prompt}] # Sending the user's prompt after the prior turns
+
+
+def _cached_completion(cache, prompt, model, history):
+    cached = cache.get(prompt, model, history)
+    return Completion(cached, True, None) if cached is not None else None
+
+
+def _fetch_completion(router, cache, prompt, history):
     try:
-        response = requests.post(
-            "https://api.deepseek.com/v1/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=30
-        )
-        if response.status_code == 200:
-            result = response.json()
-            return markdown(result["choices"][0]["message"]["content"]) 
-        else:
-            error_msg = response.json().get("error", {}).get("message", "Unknown error")
-            return f"API Error {response.status_code}: {error_msg}"
+        provider, content, usage = router.complete(build_messages(prompt, history))
+    except UpstreamError as e:
+        return Completion(str(e), False, None)
     except Exception as e:
-        return f"Error: {str(e)}"
\ No newline at end of file
+        return Completion(f"Error: {str(e)}", False, None)
+    if cache is not None:
+        cache.set(prompt, router.model, content, history)
+    return Completion(content, True, usage)
+
+
+def query_deepseek(prompt, history=()):
+    router = current_app.extensions["llm_router"]
+    cache = current_app.extensions.get("completion_cache")
+    if cache is not None:
+        cached = _cached_completion(cache, prompt, router.model, history)
+        if cached is not None:
+            return cached
+
+    coalescer = current_app.extensions.get("coalescer")
+    if coalescer is None:
+        return _fetch_completion(router, cache, prompt, history)
+
+    # Identical prompts in flight elsewhere share one upstream call
+    key = CompletionCache.make_key(prompt, router.model, history)
+    lookup = (lambda: _cached_completion(cache, prompt, router.model, history)) if cache is not None else None
+    led = []
+
+    def fetch():
+        led.append(True)
+        return _fetch_completion(router, cache, prompt, history)
+
+    completion = coalescer.do(key, fetch, lookup)
+    # The tokens were billed once, to the request that made the call
+    return completion if led else completion._replace(usage=None)
+
+
+def stream_deepseek(prompt, history=()):
+    router = current_app.extensions["llm_router"]
+    cache = current_app.extensions.get("completion_cache")
+    if cache is not None:
+        cached = cache.get(prompt, router.model, history)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    try:
+        finished, usage = yield from tee(router.stream(build_messages(prompt, history)), parts)
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise UpstreamError(f"Error: {str(e)}") from e
+
+    # Only cache answers the upstream marked as complete
+    if cache is not None and finished and parts:
+        cache.set(prompt, router.model, "".join(parts), history)
+    return usage
@@ -5,10 +5,12 @@ Fixtures:
 - app:
     Creates and configures a new Flask app instance for each test module.
     Uses a temporary SQLite database file for isolation.
-    Sets up the app with test-specific configuration options (e.g., disables CSRF, rate limiting).
+    Sets up the app with test-specific configuration options (e.g., disables CSRF, rate limiting,
+    the chat job queue, the upstream circuit breaker).
     Ensures all database tables are created before tests and cleans up resources after tests.
 - client:
     Provides a Flask test client for sending HTTP requests to the app during tests.
+    Streamed responses are read to the end and closed before the request returns (BufferedClient).
 - runner:
     Provides a Flask CLI runner for invoking custom command-line commands in tests.
 - auth:
@@ -17,6 +19,8 @@ Fixtures:
     Provides a new instance of the User model for use in tests.
 Classes:
 --------
+- BufferedClient:
+    Flask test client reading every response to the end and closing it, as a WSGI server does.
 - AuthActions:
     Helper class to encapsulate common authentication actions for tests.
     Methods:
@@ -49,6 +53,16 @@ from project.db import db
 import pytest
 # pytest: Testing framework used for fixtures and test discovery
 
+from flask.testing import FlaskClient
+# FlaskClient: Base of the test client reading streamed responses to the end
+
+# Reads every response to the end and closes it, as a WSGI server does: a streamed page (the home
+# page) keeps its request context pushed until then, which must not outlive the request
+class BufferedClient(FlaskClient):
+    def open(self, *args, buffered=True, **kwargs):
+        return super().open(*args, buffered=buffered, **kwargs)
+
+
 # Fixture to create and configure a new app instance for each test module
 @pytest.fixture(scope='module')
 def app():
@@ -60,7 +74,12 @@ def app():
                       'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 
                       'SQLALCHEMY_TRACK_MODIFICATIONS': False,
                       'WTF_CSRF_ENABLED': False,
-                      'RATELIMIT_ENABLED': False})
+                      'RATELIMIT_ENABLED': False,
+                      # Most tests check the answer right after posting, tests of the queue enable it
+                      'CHAT_QUEUE_ENABLED': False,
+                      # Upstream failures are simulated on purpose, tests of the breaker enable it
+                      'CIRCUIT_BREAKER_ENABLED': False})
+    app.test_client_class = BufferedClient
 
     # Create all database tables
     with app.app_context():
@@ -1,6 +1,9 @@
 from project import create_app # create_app: Factory function to create a Flask app instance
 from project.db import db # db: SQLAlchemy database instance for ORM operations
 import pytest # pytest: Testing framework used for fixtures and test discovery
+import os # os: Removes the temporary database
+import tempfile # tempfile: Database of the app built with the default config
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError, ReadTimeoutError # Errors the retry policy sees
 
 @pytest.mark.last
 def test_app_loads_config_from_file():
@@ -11,4 +14,61 @@ def test_app_loads_config_from_file():
     # For example, if config.py sets DEBUG = False or any other setting
     assert fresh_app.config.get("DEBUG") is not None  # or specific expected value
     assert fresh_app.config.get('RATELIMIT_DEFAULT') == "30 per hour"
-    assert fresh_app.config.get('WTF_CSRF_ENABLED')
\ No newline at end of file
+    assert fresh_app.config.get('WTF_CSRF_ENABLED')
+
+def test_deepseek_client_is_pooled(app):
+    """
+    GIVEN an app created by the factory
+    WHEN looking at the DeepSeek client stored on the app
+    THEN one long-lived session with a connection pool, timeouts and retries from the config is used
+    """
+    client = app.extensions["deepseek"]
+    adapter = client.session.get_adapter(client.url)
+
+    assert client.timeout == (app.config["DEEPSEEK_CONNECT_TIMEOUT"], app.config["DEEPSEEK_READ_TIMEOUT"])
+    assert adapter._pool_maxsize == app.config["DEEPSEEK_POOL_SIZE"]
+    assert adapter.max_retries.total == app.config["DEEPSEEK_MAX_RETRIES"]
+    assert client.session.headers["Authorization"] == f"Bearer {app.config['DEEPSEEK_API_KEY']}"
+
+
+def test_deepseek_client_retries_connection_errors_but_not_read_timeouts(app):
+    """
+    GIVEN the retry policy of the DeepSeek client
+    WHEN a completion fails to connect, is refused (429, 503), fails with another 5xx, or times out
+    after it was sent
+    THEN the connection error and the refusals are retried, the other 5xx and the read timeout are
+    not: the upstream may still be generating (and billing) the answer
+    """
+    client = app.extensions["deepseek"]
+    retry = client.session.get_adapter(client.url).max_retries
+
+    assert retry.increment("POST", client.url, error=ConnectTimeoutError()).total == retry.total - 1
+    assert [status for status in (429, 500, 502, 503, 504) if retry.is_retry("POST", status)] == [429, 503]
+    with pytest.raises(MaxRetryError):
+        retry.increment("POST", client.url, error=ReadTimeoutError(None, client.url, "Read timed out."))
+
+
+def test_default_config_answers_inline_and_streams(monkeypatch):
+    """
+    GIVEN an app built with the default CHAT_QUEUE_ENABLED, as `flask run` without workers is
+    WHEN a user opens the home page
+    THEN prompts are answered inline and the form carries the streaming endpoint for chat.js
+    """
+    monkeypatch.delenv("CHAT_QUEUE_ENABLED", raising=False)
+    db_fd, db_path = tempfile.mkstemp()
+    try:
+        app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+                          "WTF_CSRF_ENABLED": False, "RATELIMIT_ENABLED": False})
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        client.post("/register", data={"username": "streamer", "password": "password"})
+        page = client.get("/", buffered=True)
+
+        assert app.config["CHAT_QUEUE_ENABLED"] is False
+        assert b'data-stream-url="/chat/stream"' in page.data
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        os.close(db_fd)
+        os.unlink(db_path)
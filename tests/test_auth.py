@@ -144,3 +144,113 @@ def test_register_exception(client):
 
         # CHECK if the error flash message appears in the response
         assert b"Something went wrong during registration." in response.data
+
+
+def test_login_rehashes_outdated_password_hash(client, app):
+    """
+    GIVEN a user whose password was hashed with other parameters than PASSWORD_HASH_METHOD
+
+    WHEN the user logs in with the right password
+
+    THEN the login succeeds
+    AND the stored hash is upgraded to the configured method
+    """
+    from project.models import User
+    from project.db import db
+    from werkzeug.security import generate_password_hash
+
+    with app.app_context():
+        user = User()
+        user.username = 'legacy'
+        user._User__password_hash = generate_password_hash('legacy-password', 'pbkdf2:sha256:1000')
+        db.session.add(user)
+        db.session.commit()
+        assert user.password_needs_rehash()
+
+    with client:
+        client.post('/login', data={'username': 'legacy', 'password': 'legacy-password'})
+        assert current_user.is_authenticated
+        client.get('/logout')
+
+    with app.app_context():
+        user = User.find_by_username('legacy')
+        assert user._User__password_hash.startswith(app.config['PASSWORD_HASH_METHOD'] + '$')
+        assert not user.password_needs_rehash()
+        assert user.check_password('legacy-password')
+
+
+def test_login_when_password_hashing_is_saturated(client):
+    """
+    GIVEN a password hashing pool with no room left
+
+    WHEN a user tries to log in
+
+    THEN the login is refused with 503 instead of queueing
+    """
+    from project.passwords import PasswordHasherBusy
+    client.post('/register', data={'username': 'busy', 'password': 'busy-password'})
+    client.get('/logout')
+
+    with patch('project.passwords.PasswordHasher.verify', side_effect=PasswordHasherBusy()):
+        response = client.post('/login', data={'username': 'busy', 'password': 'busy-password'})
+
+    assert response.status_code == 503
+    assert b"Too many logins in progress" in response.data
+
+
+def test_user_loader_serves_identities_from_cache(client, app):
+    """
+    GIVEN a logged-in user
+
+    WHEN several authenticated requests are made
+
+    THEN the user is loaded from the database once and served from the user cache afterwards
+    AND current_user is a lightweight identity without a __dict__
+    """
+    from project.user_cache import UserIdentity
+    from project.db import db
+    client.post('/register', data={'username': 'cached', 'password': 'cached-password'})
+    client.get('/logout')
+    client.post('/login', data={'username': 'cached', 'password': 'cached-password'})
+    cache = app.extensions['user_cache']
+    before = cache.stats()
+
+    with patch('project.auth.db.session.get', wraps=db.session.get) as mock_get:
+        with client:
+            for _ in range(3):
+                client.get('/')
+            assert isinstance(current_user._get_current_object(), UserIdentity)
+            assert current_user.username == 'cached'
+            assert not hasattr(current_user._get_current_object(), '__dict__')
+
+    assert mock_get.call_count <= 1
+    assert cache.stats()['db_calls_saved'] - before['db_calls_saved'] >= 2
+    client.get('/logout')
+
+
+def test_user_cache_invalidated_on_update(app):
+    """
+    GIVEN a user whose identity is cached
+
+    WHEN the username is changed and committed
+
+    THEN the cached identity is dropped, so the next request sees the new name
+    """
+    from project.models import User
+    from project.db import db
+    from project.user_cache import UserIdentity
+
+    with app.app_context():
+        user = User()
+        user.username = 'before-rename'
+        user.password = 'password'
+        db.session.add(user)
+        db.session.commit()
+        cache = app.extensions['user_cache']
+        cache.put(UserIdentity.from_user(user))
+        assert cache.get(user.id).username == 'before-rename'
+
+        user.username = 'after-rename'
+        db.session.commit()
+
+        assert cache.get(user.id) is None
@@ -0,0 +1,110 @@
+from project.breaker import CircuitBreaker # CircuitBreaker: The shared circuit breaker under test
+from project.providers import ProviderRouter, StubProvider, UpstreamError # The router the breaker protects
+import pytest # pytest: Testing framework used for exception checks
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_opens_for_every_worker_and_half_opens_for_one_probe(tmp_path):
+    """
+    GIVEN two breakers on the same file, as two gunicorn workers would open, with a threshold of 3
+    WHEN three consecutive failures are reported across both workers
+    THEN the circuit is open for both; after the reset timeout a single probe is let through,
+    and its success closes the circuit again
+    """
+    clock = FakeClock()
+    path = str(tmp_path / "circuits.db")
+    workers = [CircuitBreaker(path, threshold=3, reset_timeout=30, clock=clock) for _ in range(2)]
+
+    workers[0].record("deepseek", False)
+    workers[1].record("deepseek", False)
+    assert workers[0].allow("deepseek")
+    workers[0].record("deepseek", False)
+
+    assert workers[1].state("deepseek") == "open"
+    assert not workers[0].allow("deepseek")
+    assert not workers[1].allow("deepseek")
+
+    clock.now += 31
+    assert workers[1].allow("deepseek")
+    assert not workers[0].allow("deepseek")
+    assert workers[0].state("deepseek") == "half_open"
+
+    workers[1].record("deepseek", True)
+    assert workers[0].state("deepseek") == "closed"
+    assert workers[0].allow("deepseek")
+
+
+def test_a_success_resets_the_count_and_a_failed_probe_reopens(tmp_path):
+    """
+    GIVEN a breaker with a threshold of 2
+    WHEN failures are interleaved with a success, then a probe fails
+    THEN only consecutive failures open the circuit, and the failed probe opens it for another timeout
+    """
+    clock = FakeClock()
+    breaker = CircuitBreaker(str(tmp_path / "circuits.db"), threshold=2, reset_timeout=10, clock=clock)
+
+    breaker.record("deepseek", False)
+    breaker.record("deepseek", True)
+    breaker.record("deepseek", False)
+    assert breaker.state("deepseek") == "closed"
+
+    breaker.record("deepseek", False)
+    clock.now += 11
+    assert breaker.allow("deepseek")
+    breaker.record("deepseek", False)
+
+    assert breaker.state("deepseek") == "open"
+    assert not breaker.allow("deepseek")
+
+
+def test_router_fails_fast_when_every_circuit_is_open(tmp_path):
+    """
+    GIVEN a router whose only backend keeps failing, behind a breaker with a threshold of 2
+    WHEN prompts keep coming
+    THEN after two failures the backend is no longer called and the calls fail at once as unavailable
+    """
+    calls = []
+
+    class CountingStub(StubProvider):
+        def complete(self, messages):
+            calls.append(1)
+            return super().complete(messages)
+
+    breaker = CircuitBreaker(str(tmp_path / "circuits.db"), threshold=2)
+    router = ProviderRouter([CountingStub(fail=True)], breaker=breaker)
+    messages = [{"role": "user", "content": "Anyone there?"}]
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError, match="stub is unavailable"):
+            router.complete(messages)
+    with pytest.raises(UpstreamError, match="temporarily unavailable"):
+        router.complete(messages)
+
+    assert len(calls) == 2
+
+
+def test_request_errors_do_not_open_the_circuit(tmp_path):
+    """
+    GIVEN a backend refusing a request with 400
+    WHEN the error is reported to a router with a breaker of threshold 1
+    THEN the circuit stays closed, the backend is healthy and answering
+    """
+    class BadRequest(StubProvider):
+        def complete(self, messages):
+            raise UpstreamError("API Error 400: Invalid request", 400)
+
+    breaker = CircuitBreaker(str(tmp_path / "circuits.db"), threshold=1)
+    router = ProviderRouter([BadRequest()], breaker=breaker)
+
+    with pytest.raises(UpstreamError, match="400"):
+        router.complete([{"role": "user", "content": "Malformed"}])
+
+    assert breaker.state("stub") == "closed"
+    assert router.stats()["stub"]["calls"] == 0
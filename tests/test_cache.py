@@ -0,0 +1,86 @@
+from project.cache import CompletionCache, LRUTier, SQLiteTier # The completion cache and its tiers
+from unittest.mock import patch, MagicMock # patch: Used to mock objects during testing, MagicMock: Used to fake upstream responses
+
+
+class FakeClock:
+    # Manually advanced clock to test expiry without sleeping
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_tier_evicts_least_recently_used():
+    """
+    GIVEN an LRU tier holding two entries
+    WHEN the oldest entry is read and a third one is stored
+    THEN the entry that was not used recently is evicted
+    """
+    tier = LRUTier(maxsize=2, ttl=60)
+    tier.set("a", "A")
+    tier.set("b", "B")
+    assert tier.get("a") == "A"
+
+    tier.set("c", "C")
+
+    assert tier.get("b") is None
+    assert tier.get("a") == "A"
+    assert tier.get("c") == "C"
+
+
+def test_tiers_expire_entries_after_ttl(tmp_path):
+    """
+    GIVEN an LRU tier and a SQLite tier with a 60 seconds TTL
+    WHEN more than 60 seconds pass after an entry was stored
+    THEN the entry is no longer returned
+    """
+    clock = FakeClock()
+    tiers = [LRUTier(ttl=60, clock=clock), SQLiteTier(str(tmp_path / "cache.db"), ttl=60, clock=clock)]
+    for tier in tiers:
+        tier.set("key", "value")
+
+    clock.now += 59
+    assert all(tier.get("key") == "value" for tier in tiers)
+
+    clock.now += 2
+    assert all(tier.get("key") is None for tier in tiers)
+
+
+def test_shared_tier_serves_other_workers(tmp_path):
+    """
+    GIVEN two caches (one per worker) sharing the same SQLite file
+    WHEN one worker stores an answer
+    THEN the other one gets a hit for the same prompt, even when it is differently spaced or cased
+    AND hits and misses are counted
+    """
+    path = str(tmp_path / "cache.db")
+    worker_a = CompletionCache([LRUTier(), SQLiteTier(path)])
+    worker_b = CompletionCache([LRUTier(), SQLiteTier(path)])
+
+    assert worker_b.get("Summarize X", "deepseek-chat") is None
+    worker_a.set("Summarize X", "deepseek-chat", "**answer**")
+
+    assert worker_b.get("  summarize   x ", "deepseek-chat") == "**answer**"
+    assert worker_b.get("Summarize X", "other-model") is None
+    assert worker_b.stats() == {"hits": 1, "misses": 2, "hit_ratio": 1 / 3}
+
+
+def test_repeated_prompt_is_answered_from_cache(client, auth):
+    """
+    GIVEN two users starting a conversation and a DeepSeek answer for a prompt
+    WHEN both submit the same prompt
+    THEN DeepSeek is called only once and both chats show the answer
+    """
+    upstream = MagicMock(status_code=200)
+    upstream.json.return_value = {"choices": [{"message": {"content": "Cached *answer*"}}]}
+
+    with patch("project.client.requests.Session.post", return_value=upstream) as post:
+        auth.register("first-user", "password")
+        client.post("/chat", data={"prompt": "Onboarding question"})
+        auth.logout()
+        auth.register("second-user", "password")
+        response = client.post("/chat", data={"prompt": "onboarding  question"}, follow_redirects=True)
+
+    assert post.call_count == 1
+    assert response.data.count(b"Cached <em>answer</em>") == 1
@@ -1,6 +1,11 @@
 import pytest # pytest: Testing framework used for fixtures and test discovery
 from flask_login import current_user  # current_user: Flask-Login's proxy for the currently logged-in user
-from unittest.mock import patch # patch: Used to mock objects during testing
+from unittest.mock import patch, MagicMock # patch: Used to mock objects during testing, MagicMock: Used to fake upstream responses
+from datetime import datetime, timedelta # datetime, timedelta: Used to seed chats with known timestamps
+import re # re: Used to extract the history cursor from the rendered page
+from project.models import Chat, Conversation, User # Chat, Conversation, User: The models, used to seed history directly
+from project.context import ContextStore # ContextStore: Token-budgeted conversation windows
+from project.db import db # db: SQLAlchemy database instance for ORM operations
 
 
 def test_redirect_home(client):
@@ -101,7 +106,150 @@ def test_query_deepseek_exception_handling(client, auth):
     """
     auth.login()
 
-    with patch("project.utils.requests.post", side_effect=Exception("Test exception")):
+    with patch("project.client.requests.Session.post", side_effect=Exception("Test exception")):
         response = client.post("/chat", data={"prompt": "trigger error"}, follow_redirects=True)
         assert response.status_code == 200
         assert b"Error: Test exception" in response.data or b"Something went wrong while saving the chat." in response.data
+
+
+def test_chat_stream_relays_deltas_and_saves_chat(client, auth):
+    """
+    GIVEN an authenticated user and a DeepSeek stream sending the answer in several chunks
+    WHEN posting a prompt to the streaming endpoint
+    THEN every delta is relayed as a Server-Sent Event, a final done event carries the
+    rendered answer and the chat is saved in the history
+    """
+    auth.login()
+
+    upstream = MagicMock(status_code=200)
+    upstream.__enter__.return_value = upstream
+    upstream.iter_lines.return_value = [
+        'data: {"choices": [{"delta": {"content": "Hello"}}]}',
+        '',
+        'data: {"choices": [{"delta": {"content": " **stream**"}}]}',
+        'data: [DONE]',
+    ]
+
+    with patch("project.client.requests.Session.post", return_value=upstream) as post:
+        response = client.post("/chat/stream", data={"prompt": "Stream me"})
+        body = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert post.call_args.kwargs["json"]["stream"] is True
+    assert 'data: {"delta": "Hello"}' in body
+    assert 'data: {"delta": " **stream**"}' in body
+    assert "event: done" in body
+    assert "<strong>stream</strong>" in body
+
+    home = client.get("/")
+    assert b"Stream me" in home.data
+    assert b"<strong>stream</strong>" in home.data
+
+
+def test_chat_stream_rejects_invalid_prompt(client, auth):
+    """
+    GIVEN an authenticated user
+    WHEN posting an empty prompt to the streaming endpoint
+    THEN a 400 with the validation errors is returned instead of a stream
+    """
+    auth.login()
+    response = client.post("/chat/stream", data={"prompt": ""})
+    assert response.status_code == 400
+    assert "Prompt cannot be empty." in response.get_json()["errors"][0]
+
+
+def test_home_renders_latest_page_and_history_loads_older(app, client, auth):
+    """
+    GIVEN an authenticated user with more chats than fit on one page
+    WHEN opening the home page and following the history cursors of the thread
+    THEN only the latest page is rendered and /history returns the older pages in order until none is left
+    """
+    auth.login()
+    with client:
+        client.get("/")
+        user_id = current_user.id
+
+    with app.app_context():
+        Chat.query.filter_by(user_id=user_id).delete()
+        start = datetime(2025, 1, 1)
+        for i in range(7):
+            # Two chats share each timestamp, the id breaks the tie
+            db.session.add(Chat(user_id=user_id, prompt=f"page prompt {i}",
+                                response=f"answer {i}", timestamp=start + timedelta(minutes=i // 2)))
+        db.session.commit()
+
+    app.config["CHAT_PAGE_SIZE"] = 3
+    try:
+        home = client.get("/")
+        assert b"page prompt 6" in home.data and b"page prompt 4" in home.data
+        assert b"page prompt 3" not in home.data
+        cursor = re.search(rb'data-cursor="([^"]+)"', home.data).group(1).decode()
+        thread = re.search(rb'name="conversation_id" value="(\d+)"', home.data).group(1).decode()
+
+        page = client.get("/history", query_string={"conversation": thread, "before": cursor}).get_json()
+        assert [chat["prompt"] for chat in page["chats"]] == ["page prompt 1", "page prompt 2", "page prompt 3"]
+
+        page = client.get("/history", query_string={"conversation": thread, "before": page["next"]}).get_json()
+        assert [chat["prompt"] for chat in page["chats"]] == ["page prompt 0"]
+        assert page["next"] is None
+    finally:
+        app.config["CHAT_PAGE_SIZE"] = 20
+
+    assert client.get("/history", query_string={"conversation": thread, "before": "not-a-cursor"}).status_code == 400
+
+
+def test_prompt_carries_previous_turns_as_context(app, client, auth):
+    """
+    GIVEN an authenticated user who already had a successful exchange and a failed one
+    WHEN submitting a new prompt
+    THEN the successful exchange is sent before the prompt and the failed one is left out
+    """
+    auth.register("context-user", "password")
+    upstream = MagicMock(status_code=200)
+    upstream.json.return_value = {"choices": [{"message": {"content": "First **answer**"}}]}
+
+    with patch("project.client.requests.Session.post", return_value=upstream) as post:
+        client.post("/chat", data={"prompt": "First question"})
+        with patch("project.client.requests.Session.post", side_effect=Exception("down")):
+            client.post("/chat", data={"prompt": "Failed question"})
+        upstream.json.return_value = {"choices": [{"message": {"content": "Second answer"}}]}
+        client.post("/chat", data={"prompt": "Second question"})
+
+    assert post.call_args.kwargs["json"]["messages"] == [
+        {"role": "user", "content": "First question"},
+        {"role": "assistant", "content": "First **answer**"},
+        {"role": "user", "content": "Second question"},
+    ]
+
+
+def test_context_window_respects_token_budget(app):
+    """
+    GIVEN a context store with a small token budget and a user with several saved exchanges
+    WHEN asking for the history twice, with a new exchange saved in between
+    THEN only the newest turns fitting the budget are returned and the new exchange is picked up
+    """
+    store = ContextStore(budget=30, max_turns=10)
+    with app.app_context():
+        user = User()
+        user.username = "budget-user"
+        user.password = "password"
+        db.session.add(user)
+        db.session.commit()
+        for i in range(4):
+            chat = Chat(user_id=user.id, prompt=f"question {i}")
+            chat.set_answer("x" * 40)  # 11 tokens per answer, 3 per prompt
+            db.session.add(chat)
+            db.session.commit()
+
+        thread_id = Conversation.latest(user.id).id
+        history = store.history(thread_id)
+        assert [m["content"] for m in history if m["role"] == "user"] == ["question 2", "question 3"]
+
+        chat = Chat(user_id=user.id, prompt="question 4")
+        chat.set_answer("y" * 40)
+        db.session.add(chat)
+        db.session.commit()
+
+        history = store.history(thread_id)
+        assert [m["content"] for m in history if m["role"] == "user"] == ["question 3", "question 4"]
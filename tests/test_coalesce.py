@@ -0,0 +1,120 @@
+from project.coalesce import SingleFlight # SingleFlight: The request coalescer under test
+from project.utils import query_deepseek # query_deepseek: Coalesces identical prompts on a cache miss
+from unittest.mock import patch, MagicMock # patch: Used to mock the upstream, MagicMock: Used to fake its responses
+import threading # threading: Runs concurrent identical requests
+import time # time: Lets the followers reach the coalescer while the leader is in flight
+
+
+def test_concurrent_identical_calls_share_one_call():
+    """
+    GIVEN a coalescer and an upstream call that blocks until released
+    WHEN five threads ask for the same key at once
+    THEN the call runs once and every thread receives its result
+    """
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"calls": 1, "shared": 4}
+
+
+def test_workers_share_a_call_through_the_lock_table(tmp_path):
+    """
+    GIVEN two coalescers on the same lock file, as two gunicorn workers would open, and a shared cache
+    WHEN the second asks for a key while the first is fetching it
+    THEN the second waits for the first and reads its answer from the cache instead of calling upstream
+    """
+    lock_path = str(tmp_path / "locks.db")
+    workers = [SingleFlight(lock_path, poll_interval=0.01), SingleFlight(lock_path, poll_interval=0.01)]
+    shared_cache = {}
+    started, release = threading.Event(), threading.Event()
+
+    def leader_fetch():
+        started.set()
+        release.wait(5)
+        shared_cache["key"] = "answer"
+        return "answer"
+
+    leader = threading.Thread(target=lambda: workers[0].do("key", leader_fetch, shared_cache.get))
+    leader.start()
+    started.wait(5)
+    threading.Timer(0.1, release.set).start()
+
+    follower_fetch = MagicMock(return_value="duplicate")
+    result = workers[1].do("key", follower_fetch, lambda: shared_cache.get("key"))
+    leader.join()
+
+    assert result == "answer"
+    follower_fetch.assert_not_called()
+
+
+def test_failed_call_is_retried_by_the_waiting_worker(tmp_path):
+    """
+    GIVEN a lock held by a worker whose call fails (errors are not cached)
+    WHEN another worker waited for it
+    THEN that worker makes the call itself once the lock is released
+    """
+    lock_path = str(tmp_path / "locks.db")
+    workers = [SingleFlight(lock_path, poll_interval=0.01), SingleFlight(lock_path, poll_interval=0.01)]
+    started, release = threading.Event(), threading.Event()
+
+    def failing_fetch():
+        started.set()
+        release.wait(5)
+        return "API Error 503"
+
+    leader = threading.Thread(target=lambda: workers[0].do("key", failing_fetch, lambda: None))
+    leader.start()
+    started.wait(5)
+    threading.Timer(0.1, release.set).start()
+
+    result = workers[1].do("key", lambda: "answer", lambda: None)
+    leader.join()
+
+    assert result == "answer"
+
+
+def test_query_deepseek_coalesces_identical_prompts(app):
+    """
+    GIVEN a slow upstream and an empty completion cache
+    WHEN three requests send the same prompt concurrently
+    THEN DeepSeek is called once and all three get the answer
+    """
+    mock_response = MagicMock(status_code=200)
+    mock_response.json.return_value = {"choices": [{"message": {"content": "Shared answer"}}]}
+
+    def slow_post(*args, **kwargs):
+        time.sleep(0.2)
+        return mock_response
+
+    results = []
+
+    def ask():
+        with app.app_context():
+            results.append(query_deepseek("A popular coalesced question"))
+
+    with patch("project.client.requests.Session.post", side_effect=slow_post) as mock_post:
+        threads = [threading.Thread(target=ask) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert mock_post.call_count == 1
+    assert [completion.content for completion in results] == ["Shared answer"] * 3
@@ -0,0 +1,117 @@
+from unittest.mock import patch, MagicMock # patch, MagicMock: Used to fake upstream responses
+from flask_login import current_user # current_user: Flask-Login's proxy for the logged-in user
+from project.models import Chat, Conversation, User # The models under test
+from project.db import db # db: SQLAlchemy database instance for ORM operations
+import re # re: Used to read the thread id from the rendered form
+
+
+def _answer(content):
+    upstream = MagicMock(status_code=200)
+    upstream.json.return_value = {"choices": [{"message": {"content": content}}]}
+    return upstream
+
+
+def _thread_id(page):
+    return int(re.search(rb'name="conversation_id" value="(\d+)"', page.data).group(1))
+
+
+def test_counters_are_maintained_on_insert(app):
+    """
+    GIVEN a thread
+    WHEN chats are saved in it, the last one dated before the others (a late queued prompt)
+    THEN its message count counts every chat, while its last activity and snippet stay those of the newest
+    """
+    with app.app_context():
+        user = User()
+        user.username = "counter-user"
+        user.password = "password"
+        db.session.add(user)
+        db.session.commit()
+        thread = Conversation.start(user.id, "  A   first\nprompt  ")
+        created = thread.last_activity
+
+        for prompt in ("second prompt", "third prompt"):
+            db.session.add(Chat(user_id=user.id, conversation_id=thread.id, prompt=prompt, response="answer"))
+            db.session.commit()
+        db.session.add(Chat(user_id=user.id, conversation_id=thread.id, prompt="late prompt", response="answer",
+                            timestamp=created))
+        db.session.commit()
+
+        thread = Conversation.latest(user.id)
+        assert thread.title == "A first prompt"
+        assert thread.message_count == 3
+        assert thread.last_snippet == "third prompt"
+        assert thread.last_activity > created
+
+
+def test_threads_are_listed_and_switched(client, auth):
+    """
+    GIVEN an authenticated user with a thread
+    WHEN starting a second thread from /new, then opening the first one
+    THEN the home page shows the latest thread, both are listed, and each page loads only its own messages
+    """
+    auth.register("thread-user", "password")
+    auth.login("thread-user", "password")
+    with patch("project.client.requests.Session.post", return_value=_answer("An answer")):
+        client.post("/chat", data={"prompt": "Question about cats"})
+        first = _thread_id(client.get("/"))
+        assert b'name="new_conversation"' in client.get("/new").data
+        response = client.post("/chat", data={"prompt": "Question about dogs", "new_conversation": "1"})
+
+    home = client.get("/")
+    second = _thread_id(home)
+    assert second != first
+    assert response.headers["Location"] == f"/c/{second}"
+    assert b"Question about dogs" in home.data and b"Question about cats" in home.data  # Sidebar titles
+    assert home.data.count(b'class="card-text"') == 2  # One exchange in the active thread
+
+    page = client.get(f"/c/{first}")
+    assert _thread_id(page) == first
+    assert b'<p class="card-text">Question about cats</p>' in page.data
+    assert b'<p class="card-text">Question about dogs</p>' not in page.data
+
+
+def test_context_and_access_are_per_thread(app, client, auth):
+    """
+    GIVEN a user with two threads and another user
+    WHEN prompting in the second thread, and the other user asking for the first thread
+    THEN only the second thread's turns are sent as context, and the other user gets a 404
+    """
+    auth.register("context-thread-user", "password")
+    auth.login("context-thread-user", "password")
+    with patch("project.client.requests.Session.post", return_value=_answer("Cats answer")):
+        client.post("/chat", data={"prompt": "Cats question", "new_conversation": "1"})
+        with client:
+            first = _thread_id(client.get("/"))
+            user_id = current_user.id
+        client.post("/chat", data={"prompt": "Dogs question", "new_conversation": "1"})
+    with app.app_context():
+        second = Conversation.latest(user_id).id
+
+    with patch("project.client.requests.Session.post", return_value=_answer("More dogs")) as post:
+        client.post("/chat", data={"prompt": "Dogs follow-up", "conversation_id": str(second)})
+    assert [m["content"] for m in post.call_args.kwargs["json"]["messages"]] == [
+        "Dogs question", "Cats answer", "Dogs follow-up"]
+
+    auth.logout()
+    auth.register("intruder", "password")
+    auth.login("intruder", "password")
+    assert client.get(f"/c/{first}").status_code == 404
+    assert client.post("/chat", data={"prompt": "Hi", "conversation_id": str(first)}).status_code == 404
+
+
+def test_anonymous_prompt_is_redirected_to_login(app, client):
+    """
+    GIVEN an unauthenticated visitor
+    WHEN they post a prompt to /chat
+    THEN they are redirected to the login page and no thread is started
+    """
+    with app.app_context():
+        threads = Conversation.query.count()
+
+    response = client.post("/chat", data={"prompt": "Who am I?"})
+
+    assert response.status_code == 302
+    assert response.headers["Location"] == "/login"
+    with app.app_context():
+        assert Conversation.query.count() == threads
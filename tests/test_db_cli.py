@@ -1,5 +1,11 @@
 from sqlalchemy import inspect # inspect: SQLAlchemy utility to introspect database schema
 from project.db import db # db: SQLAlchemy database instance for ORM operations
+from project import create_app # create_app: Factory function to create a Flask app instance
+from project.models import Chat, Conversation, User # Chat, Conversation, User: Models whose queries are checked against the indexes
+from sqlalchemy import event, text # event: Used to capture the SQL sent to SQLite and explain it, text: Raw SQL
+from project.rendering import renderer_version # renderer_version: Version stamp of rendered answers
+from datetime import datetime, timedelta, timezone # datetime: Used to build a history cursor and date old chats
+from project.db import delete_in_batches # delete_in_batches: Batched deletion used by /clear and prune-chats
 
 def test_clear_db_command(runner, app):
     """
@@ -60,3 +66,303 @@ def test_delete_tables_command(app, runner):
     with app.app_context():
         inspector = inspect(db.engine)
         assert not inspector.get_table_names()
+
+def test_db_upgrade_creates_history_indexes(tmp_path):
+    """
+    GIVEN an empty database
+    WHEN running the Alembic migrations with `flask db upgrade`
+    THEN the tables are created with the chat history index, and usernames are indexed once, by
+    their UNIQUE constraint
+    """
+    fresh_app = create_app({'TESTING': True,
+                            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'migrated.db'}"})
+
+    result = fresh_app.test_cli_runner().invoke(args=["db", "upgrade"])
+    assert result.exit_code == 0
+
+    with fresh_app.app_context():
+        inspector = inspect(db.engine)
+        chat_indexes = {index["name"]: index["column_names"] for index in inspector.get_indexes("chats")}
+        user_indexes = inspector.get_indexes("user")
+        user_constraints = inspector.get_unique_constraints("user")
+        db.engine.dispose()
+
+    assert chat_indexes["ix_chats_user_id_timestamp"] == ["user_id", "timestamp"]
+    assert user_indexes == []
+    assert [constraint["column_names"] for constraint in user_constraints] == [["username"]]
+
+
+def test_db_upgrade_groups_existing_history_in_one_thread_per_user(tmp_path):
+    """
+    GIVEN a database at the revision before threads, with chats of two users
+    WHEN upgrading it to the latest revision
+    THEN each user's history becomes one thread titled after its first prompt, with its message
+    count, last activity and last prompt, and every chat belongs to it
+    """
+    fresh_app = create_app({'TESTING': True,
+                            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'threads.db'}"})
+    runner = fresh_app.test_cli_runner()
+    assert runner.invoke(args=["db", "upgrade", "0005_chat_jobs"]).exit_code == 0
+
+    with fresh_app.app_context():
+        db.session.execute(text("INSERT INTO user (id, username, password) VALUES (1, 'a', 'x'), (2, 'b', 'x')"))
+        db.session.execute(text(
+            "INSERT INTO chats (user_id, timestamp, prompt, response) VALUES "
+            "(1, '2025-01-01 10:00:00', 'first of a', 'r'), (1, '2025-01-02 10:00:00', 'last of a', 'r'), "
+            "(2, '2025-01-03 10:00:00', 'only of b', 'r')"))
+        db.session.commit()
+
+    assert runner.invoke(args=["db", "upgrade"]).exit_code == 0
+
+    with fresh_app.app_context():
+        thread = Conversation.latest(1)
+        assert (thread.title, thread.message_count, thread.last_snippet) == ("first of a", 2, "last of a")
+        assert thread.last_activity == datetime(2025, 1, 2, 10)
+        assert Conversation.latest(2).message_count == 1
+        assert {chat.conversation_id for chat in Chat.query.filter(Chat.user_id == 1)} == {thread.id}
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_history_queries_use_indexes(app):
+    """
+    GIVEN the chat, conversation and user models
+    WHEN running a thread's history page queries, the thread list query and a username lookup
+    THEN SQLite answers them from the composite indexes and the username's UNIQUE index, without
+    sorting in a temp b-tree
+    """
+    plans = []
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            plans.append(" ".join(row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)))
+
+    with app.app_context():
+        db.create_all()
+        event.listen(db.engine, "before_cursor_execute", explain)
+        try:
+            Chat.history_page(1, 20)
+            Chat.history_page(1, 20, before=(datetime(2025, 1, 1), 10))
+            User.find_by_username("test")
+            Conversation.for_user(1, 50)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", explain)
+
+    assert "USING INDEX ix_chats_conversation_id_timestamp (conversation_id=?)" in plans[0]
+    assert "USING INDEX ix_chats_conversation_id_timestamp (conversation_id=? AND timestamp<?)" in plans[1]
+    assert "USING INDEX sqlite_autoindex_user_1 (username=?)" in plans[2]
+    assert "USING INDEX ix_conversations_user_id_last_activity (user_id=?)" in plans[3]
+    assert not any("TEMP B-TREE" in plan for plan in plans)
+
+
+def test_rerender_chats_command(app, runner):
+    """
+    GIVEN chats rendered by an older renderer version, one without raw Markdown
+    WHEN invoking the 'rerender-chats' command with a small batch size
+    THEN every chat with raw Markdown is re-rendered and stamped, the legacy chat is left untouched
+    """
+    with app.app_context():
+        db.create_all()
+        user = User()
+        user.username = "rerender"
+        user.password = "secret"
+        db.session.add(user)
+        db.session.commit()
+
+        stale = []
+        for i in range(5):
+            chat = Chat(user_id=user.id, prompt=f"prompt {i}")
+            chat.set_answer(f"answer **{i}**")
+            stale.append(chat)
+        legacy = Chat(user_id=user.id, prompt="legacy", response="<p>legacy</p>")
+        db.session.add_all(stale + [legacy])
+        db.session.commit()
+        db.session.execute(text("UPDATE chats SET render_version = 'markdown2-0.0-r0' WHERE raw_response IS NOT NULL"))
+        db.session.commit()
+        ids = [chat.id for chat in stale]
+        legacy_id = legacy.id
+
+    app.config["MARKDOWN_RENDERER"] = "markdown-it"
+    try:
+        result = runner.invoke(args=["rerender-chats", "--batch-size", "2"])
+    finally:
+        app.config["MARKDOWN_RENDERER"] = "markdown2"
+
+    assert result.exit_code == 0
+    assert "Re-rendered 5 chats" in result.output
+
+    with app.app_context():
+        version = renderer_version("markdown-it")
+        for chat_id in ids:
+            chat = db.session.get(Chat, chat_id)
+            assert chat.render_version == version
+            assert "<strong>" in chat.response
+        assert db.session.get(Chat, legacy_id).render_version is None
+
+
+def _user_with_chats(username, timestamps):
+    user = User()
+    user.username = username
+    user.password = "secret"
+    db.session.add(user)
+    db.session.commit()
+    db.session.add_all([Chat(user_id=user.id, prompt=f"prompt {i}", response="answer", timestamp=timestamp)
+                        for i, timestamp in enumerate(timestamps)])
+    db.session.commit()
+    return user.id
+
+
+def test_delete_in_batches_commits_bounded_batches(app):
+    """
+    GIVEN a user with 5 chats and another user's chat
+    WHEN deleting the first user's chats in batches of 2
+    THEN every chat of that user is deleted in 3 transactions, using the per-user index, and the other chat is kept
+    """
+    commits, plans = [], []
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("DELETE"):
+            plans.append(" ".join(row[3] for row in cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)))
+
+    with app.app_context():
+        db.create_all()
+        now = datetime.now(timezone.utc)
+        user_id = _user_with_chats("batched", [now] * 5)
+        other_id = _user_with_chats("untouched", [now])
+
+        event.listen(db.engine, "before_cursor_execute", explain)
+        event.listen(db.session, "after_commit", lambda session: commits.append(1))
+        try:
+            deleted = delete_in_batches(Chat.__table__, Chat.__table__.c.user_id == user_id, batch_size=2)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", explain)
+
+        assert deleted == 5
+        assert len(commits) == 3
+        assert "USING COVERING INDEX ix_chats_user_id_timestamp (user_id=?)" in plans[0]
+        assert Chat.query.filter(Chat.user_id == user_id).count() == 0
+        assert Chat.query.filter(Chat.user_id == other_id).count() == 1
+
+
+def test_prune_chats_command(app, runner):
+    """
+    GIVEN chats from 40 days ago and from today
+    WHEN invoking 'prune-chats --days 30' with a small batch size
+    THEN only the chats older than 30 days are deleted and the message count of their thread is recomputed
+    """
+    with app.app_context():
+        db.create_all()
+        now = datetime.now(timezone.utc)
+        user_id = _user_with_chats("retention", [now - timedelta(days=40)] * 3 + [now])
+        before = Chat.query.filter(Chat.timestamp < now - timedelta(days=30)).count()
+
+    result = runner.invoke(args=["prune-chats", "--days", "30", "--batch-size", "2", "--pause", "0"])
+
+    assert result.exit_code == 0
+    assert f"Pruned {before} chats older than 30 days." in result.output
+    with app.app_context():
+        remaining = Chat.query.filter(Chat.user_id == user_id).all()
+        assert [chat.prompt for chat in remaining] == ["prompt 3"]
+        assert Conversation.latest(user_id).message_count == 1
+
+
+def test_sqlite_connections_use_production_profile(app):
+    """
+    GIVEN the default SQLITE_PRAGMAS and SQLALCHEMY_ENGINE_OPTIONS
+    WHEN the app opens a database connection
+    THEN the connection runs in WAL mode with synchronous=NORMAL, the busy timeout and cache settings,
+    from a pool sized by the engine options
+    """
+    with app.app_context():
+        pragmas = app.config["SQLITE_PRAGMAS"]
+        with db.engine.connect() as conn:
+            def pragma(name):
+                return conn.execute(text(f"PRAGMA {name}")).scalar()
+            assert pragma("journal_mode") == "wal"
+            assert pragma("synchronous") == 1  # NORMAL
+            assert pragma("busy_timeout") == pragmas["busy_timeout"]
+            assert pragma("cache_size") == pragmas["cache_size"]
+        assert db.engine.pool.size() == app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"]
+
+
+def test_backup_db_command_rotates_and_verifies(app, runner, tmp_path):
+    """
+    GIVEN a database with chats
+    WHEN backing it up three times with `flask backup-db --keep 2` and verifying the newest backup
+    THEN the two newest compressed backups are kept, the step lock times are reported and the backup
+    holds the same rows
+    """
+    with app.app_context():
+        _user_with_chats("backed-up", [datetime.now(timezone.utc)] * 3)
+        chats = Chat.query.count()
+    # An older backup of another database is never rotated away
+    (tmp_path / "other_2025-07-01.db").write_bytes(b"")
+
+    for _ in range(3):
+        result = runner.invoke(args=["backup-db", "--dir", str(tmp_path), "--keep", "2", "--pages", "1", "--pause", "0"])
+        assert result.exit_code == 0
+        assert "source locked per step p50" in result.output
+
+    backups = sorted(path.name for path in tmp_path.iterdir() if path.name.endswith(".db.gz"))
+    assert len(backups) == 2
+    assert (tmp_path / "other_2025-07-01.db").exists()
+
+    result = runner.invoke(args=["verify-backup", str(tmp_path / backups[-1])])
+    assert result.exit_code == 0
+    assert "integrity ok" in result.output
+    assert f"{chats} chats" in result.output
+
+
+def test_restore_db_command_brings_back_the_backup(app, runner, tmp_path):
+    """
+    GIVEN an uncompressed backup, then a chat saved after it
+    WHEN restoring the backup with `flask restore-db --yes`
+    THEN the live database is the backup again: the later chat is gone, the earlier ones are there
+    """
+    with app.app_context():
+        user_id = _user_with_chats("restored", [datetime.now(timezone.utc)])
+    assert runner.invoke(args=["backup-db", "--dir", str(tmp_path), "--no-compress"]).exit_code == 0
+    backup = next(tmp_path.glob("*.db"))
+    with app.app_context():
+        chat = Chat(user_id=user_id, prompt="after the backup", response="lost")
+        db.session.add(chat)
+        db.session.commit()
+
+    result = runner.invoke(args=["restore-db", str(backup), "--yes"])
+
+    assert result.exit_code == 0
+    assert "Restored" in result.output
+    with app.app_context():
+        prompts = [chat.prompt for chat in Chat.query.filter(Chat.user_id == user_id)]
+        assert prompts == ["prompt 0"]
+
+
+def test_prune_chats_keeps_threads_with_prompts_in_flight(app, runner):
+    """
+    GIVEN two users whose threads only hold chats from 40 days ago, one of them with a prompt running
+    WHEN invoking 'prune-chats --days 30'
+    THEN the idle thread and its chats are deleted, the thread with the running job is kept whole for
+    the job to answer into
+    """
+    from project.models import Job
+
+    with app.app_context():
+        db.create_all()
+        old = datetime.now(timezone.utc) - timedelta(days=40)
+        idle_id = _user_with_chats("idle-pruned", [old] * 2)
+        busy_id = _user_with_chats("busy-pruned", [old] * 2)
+        busy_thread = Conversation.latest(busy_id).id
+        job = Job(user_id=busy_id, prompt="Still answering", conversation_id=busy_thread)
+        db.session.add(job)
+        db.session.commit()
+        db.session.execute(Job.__table__.update().where(Job.__table__.c.id == job.id).values(status=Job.RUNNING))
+        db.session.commit()
+
+    result = runner.invoke(args=["prune-chats", "--days", "30", "--batch-size", "1", "--pause", "0"])
+
+    assert result.exit_code == 0
+    with app.app_context():
+        assert Chat.query.filter(Chat.user_id == idle_id).count() == 0
+        assert Conversation.latest(idle_id) is None
+        assert Chat.query.filter(Chat.user_id == busy_id).count() == 2
+        assert (Conversation.latest(busy_id).id, Conversation.latest(busy_id).message_count) == (busy_thread, 2)
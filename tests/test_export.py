@@ -0,0 +1,203 @@
+from project.models import Chat, Conversation, User # The exported and imported models
+from project.search import search # search: Imported chats must be searchable
+from project.db import db # db: SQLAlchemy database instance for ORM operations
+from flask_login import current_user # current_user: Flask-Login's proxy for the logged-in user
+import gzip # gzip: Reads and writes export files
+import json # json: Decodes the exported lines
+import pytest # pytest: Testing framework used for fixtures
+
+
+def _user(username):
+    user = User()
+    user.username = username
+    user.password = "password"
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def _chat(user_id, conversation_id, prompt, answer):
+    chat = Chat(user_id=user_id, conversation_id=conversation_id, prompt=prompt)
+    chat.set_answer(answer)
+    db.session.add(chat)
+    db.session.commit()
+    return chat.id
+
+
+@pytest.fixture(scope="module")
+def exporter(app):
+    with app.app_context():
+        owner = _user("exporter")
+        first = Conversation.start(owner, "Gardening questions").id
+        _chat(owner, first, "When do I plant tulips?", "In **autumn**, before the frost.")
+        _chat(owner, first, "And daffodils?", "Also in autumn.")
+        second = Conversation.start(owner, "Travel").id
+        _chat(owner, second, "Best month for Lisbon?", "May, warm but not crowded.")
+        return owner
+
+
+def test_export_and_import_round_trip_through_the_cli(app, runner, exporter, tmp_path):
+    """
+    GIVEN a user with two threads of chats
+    WHEN exporting them with `flask export-chats` and importing the file into another user with
+    `flask import-chats --user`
+    THEN the other user gets the same threads and chats, with their counters, searchable
+    """
+    path = tmp_path / "chats.ndjson.gz"
+    result = runner.invoke(args=["export-chats", str(path), "--user", "exporter", "--batch-size", "2"])
+    assert result.exit_code == 0
+    assert "Exported 3 chats in 2 threads" in result.output
+    assert "rows/s" in result.output
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["type"] for record in records] == ["header", "conversation", "conversation", "chat", "chat", "chat"]
+
+    with app.app_context():
+        importer = _user("importer")
+    result = runner.invoke(args=["import-chats", str(path), "--user", "importer", "--batch-size", "2"])
+    assert result.exit_code == 0
+    assert "Imported 3 chats in 2 threads" in result.output
+
+    with app.app_context():
+        threads = Conversation.for_user(importer, 10)
+        assert sorted((t.title, t.message_count, t.last_snippet) for t in threads) == [
+            ("Gardening questions", 2, "And daffodils?"),
+            ("Travel", 1, "Best month for Lisbon?"),
+        ]
+        imported = Chat.query.filter(Chat.user_id == importer).order_by(Chat.timestamp).all()
+        assert [chat.prompt for chat in imported] == ["When do I plant tulips?", "And daffodils?", "Best month for Lisbon?"]
+        assert imported[0].raw_response == "In **autumn**, before the frost."
+        assert "<strong>autumn</strong>" in imported[0].response
+
+        results, _ = search(importer, "tulips")
+        assert [result["id"] for result in results] == [imported[0].id]
+
+
+def test_download_streams_only_the_users_history(client, auth, app, exporter):
+    """
+    GIVEN a logged-in user and another user with chats
+    WHEN downloading /export
+    THEN a gzip NDJSON attachment with the logged-in user's chats only is returned
+    """
+    with client:
+        auth.login()
+        user_id = current_user.id
+        with app.app_context():
+            conversation_id = Conversation.start(user_id, "Mine").id
+            _chat(user_id, conversation_id, "Only my prompt", "Only my answer")
+
+        response = client.get("/export")
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/gzip"
+    assert "attachment" in response.headers["Content-Disposition"]
+    records = [json.loads(line) for line in gzip.decompress(response.data).decode().splitlines()]
+    assert records[0]["format"] == "aifacade-chats"
+    assert [record["prompt"] for record in records if record["type"] == "chat"] == ["Only my prompt"]
+    assert {record["user"] for record in records if record["type"] == "conversation"} == {"test"}
+
+
+def test_import_reports_the_malformed_line(app, runner, exporter, tmp_path):
+    """
+    GIVEN an export file whose chat refers to a thread missing from the file
+    WHEN importing it
+    THEN the command fails naming the line
+    """
+    path = tmp_path / "broken.ndjson.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "header", "format": "aifacade-chats", "version": 1}) + "\n")
+        f.write(json.dumps({"type": "chat", "id": 1, "conversation": 99, "timestamp": "2025-01-01T00:00:00",
+                            "prompt": "Lost", "response": "Lost"}) + "\n")
+
+    result = runner.invoke(args=["import-chats", str(path), "--user", "exporter"])
+
+    assert result.exit_code != 0
+    assert "Line 2" in result.output
+
+
+def test_failed_import_keeps_the_counters_of_the_batches_it_committed(app, runner, exporter, tmp_path):
+    """
+    GIVEN an export file with a thread of two chats followed by a malformed line
+    WHEN importing it one chat per batch
+    THEN the import fails at that line, and the thread it committed counts its two chats, dated and
+    snippeted after the newest
+    """
+    path = tmp_path / "partial.ndjson.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "header", "format": "aifacade-chats", "version": 1}) + "\n")
+        f.write(json.dumps({"type": "conversation", "id": 7, "user": "exporter", "title": "Half imported",
+                            "created_at": "2025-01-01T00:00:00"}) + "\n")
+        for minute, prompt in ((1, "First half"), (2, "Second half")):
+            f.write(json.dumps({"type": "chat", "id": minute, "conversation": 7,
+                                "timestamp": f"2025-01-01T00:0{minute}:00", "prompt": prompt,
+                                "response": "ok", "raw_response": "ok"}) + "\n")
+        f.write("{not json\n")
+
+    result = runner.invoke(args=["import-chats", str(path), "--batch-size", "1"])
+
+    assert result.exit_code != 0
+    assert "Line 5" in result.output
+    with app.app_context():
+        thread = next(t for t in Conversation.for_user(exporter, 10) if t.title == "Half imported")
+        assert (thread.message_count, thread.last_snippet) == (2, "Second half")
+        assert thread.last_activity.isoformat() == "2025-01-01T00:02:00"
+
+
+def test_import_does_not_trust_the_html_of_the_file(app, runner, exporter, tmp_path):
+    """
+    GIVEN a hand-edited export whose responses carry script tags, one with its Markdown and one without
+    WHEN importing it
+    THEN the answer is rendered again from its Markdown and the other response is stored as escaped
+    text, no script tag is stored
+    """
+    path = tmp_path / "hostile.ndjson.gz"
+    script = "<script>alert(1)</script>"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "header", "format": "aifacade-chats", "version": 1}) + "\n")
+        f.write(json.dumps({"type": "conversation", "id": 1, "user": "exporter", "title": "Hostile",
+                            "created_at": "2025-01-01T00:00:00"}) + "\n")
+        f.write(json.dumps({"type": "chat", "id": 1, "conversation": 1, "timestamp": "2025-01-01T00:01:00",
+                            "prompt": "Rendered", "response": script, "raw_response": "Plain **bold**",
+                            "render_version": "forged"}) + "\n")
+        f.write(json.dumps({"type": "chat", "id": 2, "conversation": 1, "timestamp": "2025-01-01T00:02:00",
+                            "prompt": "Escaped", "response": script + " &amp; more"}) + "\n")
+
+    result = runner.invoke(args=["import-chats", str(path)])
+
+    assert result.exit_code == 0
+    with app.app_context():
+        thread = next(t for t in Conversation.for_user(exporter, 10) if t.title == "Hostile")
+        rendered, escaped = Chat.query.filter(Chat.__table__.c.conversation_id == thread.id).order_by(Chat.timestamp).all()
+        assert "<strong>bold</strong>" in rendered.response
+        assert "script" not in rendered.response
+        assert rendered.render_version != "forged"
+        assert escaped.response == "&lt;script&gt;alert(1)&lt;/script&gt; &amp; more"
+        assert escaped.raw_response is None
+
+
+@pytest.mark.parametrize("markdown", ["<script>alert(1)</script>", "Look <img src=x onerror=alert(1)>"])
+def test_import_escapes_html_in_the_markdown(app, runner, exporter, tmp_path, markdown):
+    """
+    GIVEN a hand-edited export whose Markdown answer carries raw HTML (a script, an image with an
+    event handler)
+    WHEN importing it with the default renderer
+    THEN the answer is stored with that HTML escaped
+    """
+    path = tmp_path / "hostile_markdown.ndjson.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "header", "format": "aifacade-chats", "version": 1}) + "\n")
+        f.write(json.dumps({"type": "conversation", "id": 1, "user": "exporter", "title": "Hostile Markdown",
+                            "created_at": "2025-01-01T00:00:00"}) + "\n")
+        f.write(json.dumps({"type": "chat", "id": 1, "conversation": 1, "timestamp": "2025-01-01T00:01:00",
+                            "prompt": "Render me", "response": "<p>harmless</p>", "raw_response": markdown}) + "\n")
+
+    result = runner.invoke(args=["import-chats", str(path)])
+
+    assert result.exit_code == 0
+    with app.app_context():
+        thread = max((t for t in Conversation.for_user(exporter, 50) if t.title == "Hostile Markdown"), key=lambda t: t.id)
+        chat = Chat.query.filter(Chat.__table__.c.conversation_id == thread.id).one()
+        assert chat.raw_response == markdown
+        assert "<script" not in chat.response and "<img" not in chat.response
+        assert "&lt;" in chat.response
@@ -0,0 +1,73 @@
+from project.models import Chat # Chat: Seeds the history whose cards are cached
+from project.db import db # db: Used to save the seeded chats
+from flask_login import current_user # current_user: Gives the id of the logged-in test user
+
+
+def _seed(app, user_id, count, prefix):
+    with app.app_context():
+        for i in range(count):
+            db.session.add(Chat(user_id=user_id, prompt=f"{prefix} {i}", response=f"<p>{prefix} answer {i}</p>"))
+        db.session.commit()
+
+
+def test_home_page_stitches_cached_history_cards(app, client, auth):
+    """
+    GIVEN an authenticated user with a few chats
+    WHEN the home page is opened twice
+    THEN the page is streamed, the first view renders every card into the fragment cache and the
+    second one reuses them, with the same page content
+    """
+    auth.login()
+    with client:
+        client.get("/")
+        user_id = current_user.id
+    _seed(app, user_id, 3, "fragment prompt")
+    cache = app.extensions["fragment_cache"]
+
+    misses = cache.stats()["misses"]
+    first = client.get("/", buffered=False)
+    assert first.is_streamed
+    first.get_data()
+    first.close()
+    assert cache.stats()["misses"] > misses
+
+    hits, misses = cache.stats()["hits"], cache.stats()["misses"]
+    second = client.get("/")
+    assert cache.stats()["misses"] == misses
+    assert cache.stats()["hits"] >= hits + 3
+
+    assert first.data == second.data
+    assert b"<p>fragment prompt answer 2</p>" in second.data
+    assert b"<p class=\"card-text\">fragment prompt 0</p>" in second.data
+
+
+def test_streamed_home_page_shows_a_flash_once(client, auth):
+    """
+    GIVEN a flashed message waiting in the session
+    WHEN the streamed home page is opened twice
+    THEN the message is shown on the first view only (the flashes are popped before streaming)
+    """
+    auth.login()
+    client.post("/clear")
+
+    assert b"Chat history cleared" in client.get("/").data
+    assert b"Chat history cleared" not in client.get("/").data
+
+
+def test_prompts_are_escaped_in_cached_cards(app, client, auth):
+    """
+    GIVEN a chat whose prompt contains HTML
+    WHEN the home page renders its card
+    THEN the prompt is escaped and the answer is kept as rendered HTML
+    """
+    auth.login()
+    with client:
+        client.get("/")
+        user_id = current_user.id
+    with app.app_context():
+        db.session.add(Chat(user_id=user_id, prompt="<script>alert(1)</script>", response="<p><b>safe</b></p>"))
+        db.session.commit()
+
+    page = client.get("/").data
+    assert b"&lt;script&gt;alert(1)&lt;/script&gt;" in page
+    assert b"<p><b>safe</b></p>" in page
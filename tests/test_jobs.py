@@ -0,0 +1,125 @@
+from unittest.mock import patch, MagicMock # patch: Used to mock the upstream, MagicMock: Used to fake its responses
+from datetime import datetime, timedelta, timezone # Used to expire the lease of a running job
+from project.db import db # db: Used to inspect and alter jobs
+from project.models import Chat, Job # Chat, Job: The answers and the queued prompt model
+from project.jobs import run_job, THREAD_DELETED # run_job, THREAD_DELETED: Answers a job as a worker would, and its failure
+import pytest # pytest: Testing framework used for fixtures
+
+
+@pytest.fixture
+def queue(app, monkeypatch):
+    # The shared test app answers inline, switch it to the job queue for one test
+    monkeypatch.setitem(app.config, "CHAT_QUEUE_ENABLED", True)
+    return app
+
+
+def _answer(content):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"choices": [{"message": {"content": content}}]}
+    return response
+
+
+def test_chat_queues_prompt_and_worker_answers_it(queue, client, auth, runner):
+    """
+    GIVEN an authenticated user and the job queue enabled
+    WHEN a prompt is posted to /chat
+    THEN the request returns without calling DeepSeek and the job is reported queued
+    AND once a worker drained the queue, the job is done and carries the saved answer
+    """
+    auth.login()
+
+    with patch("project.client.requests.Session.post") as post:
+        response = client.post("/chat", data={"prompt": "Queue me"})
+        assert response.status_code == 302
+        post.assert_not_called()
+
+    home = client.get("/")
+    assert b'data-job-url="/jobs/' in home.data
+    assert b'data-stream-url="' not in home.data
+    with queue.app_context():
+        job_id = Job.query.order_by(Job.__table__.c.id.desc()).first().id
+    assert client.get(f"/jobs/{job_id}").get_json()["status"] == "queued"
+
+    with patch("project.client.requests.Session.post", return_value=_answer("**Queued answer**")) as post:
+        result = runner.invoke(args=["run-worker", "--threads", "2", "--drain"])
+    assert result.exit_code == 0
+    assert post.call_count == 1
+
+    status = client.get(f"/jobs/{job_id}").get_json()
+    assert status["status"] == "done"
+    assert status["chat"]["prompt"] == "Queue me"
+    assert "<strong>Queued answer</strong>" in status["chat"]["response"]
+    assert b"Queued answer" in client.get("/").data
+
+
+def test_job_of_a_dead_worker_is_claimed_again(queue):
+    """
+    GIVEN a running job whose worker died (its lease expired)
+    WHEN a worker looks for work
+    THEN it claims that job again, while a job with a live lease is left alone
+    """
+    with queue.app_context():
+        Job.query.delete()  # Jobs of other tests would be claimed first
+        job = Job(user_id=1, prompt="Interrupted")
+        db.session.add(job)
+        db.session.commit()
+
+        assert Job.claim_next(lease_seconds=300) == job.id
+        assert Job.claim_next(lease_seconds=300) is None  # Still leased
+
+        db.session.execute(
+            Job.__table__.update()
+            .where(Job.__table__.c.id == job.id)
+            .values(lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        )
+        db.session.commit()
+
+        assert Job.claim_next(lease_seconds=300) == job.id
+        db.session.expire_all()
+        assert db.session.get(Job, job.id).attempts == 2
+        db.session.delete(db.session.get(Job, job.id))
+        db.session.commit()
+
+
+def test_job_status_of_another_user_is_hidden(queue, client, auth):
+    """
+    GIVEN a job queued by another user
+    WHEN its status is requested
+    THEN the answer is 404
+    """
+    with queue.app_context():
+        job = Job(user_id=999, prompt="Not yours")
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+    auth.login()
+
+    assert client.get(f"/jobs/{job_id}").status_code == 404
+
+
+def test_job_running_while_its_history_is_cleared_saves_no_orphan(queue, client, auth):
+    """
+    GIVEN a queued prompt claimed by a worker (running)
+    WHEN its user clears the history, then the worker finishes the job
+    THEN the job fails with a message instead of saving a chat into the deleted thread
+    """
+    auth.register("clearer", "password")
+    with patch("project.client.requests.Session.post") as post:
+        client.post("/chat", data={"prompt": "Answer me after the clear"})
+    post.assert_not_called()
+    with queue.app_context():
+        job = Job.query.order_by(Job.__table__.c.id.desc()).first()
+        job_id, user_id = job.id, job.user_id
+        db.session.execute(Job.__table__.update().where(Job.__table__.c.id != job_id)
+                           .where(Job.__table__.c.status == Job.QUEUED).values(status=Job.FAILED))
+        db.session.commit()
+        assert Job.claim_next(lease_seconds=300) == job_id
+
+    assert client.post("/clear", follow_redirects=True).status_code == 200
+
+    with queue.app_context():
+        with patch("project.client.requests.Session.post", return_value=_answer("Too late")):
+            run_job(job_id)
+        job = db.session.get(Job, job_id)
+        assert (job.status, job.error) == (Job.FAILED, THREAD_DELETED)
+        assert Chat.query.filter(Chat.__table__.c.user_id == user_id).count() == 0
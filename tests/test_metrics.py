@@ -0,0 +1,106 @@
+from unittest.mock import patch, MagicMock # patch: Used to mock the upstream, MagicMock: Used to fake its responses
+from prometheus_client.parser import text_string_to_metric_families # Parses the /metrics exposition
+from prometheus_client import REGISTRY # REGISTRY: Reads the statement timings of this process
+from project.db import db # db: Engine the failing statements run on
+from sqlalchemy import text # text: Raw statements, one of them failing
+from sqlalchemy.exc import OperationalError # OperationalError: The failing statement's error
+import pytest # pytest: Checks the failing statement raises
+
+
+def _samples(client):
+    # Maps (sample name, sorted labels) to value from a scrape of /metrics
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    samples = {}
+    for family in text_string_to_metric_families(response.get_data(as_text=True)):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def _value(samples, name, **labels):
+    return samples.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def test_metrics_expose_request_db_upstream_and_render_timings(client, auth):
+    """
+    GIVEN an authenticated user
+    WHEN a prompt is answered by DeepSeek and /metrics is scraped
+    THEN the scrape reports the request latency of the chat route, its SQL queries, the upstream
+    latency and token counts and the Markdown render time
+    """
+    auth.login()
+    before = _samples(client)
+
+    upstream = MagicMock(status_code=200)
+    upstream.json.return_value = {
+        "choices": [{"message": {"content": "**Measured**"}}],
+        "usage": {"prompt_tokens": 7, "completion_tokens": 3},
+    }
+    with patch("project.client.requests.Session.post", return_value=upstream):
+        client.post("/chat", data={"prompt": "Measure me"})
+
+    after = _samples(client)
+
+    def delta(name, **labels):
+        return _value(after, name, **labels) - _value(before, name, **labels)
+
+    assert delta("aifacade_request_seconds_count", endpoint="chat.chat", method="POST", status="302") == 1
+    assert delta("aifacade_request_db_queries_sum", endpoint="chat.chat") >= 1
+    assert delta("aifacade_db_query_seconds_count", endpoint="chat.chat") >= 1
+    assert delta("aifacade_upstream_seconds_count", mode="complete", provider="deepseek", outcome="ok") == 1
+    assert delta("aifacade_upstream_tokens_total", kind="prompt") == 7
+    assert delta("aifacade_upstream_tokens_total", kind="completion") == 3
+    assert delta("aifacade_markdown_render_seconds_count", backend="markdown2") >= 1
+    assert delta("aifacade_cache_lookups_total", cache="completion", result="miss") >= 1
+
+
+def test_metrics_count_unmatched_urls_under_one_label(client):
+    """
+    GIVEN requests to URLs matching no route
+    WHEN /metrics is scraped
+    THEN they are counted under the "unmatched" endpoint instead of one series per path
+    """
+    client.get("/no-such-page-1")
+    client.get("/no-such-page-2")
+
+    samples = _samples(client)
+
+    assert _value(samples, "aifacade_request_seconds_count", endpoint="unmatched", method="GET", status="404") >= 2
+    assert not any("no-such-page" in str(key) for key in samples)
+
+
+def test_metrics_require_the_token_when_one_is_set(app, client, monkeypatch):
+    """
+    GIVEN METRICS_TOKEN is set
+    WHEN /metrics is scraped without the token, with a wrong one, then with the right one
+    THEN only the scrape with `Authorization: Bearer <token>` gets the metrics, the others get 401
+    """
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", "s3cret")
+
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert b"aifacade_request_seconds" in response.data
+
+
+def test_failed_statements_leave_no_timer_behind(app):
+    """
+    GIVEN a pooled connection
+    WHEN statements fail on it, then one succeeds
+    THEN nothing the failed statements started is left on the connection, and the statement that
+    succeeded is timed once
+    """
+    with app.app_context(), db.engine.connect() as conn:
+        def count():
+            return REGISTRY.get_sample_value("aifacade_db_query_seconds_count", {"endpoint": "none"}) or 0
+
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM no_such_table"))
+        before = count()
+        conn.execute(text("SELECT 1"))
+
+        assert not any(key.startswith("metrics") for key in conn.info)
+        assert count() == before + 1
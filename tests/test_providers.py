@@ -0,0 +1,162 @@
+from project.providers import ProviderRouter, StubProvider, UpstreamError, tee # The router and backends under test
+from project.utils import query_deepseek # query_deepseek: Answers through the app's router
+from unittest.mock import patch # patch: Used to make the DeepSeek backend fail
+import pytest # pytest: Testing framework used for fixtures and exception checks
+import threading # threading: Checks which thread ran an attempt
+import time # time: Measures how long a hedged call waited
+
+MESSAGES = [{"role": "user", "content": "Route me"}]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class BrokenStream(StubProvider):
+    # Sends one delta, then loses the connection
+    def stream(self, messages):
+        yield "Partial "
+        raise UpstreamError("Error: connection lost")
+
+
+def test_router_prefers_the_fastest_healthy_provider():
+    """
+    GIVEN two healthy providers whose measured p50 latencies differ
+    WHEN the router orders them
+    THEN the faster one is tried first, whatever the configured order
+    """
+    slow, fast = StubProvider(name="slow"), StubProvider(name="fast")
+    router = ProviderRouter([slow, fast])
+    for _ in range(5):
+        router._record(slow, True, 2.0)
+        router._record(fast, True, 0.2)
+
+    assert router.order() == [fast, slow]
+    assert router.stats()["fast"]["p50"] == 0.2
+
+
+def test_router_fails_over_and_demotes_a_failing_provider_until_cooldown():
+    """
+    GIVEN a failing provider listed before a working one
+    WHEN prompts are answered
+    THEN every call fails over to the working provider, the failing one is tried last once its
+    error rate is measured, and is tried first again after the cooldown
+    """
+    clock = FakeClock()
+    down, up = StubProvider(name="down", fail=True), StubProvider(name="up")
+    router = ProviderRouter([down, up], min_samples=3, error_rate=0.5, cooldown=30, clock=clock)
+
+    for _ in range(3):
+        provider, content, usage = router.complete(MESSAGES)
+        assert provider is up
+        assert content == "Echo: Route me"
+
+    assert router.stats()["down"] == {"calls": 3, "error_rate": 1.0, "p50": None, "p95": None,
+                                      "healthy": False}
+    assert router.order() == [up, down]
+
+    clock.now += 31
+    assert router.order()[0] is down
+
+
+def test_router_raises_the_last_error_when_every_provider_fails():
+    """
+    GIVEN only failing providers
+    WHEN a prompt is sent
+    THEN the error of the last provider tried is raised
+    """
+    router = ProviderRouter([StubProvider(name="a", fail=True), StubProvider(name="b", fail=True)])
+
+    with pytest.raises(UpstreamError, match="b is unavailable"):
+        router.complete(MESSAGES)
+
+
+def test_stream_fails_over_only_before_the_first_delta():
+    """
+    GIVEN a provider failing before answering and another failing mid-stream
+    WHEN streaming through the router
+    THEN the first failure falls back to the next provider, the mid-stream one is raised to the caller
+    """
+    router = ProviderRouter([StubProvider(name="down", fail=True), StubProvider(name="up")])
+    parts = []
+    assert list(tee(router.stream(MESSAGES), parts)) == ["Echo: ", "Route ", "me"]
+
+    router = ProviderRouter([BrokenStream(name="broken"), StubProvider(name="up")])
+    parts = []
+    with pytest.raises(UpstreamError, match="connection lost"):
+        for _ in tee(router.stream(MESSAGES), parts):
+            pass
+    assert parts == ["Partial "]
+
+
+def test_query_fails_over_from_deepseek_to_another_backend(app, monkeypatch):
+    """
+    GIVEN an app whose router lists DeepSeek, then the stub backend
+    WHEN DeepSeek cannot be reached
+    THEN the prompt is answered by the stub backend
+    """
+    router = ProviderRouter.from_config({**app.config, "LLM_PROVIDERS": ["deepseek", "stub"]},
+                                        app.extensions["deepseek"])
+    monkeypatch.setitem(app.extensions, "llm_router", router)
+
+    with app.app_context(), patch("project.client.requests.Session.post", side_effect=Exception("down")):
+        completion = query_deepseek("A prompt needing failover")
+
+    assert completion.ok
+    assert completion.content == "Echo: A prompt needing failover"
+    assert router.stats()["deepseek"]["error_rate"] == 1.0
+
+
+def test_slow_completion_is_hedged_on_the_next_backend():
+    """
+    GIVEN a router with hedging whose first backend answers fast usually (measured p95 0.05 s)
+    but now takes 2 seconds
+    WHEN a prompt is sent
+    THEN a second attempt goes to the next backend after the hedge delay and its answer is returned
+    without waiting for the slow one
+    """
+    slow, fast = StubProvider(name="slow", latency=2.0), StubProvider(name="fast", model="fast")
+    router = ProviderRouter([slow, fast], hedge=True, hedge_min_delay=0.1)
+    for _ in range(10):
+        router._record(slow, True, 0.05)
+        router._record(fast, True, 0.5)
+
+    start = time.perf_counter()
+    provider, content, usage = router.complete(MESSAGES)
+
+    assert provider is fast
+    assert content == "Echo: Route me"
+    assert time.perf_counter() - start < 1.5
+
+
+def test_hedging_never_queues_attempts_on_a_busy_pool():
+    """
+    GIVEN a hedging router whose pool has a single thread and a slow first backend
+    WHEN one prompt is sent, then another while the pool's thread is busy
+    THEN the first waits for its slow attempt without sending a second one (the pool has no idle
+    thread for it), and the second runs unhedged on the request thread instead of queueing
+    """
+    slow, fast = StubProvider(name="slow", latency=0.5), StubProvider(name="fast", model="fast")
+    router = ProviderRouter([slow, fast], hedge=True, hedge_min_delay=0.1, hedge_workers=1)
+    for _ in range(10):
+        router._record(slow, True, 0.05)
+        router._record(fast, True, 0.5)
+
+    answers = []
+    first = threading.Thread(target=lambda: answers.append(router.complete(MESSAGES)))
+    first.start()
+    time.sleep(0.05)
+    threads = []
+    inline = StubProvider(name="slow")
+    inline.complete = lambda messages: (threads.append(threading.current_thread()), ("Inline", None))[1]
+    router.providers[0] = inline
+    provider, content, usage = router.complete(MESSAGES)
+    first.join()
+
+    assert (provider, content) == (inline, "Inline")
+    assert threads == [threading.current_thread()]
+    assert answers[0][0] is slow
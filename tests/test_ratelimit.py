@@ -0,0 +1,57 @@
+from project import create_app # create_app: Builds an app with rate limiting enabled
+from project.db import db # db: Used to create the tables of the rate-limited app
+from project.ratelimit import SQLiteStorage # SQLiteStorage: The shared rate-limit storage
+from limits import parse # parse: Builds a rate limit item from a limit string
+from limits.strategies import FixedWindowRateLimiter # FixedWindowRateLimiter: Flask-Limiter's default strategy
+
+
+def test_sqlite_storage_shares_counters(tmp_path):
+    """
+    GIVEN two SQLite rate-limit storages on the same file, as two gunicorn workers would open
+    WHEN hits are spread over both storages
+    THEN both count against the same limit
+    """
+    uri = f"sqlite:///{tmp_path / 'ratelimit.db'}"
+    workers = [FixedWindowRateLimiter(SQLiteStorage(uri)), FixedWindowRateLimiter(SQLiteStorage(uri))]
+    limit = parse("3 per minute")
+
+    assert workers[0].hit(limit, "client")
+    assert workers[1].hit(limit, "client")
+    assert workers[0].hit(limit, "client")
+    assert not workers[1].hit(limit, "client")
+    assert workers[1].hit(limit, "other-client")
+
+    workers[0].clear(limit, "client")
+    assert workers[1].hit(limit, "client")
+
+
+def test_login_attempts_are_rate_limited(tmp_path):
+    """
+    GIVEN an app with rate limiting enabled and LOGIN_RATELIMIT of 2 per minute
+    WHEN a client keeps posting wrong passwords to /login
+    THEN the third attempt is rejected with 429
+    AND the rejection is counted in the metrics
+    """
+    app = create_app({'TESTING': True,
+                      'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+                      'WTF_CSRF_ENABLED': False,
+                      # Explicit, the shared limiter keeps the last app's setting as its default
+                      'RATELIMIT_ENABLED': True,
+                      'RATELIMIT_STORAGE_URI': f"sqlite:///{tmp_path / 'ratelimit.db'}",
+                      'LOGIN_RATELIMIT': '2 per minute'})
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    statuses = [client.post('/login', data={'username': 'victim', 'password': 'guess'}).status_code
+                for _ in range(3)]
+
+    assert statuses == [200, 200, 429]
+    # Viewing the form is not an attempt
+    assert client.get('/login').status_code == 200
+    assert b'aifacade_ratelimit_rejections_total{endpoint="auth.login"}' in client.get('/metrics').data
+
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
@@ -0,0 +1,57 @@
+from project.models import Chat # Chat: The chat model storing raw and rendered answers
+from project.rendering import render_markdown, renderer_version, RENDER_REVISION # The Markdown rendering helpers
+import pytest # pytest: Testing framework used for fixtures and test discovery
+
+
+@pytest.mark.parametrize("backend", ["markdown2", "markdown-it"])
+def test_backends_render_markdown(backend):
+    """
+    GIVEN each supported Markdown backend
+    WHEN rendering Markdown
+    THEN HTML is produced and the version stamp names the backend and the local revision
+    """
+    html = render_markdown("Some **bold** text", backend)
+    assert "<strong>bold</strong>" in html
+    assert renderer_version(backend).startswith(f"{backend}-")
+    assert renderer_version(backend).endswith(f"-r{RENDER_REVISION}")
+
+
+@pytest.mark.parametrize("backend", ["markdown2", "markdown-it"])
+def test_backends_escape_raw_html(backend):
+    """
+    GIVEN each supported Markdown backend
+    WHEN rendering Markdown carrying raw HTML (a script, an image with an event handler)
+    THEN the HTML is escaped, no tag of it reaches the output
+    """
+    html = render_markdown("<script>alert(1)</script>\n\n<img src=x onerror=alert(1)>", backend)
+    assert "<script" not in html
+    assert "<img" not in html
+    assert "&lt;script&gt;" in html
+
+
+def test_unknown_backend_is_rejected():
+    """
+    GIVEN a backend name that is not registered
+    WHEN rendering with it
+    THEN a ValueError is raised
+    """
+    with pytest.raises(ValueError, match="Unknown Markdown renderer"):
+        render_markdown("text", "pandoc")
+
+
+def test_chat_keeps_raw_markdown_and_rendered_html():
+    """
+    GIVEN a chat
+    WHEN its answer is set and later re-rendered with another backend
+    THEN the raw Markdown is kept and the HTML and version stamp follow the backend used
+    """
+    chat = Chat(prompt="Hi")
+    chat.set_answer("# Title", backend="markdown2")
+
+    assert chat.raw_response == "# Title"
+    assert "<h1>Title</h1>" in chat.response
+    assert chat.render_version == renderer_version("markdown2")
+
+    chat.rerender(backend="markdown-it")
+    assert chat.raw_response == "# Title"
+    assert chat.render_version == renderer_version("markdown-it")
@@ -0,0 +1,106 @@
+from project.models import Chat, Conversation, User # The models whose chats are indexed
+from project.search import search # search: The ranked per-user query
+from project.db import db # db: SQLAlchemy database instance for ORM operations
+from sqlalchemy import text # text: Used to inspect and wipe the FTS5 table
+from flask_login import current_user # current_user: Flask-Login's proxy for the logged-in user
+import pytest # pytest: Testing framework used for fixtures
+
+
+def _user(username):
+    user = User()
+    user.username = username
+    user.password = "password"
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def _chat(user_id, prompt, answer):
+    chat = Chat(user_id=user_id, prompt=prompt)
+    chat.set_answer(answer)
+    db.session.add(chat)
+    db.session.commit()
+    return chat.id
+
+
+@pytest.fixture(scope="module")
+def searchers(app):
+    with app.app_context():
+        owner, other = _user("searcher"), _user("other-searcher")
+        _chat(owner, "How do I bake sourdough bread?", "Feed the starter, then bake the <b>bread</b> hot.")
+        _chat(owner, "Tell me about rivers", "The Danube flows through ten countries; bread is not involved.")
+        _chat(other, "My sourdough secret", "Only this user may find this sourdough answer.")
+        return owner, other
+
+
+def test_search_ranks_highlights_and_scopes_to_the_user(app, searchers):
+    """
+    GIVEN two users whose chats mention the same words
+    WHEN one of them searches
+    THEN only their chats are returned, the prompt match first, with the words highlighted and the text escaped
+    """
+    owner, other = searchers
+    with app.app_context():
+        results, has_more = search(owner, "bread")
+        assert [str(result["prompt"]) for result in results] == [
+            "How do I bake sourdough <mark>bread</mark>?", "Tell me about rivers"]
+        assert not has_more
+        assert "&lt;b&gt;<mark>bread</mark>&lt;/b&gt;" in str(results[0]["answer"])
+        assert results[0]["conversation_id"] == Conversation.latest(owner).id
+
+        assert [result["prompt"] for result in search(other, "sourdough")[0]] == ["My <mark>sourdough</mark> secret"]
+        # Operators and quotes are plain words, a search with no word finds nothing
+        assert search(owner, 'bread" OR owner:u2 NEAR(')[0] == []
+        assert search(owner, "  ?!  ") == ([], False)
+
+
+def test_search_page_paginates_and_follows_deletes(app, client, auth):
+    """
+    GIVEN a logged-in user with more matching chats than fit on a page
+    WHEN browsing the result pages, then clearing the history
+    THEN the pages split the results with a link to the next one, and nothing is found after clearing
+    """
+    auth.login()
+    with client:
+        client.get("/")
+        user_id = current_user.id
+    with app.app_context():
+        for i in range(3):
+            _chat(user_id, f"Question {i} about kayaks", "Paddle <script>alert(1)</script>")
+
+    app.config["SEARCH_PAGE_SIZE"] = 2
+    try:
+        first = client.get("/search", query_string={"q": "kayaks"})
+        assert first.data.count(b"<mark>kayaks</mark>") == 2
+        assert b"page=2" in first.data and b"&lt;script&gt;" in first.data
+        second = client.get("/search", query_string={"q": "kayaks", "page": 2})
+        assert second.data.count(b"<mark>kayaks</mark>") == 1
+    finally:
+        app.config["SEARCH_PAGE_SIZE"] = 20
+
+    client.post("/clear")
+    assert b"No chat matches" in client.get("/search", query_string={"q": "kayaks"}).data
+
+
+def test_rebuild_search_index_command(app, runner, searchers):
+    """
+    GIVEN an index that lost its entries and holds one of a deleted chat
+    WHEN invoking 'rebuild-search-index' with a small batch size
+    THEN every chat is indexed again exactly once and the stale entry is gone
+    """
+    owner, _ = searchers
+    with app.app_context():
+        chats = Chat.query.count()
+        db.session.execute(text("DELETE FROM chats_fts"))
+        db.session.execute(text("INSERT INTO chats_fts (rowid, prompt, answer, owner) "
+                                "VALUES (999999, 'ghost bread', '', :owner)"), {"owner": f"u{owner}"})
+        db.session.commit()
+        assert search(owner, "sourdough")[0] == []
+
+    result = runner.invoke(args=["rebuild-search-index", "--batch-size", "2"])
+
+    assert result.exit_code == 0
+    assert f"Indexed {chats} chats for search." in result.output
+    with app.app_context():
+        assert db.session.execute(text("SELECT count(*) FROM chats_fts")).scalar() == chats
+        assert len(search(owner, "bread")[0]) == 2
@@ -0,0 +1,136 @@
+from project.models import Chat, Job, UsageDaily, User # Chat, Job, UsageDaily, User: The chats, jobs and daily totals
+from project.providers import ProviderRouter, StubProvider # The stub backend reports token usage
+from project.jobs import enqueue, run_job # enqueue, run_job: Queue a prompt and answer it as a worker would
+from project.usage import today, QUOTA_MESSAGE # today: The UTC day of the quota, QUOTA_MESSAGE: The refusal
+from project.db import db # db: SQLAlchemy database instance for ORM operations
+from unittest.mock import patch # patch: Checks the upstream is not called over quota
+from datetime import datetime, time, timedelta # Dates a queued prompt before midnight
+import json # json: Decodes the streamed events
+import pytest # pytest: Testing framework used for fixtures
+
+
+@pytest.fixture
+def stub_router(app, monkeypatch):
+    router = ProviderRouter([StubProvider()])
+    monkeypatch.setitem(app.extensions, "llm_router", router)
+    return router
+
+
+def _usage(app, username):
+    with app.app_context():
+        user_id = User.query.filter(User.__table__.c.username == username).first().id
+        return user_id, db.session.get(UsageDaily, (user_id, today()))
+
+
+def test_answers_store_their_tokens_and_add_to_the_daily_total(app, client, auth, stub_router):
+    """
+    GIVEN a backend reporting the tokens of its answers
+    WHEN a prompt is answered inline, then another one streamed
+    THEN each Chat keeps its prompt and completion tokens, and the user's row of today in
+    `usage_daily` holds two requests and the sum of their tokens
+    """
+    auth.register("counted", "password")
+    client.post("/chat", data={"prompt": "Count my tokens"})
+    response = client.post("/chat/stream", data={"prompt": "Count these tokens too"})
+    assert b"event: done" in response.data
+
+    user_id, usage = _usage(app, "counted")
+    with app.app_context():
+        chats = Chat.query.filter(Chat.__table__.c.user_id == user_id).order_by(Chat.__table__.c.id).all()
+        assert [chat.prompt_tokens > 0 and chat.completion_tokens > 0 for chat in chats] == [True, True]
+        assert usage.requests == 2
+        assert usage.prompt_tokens == sum(chat.prompt_tokens for chat in chats)
+        assert usage.completion_tokens == sum(chat.completion_tokens for chat in chats)
+
+    page = client.get("/usage")
+    assert page.status_code == 200
+    assert f"<strong>{usage.total_tokens}</strong> tokens".encode() in page.data
+
+
+def test_quota_refuses_prompts_before_the_upstream_call(app, client, auth, stub_router, monkeypatch):
+    """
+    GIVEN a user whose answers today used more tokens than TOKEN_QUOTA_DAILY
+    WHEN they send another prompt, inline or streamed
+    THEN it is refused with the quota message (429 for the stream) and the backend is not called
+    """
+    auth.register("thrifty", "password")
+    client.post("/chat", data={"prompt": "Use up my quota please"})
+    user_id, usage = _usage(app, "thrifty")
+    monkeypatch.setitem(app.config, "TOKEN_QUOTA_DAILY", usage.total_tokens)
+
+    with patch.object(StubProvider, "_answer") as answer:
+        response = client.post("/chat", data={"prompt": "One more?"}, follow_redirects=True)
+        assert QUOTA_MESSAGE.encode() in response.data
+        response = client.post("/chat/stream", data={"prompt": "One more?"})
+        assert response.status_code == 429
+        assert json.loads(response.data) == {"errors": [QUOTA_MESSAGE]}
+    answer.assert_not_called()
+
+    _, after = _usage(app, "thrifty")
+    assert after.requests == 1
+    page = client.get("/usage")
+    assert f"of your daily quota of {usage.total_tokens}".encode() in page.data
+
+
+def test_queued_prompt_over_quota_fails_without_calling_upstream(app, auth, stub_router, monkeypatch):
+    """
+    GIVEN a queued prompt of a user who has used their quota since it was queued
+    WHEN a worker runs it
+    THEN the job fails for good with the quota message and no chat is saved
+    """
+    auth.register("queued", "password")
+    with app.app_context():
+        user_id = User.query.filter(User.__table__.c.username == "queued").first().id
+        job_id = enqueue(user_id, "Answer me later").id
+        UsageDaily.add(db.session.connection(), user_id, today(), 100, 50)
+        db.session.commit()
+        monkeypatch.setitem(app.config, "TOKEN_QUOTA_DAILY", 150)
+
+        with patch.object(StubProvider, "_answer") as answer:
+            run_job(job_id)
+        answer.assert_not_called()
+
+        job = db.session.get(Job, job_id)
+        assert job.status == "failed"
+        assert job.error == QUOTA_MESSAGE
+        assert Chat.query.filter(Chat.__table__.c.user_id == user_id).count() == 0
+
+
+def test_anonymous_prompts_are_turned_away_before_the_quota(app, client, monkeypatch):
+    """
+    GIVEN a daily token quota and an unauthenticated visitor
+    WHEN they post a prompt, inline or streamed
+    THEN /chat redirects to the login page and /chat/stream answers 401, without reading the quota
+    """
+    monkeypatch.setitem(app.config, "TOKEN_QUOTA_DAILY", 1000)
+
+    with patch("project.chat.quota_exceeded") as quota:
+        response = client.post("/chat", data={"prompt": "Anyone there?"})
+        assert response.status_code == 302
+        assert response.headers["Location"] == "/login"
+        assert client.post("/chat/stream", data={"prompt": "Anyone there?"}).status_code == 401
+    quota.assert_not_called()
+
+
+def test_queued_prompt_counts_on_the_day_it_is_answered(app, auth, stub_router):
+    """
+    GIVEN a prompt queued yesterday (just before midnight) and answered by a worker today
+    WHEN the worker saves its answer
+    THEN the chat keeps its submission date, and its tokens count on today's row, the day the quota
+    checks, not on yesterday's
+    """
+    auth.register("night-owl", "password")
+    with app.app_context():
+        user_id = User.query.filter(User.__table__.c.username == "night-owl").first().id
+        job_id = enqueue(user_id, "Answer me after midnight").id
+        yesterday = today() - timedelta(days=1)
+        db.session.execute(Job.__table__.update().where(Job.__table__.c.id == job_id)
+                           .values(created_at=datetime.combine(yesterday, time(23, 59))))
+        db.session.commit()
+
+        run_job(job_id)
+
+        chat = Chat.query.filter(Chat.__table__.c.user_id == user_id).one()
+        assert chat.timestamp.date() == yesterday
+        assert db.session.get(UsageDaily, (user_id, yesterday)) is None
+        assert UsageDaily.tokens_on(user_id, today()) == chat.prompt_tokens + chat.completion_tokens > 0